@@ -0,0 +1,263 @@
+# alerts.py
+import os
+import json
+import threading
+from collections import deque
+import numpy as np  # type: ignore
+import streamlit as st  # type: ignore
+from vitals_store import METRICS, to_datetime64
+from dataset import get_dataset
+from live_feed import get_live_feed
+
+
+# --- Rule configuration ---
+# kind: threshold  -> latest `metric` `op` `value`
+#       sustained  -> the last `readings` readings all satisfy `metric` `op` `value`
+#       rate       -> change of `metric` per hour between the last two readings `op` `value`
+#       bp         -> latest bp_sys >= `sys` or bp_dia >= `dia`
+DEFAULT_RULES = [
+    {"name": "High Heart Rate", "kind": "threshold", "metric": "hr", "op": ">", "value": 100,
+     "severity": "critical", "icon": "🚨"},
+    {"name": "High Temperature", "kind": "threshold", "metric": "temp", "op": ">", "value": 38.0,
+     "severity": "critical", "icon": "🔥"},
+    {"name": "Low Heart Rate", "kind": "threshold", "metric": "hr", "op": "<", "value": 50,
+     "severity": "warning", "icon": "💙"},
+    {"name": "Sustained Tachycardia", "kind": "sustained", "metric": "hr", "op": ">", "value": 100,
+     "readings": 3, "severity": "critical", "icon": "🚨"},
+    {"name": "Rapid Temperature Rise", "kind": "rate", "metric": "temp", "op": ">", "value": 0.5,
+     "severity": "warning", "icon": "📈"},
+    {"name": "Hypertensive Crisis", "kind": "bp", "sys": 180, "dia": 120,
+     "severity": "critical", "icon": "🩸"},
+    {"name": "Hypertension", "kind": "bp", "sys": 140, "dia": 90,
+     "severity": "warning", "icon": "🩺"},
+]
+
+OPS = {">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal}
+
+
+def load_rules():
+    """Rules from the JSON file named by HEALTH_ALERT_RULES, else the defaults."""
+    path = os.environ.get("HEALTH_ALERT_RULES")
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+# --------------------------
+# VECTORIZED RULE EVALUATION
+# --------------------------
+def evaluate_rule(rule, time, cols, starts, ends):
+    """
+    Evaluates one rule for every block [starts[i], ends[i]) of time-sorted rows.
+    Returns (firing, value): a bool per block and the value that was tested.
+    """
+    n = ends - starts
+    last = np.maximum(ends - 1, 0)
+    kind = rule["kind"]
+
+    if kind == "threshold":
+        value = cols[rule["metric"]][last].astype(np.float64) if len(time) else np.zeros(len(n))
+        firing = (n > 0) & OPS[rule["op"]](value, rule["value"])
+
+    elif kind == "sustained":
+        k = rule["readings"]
+        hit = OPS[rule["op"]](cols[rule["metric"]], rule["value"]).astype(np.int64)
+        cs = np.concatenate(([0], np.cumsum(hit)))
+        count = cs[ends] - cs[np.maximum(starts, ends - k)]
+        firing = (n >= k) & (count == k)
+        value = count.astype(np.float64)
+
+    elif kind == "rate":
+        prev = np.maximum(ends - 2, 0)
+        y = cols[rule["metric"]].astype(np.float64)
+        t = time.astype("datetime64[s]").astype(np.int64)
+        if len(time):
+            hours = (t[last] - t[prev]) / 3600.0
+            with np.errstate(divide="ignore", invalid="ignore"):
+                value = np.where(hours > 0, (y[last] - y[prev]) / hours, 0.0)
+        else:
+            value = np.zeros(len(n))
+        firing = (n >= 2) & OPS[rule["op"]](value, rule["value"])
+
+    elif kind == "bp":
+        if len(time):
+            sys_, dia = cols["bp_sys"][last], cols["bp_dia"][last]
+        else:
+            sys_ = dia = np.zeros(len(n))
+        firing = (n > 0) & ((sys_ >= rule["sys"]) | (dia >= rule["dia"]))
+        value = np.asarray(sys_, dtype=np.float64)
+
+    else:
+        raise ValueError(f"Unknown rule kind: {kind}")
+    return firing, value
+
+
+def _message(rule, value):
+    kind = rule["kind"]
+    if kind == "sustained":
+        return f"{rule['metric']} {rule['op']} {rule['value']} for {rule['readings']} readings"
+    if kind == "rate":
+        return f"{rule['metric']} changing {value:+.2f}/h"
+    if kind == "bp":
+        return f"BP at or above {rule['sys']}/{rule['dia']}"
+    return f"{rule['metric']} = {value:g}"
+
+
+# --------------------------
+# ALERT ENGINE
+# --------------------------
+class AlertEngine:
+    """
+    Fleet-wide alert state.
+
+    `backfill(store)` evaluates every rule over all patients in one vectorized
+    pass; `observe(pid, reading)` re-evaluates only that patient from a short
+    per-patient window of recent readings, and `refresh`, a store listener,
+    re-evaluates the patients each store write touched (imports, readings
+    synced from other processes). Firing alerts live in an index keyed
+    by (patient_id, rule), so queries cost O(alerts), independent of how many
+    patients or readings there are.
+    """
+
+    def __init__(self, rules=None):
+        self.rules = rules or load_rules()
+        self.window = max([r.get("readings", 2) for r in self.rules] + [2])
+        self.store = None                    # in-memory store of the last backfill; seeds `_recent`
+        self.alerts = {}                     # (pid, rule name) -> alert dict
+        self._by_patient = {}                # pid -> set of rule names
+        self._recent = {}                    # pid -> deque of (epoch, hr, bp_sys, bp_dia, temp)
+        self._lock = threading.Lock()
+        self.version = 0
+
+    # --- Index maintenance ---
+    def _apply(self, pids, rule, firing, value, times):
+        key_rule = rule["name"]
+        for i in np.flatnonzero(firing):
+            pid = pids[i]
+            self.alerts[(pid, key_rule)] = {
+                "patient_id": pid,
+                "rule": key_rule,
+                "severity": rule["severity"],
+                "icon": rule.get("icon", "⚠️"),
+                "message": _message(rule, float(value[i])),
+                "time": times[i],
+            }
+            self._by_patient.setdefault(pid, set()).add(key_rule)
+        for i in np.flatnonzero(~firing):
+            pid = pids[i]
+            if self.alerts.pop((pid, key_rule), None) is not None:
+                self._by_patient[pid].discard(key_rule)
+
+    def backfill(self, store):
+        """Recomputes every rule for every patient in the store."""
+        self.store = store
+        store = store.snapshot()
+        starts, ends = store.starts, store.ends
+        last = np.maximum(ends - 1, 0)
+        times = store.time[last].tolist() if len(store) else [None] * len(starts)
+        with self._lock:
+            self.alerts.clear()
+            self._by_patient.clear()
+            self._recent.clear()
+            for rule in self.rules:
+                firing, value = evaluate_rule(rule, store.time, store.cols, starts, ends)
+                self._apply(store.ids, rule, firing, value, times)
+            self.version += 1
+
+    def observe(self, pid, reading):
+        """Updates one patient's alerts after a new reading arrives."""
+        epoch = int(to_datetime64([reading["time"]]).astype(np.int64)[0])
+        with self._lock:
+            recent = self._recent.get(pid)
+            if recent is None:
+                recent = self._recent[pid] = deque(maxlen=self.window)
+                if self.store is not None and pid in self.store:
+                    # seeded from memory: the feed thread never waits on the database
+                    seed = self.store.latest(pid, self.window)
+                    for row in zip(seed["time"].astype(np.int64).tolist(), *(seed[m].tolist() for m in METRICS)):
+                        recent.append(row)
+            for row in [r for r in recent if r[0] == epoch]:
+                recent.remove(row)           # a re-sent reading replaces the stored one
+            recent.append((epoch,) + tuple(reading[m] for m in METRICS))
+            self._evaluate_recent(pid, recent)
+            self.version += 1
+
+    def _evaluate_recent(self, pid, recent):
+        rows = sorted(recent)
+        time = np.array([r[0] for r in rows], dtype=np.int64).astype("datetime64[s]")
+        cols = {m: np.array([r[j + 1] for r in rows]) for j, m in enumerate(METRICS)}
+        starts, ends = np.array([0]), np.array([len(rows)])
+        for rule in self.rules:
+            firing, value = evaluate_rule(rule, time, cols, starts, ends)
+            self._apply([pid], rule, firing, value, [time[-1].item()])
+
+    def refresh(self, block, values, reset):
+        """
+        Store listener: re-evaluates the patients (store blocks) a write touched,
+        from the last `window` rows of each. A live-monitored patient's recent
+        window takes the stored rows, keeping newer live readings not stored yet.
+        """
+        if self.store is None:
+            return
+        view = self.store.snapshot()
+        blocks = np.union1d(block, np.fromiter(reset, dtype=np.int64, count=len(reset)))
+        ends = view.ends[blocks]
+        starts = np.maximum(view.starts[blocks], ends - self.window)
+        n = ends - starts
+        offsets = np.cumsum(n) - n
+        rows = np.repeat(starts - offsets, n) + np.arange(int(n.sum()), dtype=np.int64)
+        time, cols = view.time[rows], {m: view.cols[m][rows] for m in METRICS}
+        pids = [view.ids[b] for b in blocks.tolist()]
+        last = np.maximum(offsets + n - 1, 0)
+        times = time[last].tolist() if len(rows) else [None] * len(pids)
+        with self._lock:
+            for rule in self.rules:
+                firing, value = evaluate_rule(rule, time, cols, offsets, offsets + n)
+                self._apply(pids, rule, firing, value, times)
+            epochs = time.astype(np.int64).tolist()
+            for i, pid in enumerate(pids):
+                recent = self._recent.get(pid)
+                if recent is None:
+                    continue
+                merged = {r[0]: r for r in recent}
+                for j in range(int(offsets[i]), int(offsets[i] + n[i])):
+                    merged[epochs[j]] = (epochs[j],) + tuple(cols[m][j].item() for m in METRICS)
+                recent.clear()
+                recent.extend(sorted(merged.values())[-self.window:])
+                self._evaluate_recent(pid, recent)
+            self.version += 1
+
+    # --- Queries ---
+    def active(self, severity=None):
+        """All firing alerts, critical first."""
+        with self._lock:
+            alerts = list(self.alerts.values())
+        if severity is not None:
+            alerts = [a for a in alerts if a["severity"] == severity]
+        return sorted(alerts, key=lambda a: (a["severity"] != "critical", a["patient_id"], a["rule"]))
+
+    def for_patient(self, pid):
+        with self._lock:
+            return [self.alerts[(pid, name)] for name in sorted(self._by_patient.get(pid, ()))]
+
+    def counts(self):
+        with self._lock:
+            out = {}
+            for a in self.alerts.values():
+                out[a["severity"]] = out.get(a["severity"], 0) + 1
+            return out
+
+
+@st.cache_resource
+def get_alert_engine():
+    """
+    One engine per process: backfilled from the shared dataset's store, then fed
+    incrementally by the store's writes and the live feed.
+    """
+    engine = AlertEngine()
+    store = get_dataset().vitals_store
+    engine.backfill(store)
+    store.subscribe(engine.refresh)
+    get_live_feed().subscribe(lambda r: engine.observe(r["patient_id"], r))
+    return engine
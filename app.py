@@ -1,11 +1,10 @@
+import importlib
 import streamlit as st  # type: ignore
 
-from sample_data import generate_sample_patients, is_authenticated
-from auth import auth_entry_page, login_page, signup_page
-from dashboard import dashboard
-from medication_tracker import medication_page
-from schedtracker import schedule_tracker_page
-from user_info import user_info_page
+from sample_data import is_authenticated, go_to, write_session_cookie
+from startup import get_startup_report
+from assets import stylesheet
+from profiler import span, get_profiler, debug_panel
 
 
 # --------------------------
@@ -19,39 +18,70 @@ st.set_page_config(
 
 
 # --------------------------
-# LOAD CSS (SEPARATED)
+# LOAD CSS (CACHED PER PROCESS, FONTS INLINED)
 # --------------------------
-def load_css(file_name: str):
-    with open(file_name) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
-
-load_css("styles.css")
+st.markdown(stylesheet("styles.css"), unsafe_allow_html=True)
 
 
 # --------------------------
 # SESSION STATE INIT
 # --------------------------
 def init_session_state():
-    defaults = {
-        "page": "auth",
-        "users": {},
-        "current_user": None,
-        "patients": generate_sample_patients(25)
-    }
-
-    for key, value in defaults.items():
-        if key not in st.session_state:
-            st.session_state[key] = value
+    st.session_state.setdefault("session_token", None)
+    st.session_state.setdefault("current_user", None)
+    if "page" not in st.session_state:
+        # a new browser session carrying a valid session cookie (reconnect,
+        # another worker process) resumes on the dashboard
+        st.session_state.page = "dashboard" if is_authenticated() else "auth"
 
 init_session_state()
+write_session_cookie()
+
+
+def init_data():
+    """Attaches this session to the shared dataset on the first protected page that needs it."""
+    from dataset import get_dataset, session_overlay
+
+    with get_startup_report().timed("data", "dataset"):
+        get_dataset()
+    session_overlay()
 
 
 # --------------------------
-# SAFE NAVIGATION
+# PAGE REGISTRY (LAZY)
 # --------------------------
-def go_to_page(page_name: str):
-    st.session_state.page = page_name
-    st.rerun()
+# page -> (module, function, needs the patient dataset); modules are imported on first use,
+# so the auth pages never pull in pandas/Altair or the page modules behind login
+PUBLIC_PAGES = {
+    "auth": ("auth", "auth_entry_page", False),
+    "login": ("auth", "login_page", False),
+    "signup": ("auth", "signup_page", False)
+}
+
+PROTECTED_PAGES = {
+    "dashboard": ("dashboard", "dashboard", True),
+    "medication": ("medication_tracker", "medication_page", True),
+    "schedule": ("schedtracker", "schedule_tracker_page", True),
+    "user_info": ("user_info", "user_info_page", False)
+}
+
+
+def resolve_page(entry):
+    """Imports the page's module (timed, once per process) and returns its function."""
+    module, function, _ = entry
+    with get_startup_report().timed("imports", module):
+        return getattr(importlib.import_module(module), function)
+
+
+def render_page(name, entry):
+    page_fn = resolve_page(entry)
+    get_profiler().count_rerun(name)
+    with span(name):
+        if entry[2]:
+            with span("init_data"):
+                init_data()
+        with get_startup_report().timed("renders", name):
+            page_fn()
 
 
 # --------------------------
@@ -61,32 +91,20 @@ def run_app():
     page = st.session_state.page
 
     # ----- PUBLIC PAGES -----
-    public_pages = {
-        "auth": auth_entry_page,
-        "login": login_page,
-        "signup": signup_page
-    }
-
-    if page in public_pages:
-        public_pages[page]()
+    if page in PUBLIC_PAGES:
+        render_page(page, PUBLIC_PAGES[page])
         return
 
-    # ----- AUTH CHECK -----
+    # ----- AUTH CHECK (SIGNED TOKEN, VALIDATED AGAINST THE SESSION STORE) -----
     if not is_authenticated():
         st.warning("You must log in to access that page.")
-        if st.button("Go to Login"):
-            go_to_page("login")
+        st.button("Go to Login", on_click=go_to, args=("login",))
         return
 
     # ----- PROTECTED PAGES -----
-    protected_pages = {
-        "dashboard": dashboard,
-        "medication": medication_page,
-        "schedule": schedule_tracker_page,
-        "user_info": user_info_page
-    }
-
-    protected_pages.get(page, dashboard)()
+    name = page if page in PROTECTED_PAGES else "dashboard"
+    render_page(name, PROTECTED_PAGES[name])
+    debug_panel()
 
 
 # --------------------------
@@ -0,0 +1,129 @@
+# assets.py
+"""
+Static assets, loaded once per server process.
+
+- `stylesheet()` returns styles.css as a <style> block with the Inter font
+  inlined from assets/fonts/ (Inter-Regular / -SemiBold / -Bold Latin
+  subsets, .woff2 or .ttf; OFL, see assets/fonts/OFL.txt), so pages never
+  fetch fonts from the network. Missing font files fall back to the system
+  font stack in the stylesheet.
+- `get_avatars()` serves square, pre-resized avatar thumbnails. They are keyed
+  by the image's content hash and kept in a bounded in-memory LRU.
+"""
+import os
+import io
+import base64
+import hashlib
+import streamlit as st  # type: ignore
+from result_cache import ResultCache
+
+
+# --- Asset settings ---
+ASSET_DIR = "assets"
+FONT_DIR = os.path.join(ASSET_DIR, "fonts")
+FONT_FAMILY = "Inter"
+FONT_FILES = {400: "Inter-Regular", 600: "Inter-SemiBold", 700: "Inter-Bold"}
+FONT_FORMATS = (("woff2", "woff2", "font/woff2"), ("ttf", "truetype", "font/ttf"))
+
+DEFAULT_AVATAR = os.path.join(ASSET_DIR, "js.jpg")
+AVATAR_SIZE = 300                    # thumbnail edge shown on the profile page (px)
+AVATAR_STORED_SIZE = 600             # uploads are normalized to this edge before storing
+MAX_AVATAR_UPLOAD = 5 * 1024 * 1024
+AVATAR_CACHE_ENTRIES = 256
+AVATAR_CACHE_BYTES = 16 * 1024 * 1024
+
+
+# --------------------------
+# CSS & FONTS
+# --------------------------
+def font_faces(font_dir=FONT_DIR):
+    """@font-face rules with every available Inter weight embedded as a data URI."""
+    rules = []
+    for weight, stem in FONT_FILES.items():
+        for ext, fmt, mime in FONT_FORMATS:
+            path = os.path.join(font_dir, f"{stem}.{ext}")
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                data = base64.b64encode(f.read()).decode("ascii")
+            rules.append(
+                f"@font-face {{ font-family: '{FONT_FAMILY}'; font-style: normal; "
+                f"font-weight: {weight}; font-display: swap; "
+                f"src: url(data:{mime};base64,{data}) format('{fmt}'); }}"
+            )
+            break
+    return "\n".join(rules)
+
+
+@st.cache_resource
+def stylesheet(path="styles.css"):
+    """The stylesheet (fonts inlined) as a <style> block; read from disk once per process."""
+    with open(path) as f:
+        css = f.read()
+    return f"<style>{font_faces()}\n{css}</style>"
+
+
+# --------------------------
+# AVATARS
+# --------------------------
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_thumbnail(data, size):
+    """Center-crops an image to a square and resizes it to `size` px (JPEG bytes)."""
+    from PIL import Image, ImageOps  # type: ignore
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img).convert("RGB")
+            thumb = ImageOps.fit(img, (size, size), method=Image.LANCZOS)
+    except Image.DecompressionBombError as exc:
+        raise ValueError("Image dimensions are too large.") from exc
+    except (OSError, ValueError) as exc:
+        raise ValueError("Not a readable image file.") from exc
+    out = io.BytesIO()
+    thumb.save(out, format="JPEG", quality=85, optimize=True)
+    return out.getvalue()
+
+
+class AvatarService:
+    """
+    Per-user avatars with a shared default. Only the avatar's digest is looked
+    up on a render; the image itself is read and resized on a cache miss.
+    """
+
+    def __init__(self, storage, default_path=DEFAULT_AVATAR):
+        self.storage = storage
+        self.cache = ResultCache(max_entries=AVATAR_CACHE_ENTRIES, max_bytes=AVATAR_CACHE_BYTES)
+        with open(default_path, "rb") as f:
+            self._default = f.read()
+        self._default_digest = content_digest(self._default)
+
+    def thumbnail(self, email, size=AVATAR_SIZE):
+        """JPEG bytes of the user's avatar (or the default) at `size` px."""
+        digest = self.storage.avatar_digest(email) if email else None
+        if digest is None:
+            return self.cache.get_or_compute(
+                ("avatar", self._default_digest, size), lambda: make_thumbnail(self._default, size)
+            )
+
+        def load():
+            stored = self.storage.get_avatar(email)
+            return make_thumbnail(stored[1] if stored else self._default, size)
+
+        return self.cache.get_or_compute(("avatar", digest, size), load)
+
+    def save(self, email, data):
+        """Validates, normalizes and stores an uploaded avatar; raises ValueError if unusable."""
+        if len(data) > MAX_AVATAR_UPLOAD:
+            raise ValueError(f"Images must be smaller than {MAX_AVATAR_UPLOAD // (1024 * 1024)} MB.")
+        image = make_thumbnail(data, AVATAR_STORED_SIZE)
+        self.storage.set_avatar(email, content_digest(image), image)
+
+
+@st.cache_resource
+def get_avatars():
+    """One avatar service (and thumbnail cache) per server process."""
+    from storage import get_storage
+    return AvatarService(get_storage())
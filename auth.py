@@ -1,5 +1,7 @@
 import streamlit as st  # type: ignore
-from sample_data import go_to
+from sample_data import go_to, log_in
+from storage import get_storage
+from credentials import get_credentials, needs_rehash
 
 
 # --------------------------
@@ -41,14 +43,63 @@ def auth_entry_page():
     with col2_c:
         st.markdown('<div class="auth-buttons">', unsafe_allow_html=True)
 
-        if st.button(" Login", key="auth_login_v2"):
-            go_to("login")
- 
-        if st.button(" Sign Up", key="auth_signup_v2"):
-            go_to("signup")
+        st.button(" Login", key="auth_login_v2", on_click=go_to, args=("login",))
+        st.button(" Sign Up", key="auth_signup_v2", on_click=go_to, args=("signup",))
 
     st.markdown("</div>", unsafe_allow_html=True)
 
+# --------------------------
+# FORM CALLBACKS
+# --------------------------
+# Forms batch their inputs into one submission; the callbacks run before the
+# rerun, so a successful login or signup renders the next page in that rerun.
+def _login():
+    email = st.session_state.login_email
+    password = st.session_state.login_password
+    storage = get_storage()
+    user = storage.get_user(email)
+    # Key derivation runs on the credential thread pool, not inline
+    ok, message = get_credentials().verify(email, password, user["password"] if user else None)
+    if ok:
+        if needs_rehash(user["password"]):
+            storage.update_password(email, get_credentials().hash(password))
+        log_in(email)
+        st.session_state.page = "dashboard"
+    else:
+        st.session_state.auth_message = ("error", message)
+
+
+def _signup():
+    values = {k: st.session_state[f"signup_{k}"]
+              for k in ("firstname", "lastname", "age", "gender", "email", "password", "confirm")}
+
+    if not all(values.values()):
+        st.session_state.auth_message = ("warning", "Please fill all fields.")
+    elif values["password"] != values["confirm"]:
+        st.session_state.auth_message = ("error", "Passwords do not match.")
+    elif get_storage().get_user(values["email"]) is not None:
+        st.session_state.auth_message = ("error", "Email already exists.")
+    elif not get_storage().create_user(
+        values["email"],
+        get_credentials().hash(values["password"]),
+        first_name=values["firstname"],
+        last_name=values["lastname"],
+        age=values["age"],
+        gender=values["gender"]
+    ):
+        st.session_state.auth_message = ("error", "Email already exists.")
+    else:
+        st.session_state.auth_message = ("success", "Account created! Please log in.")
+        st.session_state.page = "login"
+
+
+def _show_message():
+    """Shows (once) the message left by the last form callback."""
+    message = st.session_state.pop("auth_message", None)
+    if message is not None:
+        getattr(st, message[0])(message[1])
+
+
 # --------------------------
 # LOGIN PAGE
 # --------------------------
@@ -59,28 +110,18 @@ def login_page():
     _, center, _ = st.columns([1, 2, 1])
 
     with center:
-        st.markdown("<div class='center-label'>Email</div>", unsafe_allow_html=True)
-        email = st.text_input("", key="login_email")
+        _show_message()
+        with st.form("login_form", border=False):
+            st.markdown("<div class='center-label'>Email</div>", unsafe_allow_html=True)
+            st.text_input("Email", key="login_email", label_visibility="collapsed")
 
-        st.markdown("<div class='center-label'>Password</div>", unsafe_allow_html=True)
-        password = st.text_input("", type="password", key="login_password")
+            st.markdown("<div class='center-label'>Password</div>", unsafe_allow_html=True)
+            st.text_input("Password", type="password", key="login_password", label_visibility="collapsed")
 
-        b1_left, _, b2_right = st.columns([1, 1, 1])
-    
-        with b1_left:
-            # Changed key for back button on login page
-            if st.button("← Back", key="login_back_to_auth"):
-                go_to("auth")
-
-        with b2_right:
-            if st.button("Login"):
-                users = st.session_state.users
-                if email in users and users[email]["password"] == password:
-                    st.session_state.current_user = email
-                    st.session_state.page = "dashboard"
-                    st.rerun() 
-                else:
-                    st.error("Incorrect email or password.")
+            st.form_submit_button("Login", on_click=_login)
+
+        # Changed key for back button on login page
+        st.button("← Back", key="login_back_to_auth", on_click=go_to, args=("auth",))
 
     st.markdown("</div>", unsafe_allow_html=True)  # Fixed indentation: This closes the card div, so it must be outside the 'with center' block
 
@@ -93,52 +134,35 @@ def signup_page():
     _, center, _ = st.columns([1, 2, 1])
 
     with center:
-        st.markdown("<div class='center-label'>First Name</div>", unsafe_allow_html=True)
-        first_name = st.text_input("", key="signup_firstname")
-
-        st.markdown("<div class='center-label'>Last Name</div>", unsafe_allow_html=True)
-        last_name = st.text_input("", key="signup_lastname")
-
-        st.markdown("<div class='center-label'>Age</div>", unsafe_allow_html=True)
-        age = st.number_input("", min_value=1, max_value=120, step=1, key="signup_age")
-
-        st.markdown("<div class='center-label'>Gender</div>", unsafe_allow_html=True)
-        gender = st.selectbox("", ["Male", "Female", "Other"], key="signup_gender")
-
-        st.markdown("<div class='center-label'>Email</div>", unsafe_allow_html=True)
-        email = st.text_input("", key="signup_email")
-
-        st.markdown("<div class='center-label'>Password</div>", unsafe_allow_html=True)
-        password = st.text_input("", type="password", key="signup_password")
-
-        st.markdown("<div class='center-label'>Confirm Password</div>", unsafe_allow_html=True)
-        password2 = st.text_input("", type="password", key="signup_confirm")
-
-        btn_left, _, btn_right = st.columns([1, 1, 1])
-
-        with btn_left:
-            if st.button("← Back", key="signup_back_to_auth"):
-                go_to("auth")
-
-        with btn_right:
-            if st.button("Sign Up"):
-
-                if not all([first_name, last_name, age, email, password, password2]):
-                    st.warning("Please fill all fields.")
-                elif password != password2:
-                    st.error("Passwords do not match.")
-                elif email in st.session_state.users:
-                    st.error("Email already exists.")
-                else:
-                    st.session_state.users[email] = {
-                        "password": password,
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "age": age,
-                        "gender": gender
-                    }
-                    st.success("Account created!")
-                    go_to("login")
+        _show_message()
+        # One form: the seven inputs are sent together on submit, not rerun per keystroke
+        with st.form("signup_form", border=False):
+            st.markdown("<div class='center-label'>First Name</div>", unsafe_allow_html=True)
+            st.text_input("First Name", key="signup_firstname", label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Last Name</div>", unsafe_allow_html=True)
+            st.text_input("Last Name", key="signup_lastname", label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Age</div>", unsafe_allow_html=True)
+            st.number_input("Age", min_value=1, max_value=120, step=1, key="signup_age",
+                            label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Gender</div>", unsafe_allow_html=True)
+            st.selectbox("Gender", ["Male", "Female", "Other"], key="signup_gender",
+                         label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Email</div>", unsafe_allow_html=True)
+            st.text_input("Email", key="signup_email", label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Password</div>", unsafe_allow_html=True)
+            st.text_input("Password", type="password", key="signup_password", label_visibility="collapsed")
+
+            st.markdown("<div class='center-label'>Confirm Password</div>", unsafe_allow_html=True)
+            st.text_input("Confirm Password", type="password", key="signup_confirm",
+                          label_visibility="collapsed")
+
+            st.form_submit_button("Sign Up", on_click=_signup)
+
+        st.button("← Back", key="signup_back_to_auth", on_click=go_to, args=("auth",))
     
     st.markdown("</div>", unsafe_allow_html=True)  # Fixed indentation: This closes the card div, so it must be outside the 'with center' block
-
@@ -0,0 +1,244 @@
+# benchmark.py
+"""
+Headless page-render benchmarks.
+
+Seeds a SQLite database per dataset size with datagen, then drives the real
+app through Streamlit's AppTest as a logged-in user. For each page it records
+the first render of a new session, the median rerun, the peak Python
+allocation (tracemalloc) and the serialized size of the page's ForwardMsgs.
+Pure helpers (`_parse_time`, `parse_times`, `generate_sample_patients`) are
+timed too. Each size runs in its own worker process, because the database
+path and the process-wide caches are fixed at import.
+
+    python benchmark.py --sizes 25 1000 10000 100000 --out bench.json
+    python benchmark.py --sizes 25 1000 --out new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import tracemalloc
+
+
+# --- Benchmark settings ---
+SIZES = (25, 1_000, 10_000, 100_000)
+PAGES = ("login", "dashboard", "medication", "schedule", "user_info")
+REPEAT = 5
+DATA_DIR = ".bench"
+BENCH_USER = "bench@example.com"
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# metric -> True when larger is worse (used by --compare)
+METRICS = {"first_ms": True, "rerun_ms": True, "peak_kib": True, "payload_bytes": True, "ms": True}
+THRESHOLD = 0.10
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+# --------------------------
+# DATASETS
+# --------------------------
+def seed_database(path, patients, seed):
+    """Creates the benchmark database for `patients` unless it already exists."""
+    if os.path.exists(path):
+        return
+    from datagen import generate_bulk, write_storage
+    from storage import Storage
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".partial"
+    storage = Storage(tmp)
+    for _ in write_storage(generate_bulk(patients, seed=seed), storage):
+        pass
+    storage.create_user(BENCH_USER, "bench", first_name="Bench", last_name="User", age=40, gender="Other")
+    storage.pool.close()
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(tmp + suffix):
+            os.remove(tmp + suffix)
+    os.replace(tmp, path)
+
+
+# --------------------------
+# WORKER (ONE DATASET SIZE)
+# --------------------------
+def _capture_payload():
+    """Wraps AppTest's message parsing to record the byte size of each run's ForwardMsgs."""
+    from streamlit.testing.v1 import local_script_runner  # type: ignore
+
+    sizes = []
+    parse = local_script_runner.parse_tree_from_messages
+
+    def parse_and_measure(messages):
+        sizes.append(sum(m.ByteSize() for m in messages))
+        return parse(messages)
+
+    local_script_runner.parse_tree_from_messages = parse_and_measure
+    return sizes
+
+
+def _token():
+    """A session token for the bench user, issued through the shared session store."""
+    from sessions import SessionManager
+    from storage import get_storage
+    return SessionManager(get_storage()).issue(BENCH_USER)
+
+
+def _session(page, token=None):
+    from streamlit.testing.v1 import AppTest  # type: ignore
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.session_state["session_token"] = None if page == "login" else token
+    at.session_state["page"] = page
+    return at
+
+
+def bench_pages(repeat):
+    payloads = _capture_payload()
+    token = _token()
+    results = {}
+
+    start = time.perf_counter()
+    _session("login").run()          # imports app, storage and the login page
+    results["startup"] = {"first_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    for page in PAGES:
+        at = _session(page, token)
+        start = time.perf_counter()
+        at.run()
+        first = (time.perf_counter() - start) * 1000
+        if at.exception:
+            raise RuntimeError(f"{page} raised: {at.exception[0].value}")
+        payload = payloads[-1]
+        rerun = _median_ms(at.run, repeat)
+
+        # a separate new session under tracemalloc, so tracing does not skew timings
+        tracemalloc.start()
+        _session(page, token).run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[page] = {
+            "first_ms": round(first, 3),
+            "rerun_ms": rerun,
+            "peak_kib": round(peak / 1024, 1),
+            "payload_bytes": payload,
+        }
+    return results
+
+
+def bench_helpers(repeat):
+    from sample_data import _parse_time, parse_times, generate_sample_patients
+
+    stamps = [f"2025-01-{d:02d} {h:02d}:30" for d in range(1, 29) for h in range(24)] * 15   # ~10k
+    return {
+        "_parse_time[10k]": {"ms": _median_ms(lambda: [_parse_time(s) for s in stamps], repeat)},
+        "parse_times[10k]": {"ms": _median_ms(lambda: parse_times(stamps), repeat)},
+        "generate_sample_patients[25]": {"ms": _median_ms(lambda: generate_sample_patients(25), repeat)},
+        "generate_sample_patients[1k]": {"ms": _median_ms(lambda: generate_sample_patients(1000), repeat)},
+    }
+
+
+def worker(size, db, repeat, helpers):
+    os.environ["HEALTH_DB_PATH"] = db
+    os.chdir(os.path.dirname(APP_PATH))
+    sys.path.insert(0, os.path.dirname(APP_PATH))
+    out = {f"pages/{size}/{page}": m for page, m in bench_pages(repeat).items()}
+    if helpers:
+        out.update({f"helpers/{name}": m for name, m in bench_helpers(repeat).items()})
+    json.dump(out, sys.stdout)
+
+
+# --------------------------
+# BASELINE FILES
+# --------------------------
+def compare(current, baseline, threshold=THRESHOLD):
+    """Rows (key, metric, old, new, change) for metrics present in both runs; flags regressions."""
+    rows, regressions = [], 0
+    for key, metrics in current.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for metric, value in metrics.items():
+            if metric not in old or not old[metric]:
+                continue
+            change = (value - old[metric]) / old[metric]
+            worse = change > threshold if METRICS.get(metric, True) else change < -threshold
+            regressions += worse
+            rows.append((key, metric, old[metric], value, change, worse))
+    return rows, regressions
+
+
+def _meta(args):
+    import streamlit  # type: ignore
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "streamlit": streamlit.__version__,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark page renders and helpers at several dataset sizes.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", default=DATA_DIR, help="where seeded databases are kept between runs")
+    parser.add_argument("--out", default="bench.json", help="baseline file to write")
+    parser.add_argument("--compare", help="earlier baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative change counted as a regression")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    parser.add_argument("--helpers", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        worker(args.worker, args.db, args.repeat, args.helpers)
+        return 0
+
+    results = {}
+    for i, size in enumerate(args.sizes):
+        db = os.path.abspath(os.path.join(args.data_dir, f"bench-{size}-{args.seed}.db"))
+        print(f"Seeding {size:,} patients...", flush=True)
+        seed_database(db, size, args.seed)
+        print(f"Benchmarking {size:,} patients...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(size), "--db", db,
+               "--repeat", str(args.repeat)] + (["--helpers"] if i == 0 else [])
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"Benchmark worker for {size} patients failed.")
+        results.update(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    with open(args.out, "w") as f:
+        json.dump({"meta": _meta(args), "results": results}, f, indent=2, sort_keys=True)
+    for key, metrics in sorted(results.items()):
+        print(f"{key:45s} " + "  ".join(f"{m}={v:g}" for m, v in metrics.items()))
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        rows, regressions = compare(results, baseline, args.threshold)
+        for key, metric, old, new, change, worse in rows:
+            flag = "  REGRESSION" if worse else ""
+            print(f"{key:45s} {metric:14s} {old:>12g} -> {new:>12g} ({change:+.1%}){flag}")
+        print(f"{regressions} regression(s) beyond {args.threshold:.0%}.")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
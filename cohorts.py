@@ -0,0 +1,247 @@
+# cohorts.py
+"""
+Cohort analytics over the shared dataset.
+
+A cohort is a set of patients: an age band (from patient['age']) or everyone
+on a given medication. Each cohort is a bitmap over the vitals store's block
+positions (one bit per patient, packed eight to a byte). Combining cohorts
+("Age 65+ AND On Metformin") is a bitwise AND / OR of a few kilobytes, and
+its size is a popcount.
+
+Vitals are never regrouped from readings. A cohort's statistics merge the
+running per-patient statistics of its members (see vitals_stats), so a query
+costs O(members). Every single cohort keeps that merge as running state: the
+index listens to the vitals store and folds each write's readings into the
+cohorts their patients belong to. Only a membership change or a replaced
+reading makes a cohort merge its members again. Combined queries are kept in
+a small LRU cache.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np  # type: ignore
+from sample_data import MEDS
+from vitals_stats import METRICS, STATISTICS
+
+
+# --- Cohort settings ---
+AGE_BANDS = (("Age <40", 0, 40), ("Age 40–64", 40, 65), ("Age 65+", 65, None))   # [lo, hi)
+DRUG_PREFIX = "On "
+QUERY_CACHE_SIZE = 256           # combined-cohort results kept per data version
+ALL, ANY = "and", "or"
+
+
+def age_band(age):
+    """Name of the age band `age` falls in, or None if it has none."""
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return None
+    for name, lo, hi in AGE_BANDS:
+        if age >= lo and (hi is None or age < hi):
+            return name
+    return None
+
+
+def drug_cohort(name):
+    return f"{DRUG_PREFIX}{name}"
+
+
+def _members(bits, blocks):
+    """Whether each block position is set in a packed bitmap."""
+    return ((bits[blocks >> 3] >> (7 - (blocks & 7)).astype(np.uint8)) & 1).astype(bool)
+
+
+def _memberships(patient):
+    """Every cohort the patient belongs to."""
+    band = age_band(patient.get("age"))
+    drugs = {drug_cohort(m["name"]) for m in patient.get("medications", ()) if m.get("name")}
+    return drugs | {band} if band else drugs
+
+
+# --------------------------
+# COHORT INDEX
+# --------------------------
+class CohortIndex:
+    """
+    Bitmap per cohort over the store's block positions, plus pre-aggregated
+    vitals statistics per cohort.
+
+    - membership is kept current by `update` (called when edits are merged)
+    - aggregates are updated by every store write; a cohort whose members
+      changed is merged again on the next read
+    - one index is shared by every session; updates and queries hold a lock
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.n = len(store.ids)
+        self.bits = {}                   # cohort -> packed uint8 bitmap
+        self.version = 0
+        self._lock = threading.RLock()
+        self._groups = {}                # cohort -> GroupStats; missing ones are merged on read
+        self._aggregates = {}            # cohort -> (size, statistics) from its group
+        self._changed = set()            # cohorts whose group changed since _aggregates
+        self._queries = OrderedDict()    # (cohorts, mode, data key) -> (size, statistics)
+        store.subscribe(self._on_write)
+
+    @classmethod
+    def build(cls, patients, store):
+        """Builds every cohort bitmap in one pass over the patients."""
+        index = cls(store)
+        patients = [p for p in patients if p["id"] in store]
+        members = {}
+        for p, pos in zip(patients, store.positions([p["id"] for p in patients]).tolist()):
+            for cohort in _memberships(p):
+                members.setdefault(cohort, []).append(pos)
+        for cohort, positions in members.items():
+            mask = np.zeros(index.n, dtype=bool)
+            mask[positions] = True
+            index.bits[cohort] = np.packbits(mask)
+        return index
+
+    # --- Maintenance ---
+    def _fit(self):
+        """Pads the bitmaps when the store has gained patient blocks."""
+        n = len(self.store.ids)
+        if n != self.n:
+            self.n = n
+            size = (n + 7) // 8
+            for cohort, bits in self.bits.items():
+                self.bits[cohort] = np.pad(bits, (0, size - len(bits)))
+
+    def update(self, patient):
+        """Re-indexes one patient's cohorts (after an age or medication change)."""
+        pid = patient["id"]
+        if pid not in self.store:
+            return
+        pos = int(self.store.positions([pid])[0])
+        byte, mask = pos >> 3, np.uint8(0x80 >> (pos & 7))
+        with self._lock:
+            self._fit()
+            cohorts = _memberships(patient)
+            for cohort, bits in self.bits.items():
+                if cohort not in cohorts and bits[byte] & mask:
+                    bits[byte] &= ~mask
+                    self._groups.pop(cohort, None)
+            for cohort in cohorts:
+                bits = self.bits.get(cohort)
+                if bits is None:
+                    bits = self.bits[cohort] = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+                if not bits[byte] & mask:
+                    bits[byte] |= mask
+                    self._groups.pop(cohort, None)
+            self.version += 1
+
+    def _on_write(self, block, values, reset):
+        """
+        Store listener: folds the written readings into the groups of the
+        cohorts their patients belong to. A cohort holding a block whose
+        readings were replaced is merged again on the next read instead.
+        """
+        stats = self.store.stats
+        if stats is None:
+            return
+        with self._lock:
+            self._fit()
+            reset = np.fromiter(reset, dtype=np.int64, count=len(reset))
+            for cohort, bits in self.bits.items():
+                group = self._groups.get(cohort)
+                if group is None or group.version >= stats.version:    # merged after this write
+                    continue
+                if len(reset) and _members(bits, reset).any():
+                    del self._groups[cohort]
+                    continue
+                member = _members(bits, block)
+                if member.any():
+                    group.add({m: values[m][member] for m in METRICS})
+                    self._changed.add(cohort)
+                group.version = stats.version
+
+    # --- Queries ---
+    def cohorts(self):
+        """Cohort names: age bands in order, then drugs (sample formulary first, then by name)."""
+        with self._lock:
+            names = set(self.bits)
+        order = {c: i for i, c in enumerate([b[0] for b in AGE_BANDS] + [drug_cohort(m) for m in MEDS])}
+        return sorted(names, key=lambda c: (order.get(c, len(order)), c))
+
+    def _combine(self, cohorts, mode):
+        if not cohorts:
+            return np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        op = np.bitwise_and if mode == ALL else np.bitwise_or
+        empty = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        return op.reduce([self.bits.get(c, empty) for c in cohorts])
+
+    def size(self, cohorts, mode=ALL):
+        """Number of patients matching the cohorts (popcount of the combined bitmap)."""
+        with self._lock:
+            return int(np.bitwise_count(self._combine(cohorts, mode)).sum())
+
+    def positions(self, cohorts, mode=ALL):
+        """Store block positions of the matching patients."""
+        with self._lock:
+            return np.flatnonzero(np.unpackbits(self._combine(cohorts, mode), count=self.n))
+
+    def patients(self, cohorts, mode=ALL):
+        """Ids of the matching patients."""
+        return [self.store.ids[i] for i in self.positions(cohorts, mode).tolist()]
+
+    def _data_key(self):
+        return (self.store.token, self.store.version, self.version)
+
+    def aggregates(self):
+        """cohort -> (size, metric -> statistic) for every single cohort, from its running group."""
+        with self._lock:
+            self._fit()
+            stats = self.store.statistics()
+            cohorts = self.cohorts()
+            for cohort in cohorts:
+                if cohort not in self._groups:
+                    self._groups[cohort] = stats.group(self.positions([cohort]))
+                    self._changed.add(cohort)
+            for cohort in self._changed:
+                self._aggregates[cohort] = (self.size([cohort]), self._groups[cohort].result())
+            self._changed.clear()
+            return {cohort: self._aggregates[cohort] for cohort in cohorts}
+
+    def query(self, cohorts, mode=ALL):
+        """(size, metric -> statistic) for the patients matching the cohorts combined with AND / OR."""
+        cohorts = tuple(sorted(set(cohorts)))
+        if len(cohorts) == 1:
+            return self.aggregates().get(cohorts[0], (0, self.store.statistics().merged([])))
+        with self._lock:
+            self._fit()
+            key = (cohorts, mode) + self._data_key()
+            hit = self._queries.get(key)
+            if hit is not None:
+                self._queries.move_to_end(key)
+                return hit
+            blocks = self.positions(cohorts, mode)
+            result = (len(blocks), self.store.statistics().merged(blocks))
+            self._queries[key] = result
+            while len(self._queries) > QUERY_CACHE_SIZE:
+                self._queries.popitem(last=False)
+        return result
+
+
+# --------------------------
+# SUMMARY TABLES
+# --------------------------
+def cohort_frame(index, stat="mean"):
+    """One statistic of every vital for each single cohort, with its patient count."""
+    import pandas as pd  # type: ignore
+    aggregates = index.aggregates()
+    rows = [
+        {"cohort": cohort, "patients": size} | {m: stats[m][stat] for m in METRICS}
+        for cohort, (size, stats) in aggregates.items()
+    ]
+    df = pd.DataFrame(rows, columns=["cohort", "patients", *METRICS])
+    return df if stat == "count" else df.round(2)
+
+
+def query_frame(stats):
+    """Every statistic of every vital for one cohort query (vitals as rows)."""
+    import pandas as pd  # type: ignore
+    df = pd.DataFrame([[stats[m][s] for s in STATISTICS] for m in METRICS], index=list(METRICS),
+                      columns=list(STATISTICS))
+    return df.round(2)
@@ -0,0 +1,176 @@
+# credentials.py
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st  # type: ignore
+
+
+# --- KDF cost parameters (tunable per deployment) ---
+SCRYPT_N = int(os.environ.get("HEALTH_SCRYPT_N", 2 ** 14))
+SCRYPT_R = int(os.environ.get("HEALTH_SCRYPT_R", 8))
+SCRYPT_P = int(os.environ.get("HEALTH_SCRYPT_P", 1))
+KDF_WORKERS = int(os.environ.get("HEALTH_KDF_WORKERS", min(4, os.cpu_count() or 1)))
+
+# --- Login protection ---
+MAX_ATTEMPTS = 5                 # failed logins allowed per email ...
+ATTEMPT_WINDOW = 15 * 60         # ... within this many seconds
+PRUNE_EVERY = 60                 # seconds between sweeps of expired failure records
+VERIFY_TTL = 5 * 60              # successful verifications are remembered this long
+VERIFY_CACHE_SIZE = 1024
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode("ascii")
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=32
+    )
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """Derives a salted scrypt hash: 'scrypt$n$r$p$salt$hash'."""
+    salt = secrets.token_bytes(16)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def check_password(password, stored):
+    """Constant-time check of `password` against a stored hash (or a legacy plaintext value)."""
+    if not stored.startswith("scrypt$"):
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    _, n, r, p, salt, expected = stored.split("$")
+    derived = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    return hmac.compare_digest(derived, base64.b64decode(expected))
+
+
+def needs_rehash(stored):
+    """True for plaintext values and hashes made with other cost parameters."""
+    return not stored.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+
+
+# --------------------------
+# CREDENTIAL SERVICE
+# --------------------------
+class CredentialService:
+    """
+    Hashes and verifies passwords on a small thread pool (hashlib releases the
+    GIL while deriving keys), so the KDF never runs on a Streamlit script thread.
+
+    - per-email limit on failed attempts inside a sliding window
+    - short-TTL cache of recent successful verifications, keyed by an HMAC of
+      (email, password, stored hash) under a per-process secret
+    - timing samples for tuning the KDF cost against login latency
+    """
+
+    def __init__(self, workers=KDF_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="kdf")
+        self._lock = threading.Lock()
+        self._failures = {}                  # email -> deque of failure timestamps
+        self._next_prune = 0.0
+        self._verified = OrderedDict()       # cache key -> expiry
+        self._secret = secrets.token_bytes(32)
+        self._dummy = hash_password(secrets.token_hex(8))
+        self._timings = {"hash": deque(maxlen=1000), "verify": deque(maxlen=1000)}
+        self.cache_hits = 0
+
+    # --- KDF calls ---
+    def _timed(self, kind, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._timings[kind].append(time.perf_counter() - start)
+
+    def hash(self, password):
+        """Hashes a new password off-thread and waits for the result."""
+        return self._pool.submit(self._timed, "hash", hash_password, password).result()
+
+    def verify(self, email, password, stored):
+        """
+        Verifies a login. Returns (ok, message); `message` explains a refusal.
+        Pass stored=None for unknown emails: a dummy hash is still checked so
+        response time does not reveal which accounts exist.
+        """
+        if self.locked(email):
+            return False, "Too many failed attempts. Please try again later."
+
+        key = hmac.new(self._secret, f"{email}\0{password}\0{stored}".encode("utf-8"), "sha256").digest()
+        now = time.monotonic()
+        with self._lock:
+            expiry = self._verified.get(key)
+            if expiry is not None and expiry > now:
+                self._verified.move_to_end(key)
+                self.cache_hits += 1
+                return True, ""
+
+        ok = self._pool.submit(
+            self._timed, "verify", check_password, password, stored or self._dummy
+        ).result() and stored is not None
+
+        with self._lock:
+            if ok:
+                self._failures.pop(email, None)
+                self._verified[key] = now + VERIFY_TTL
+                while len(self._verified) > VERIFY_CACHE_SIZE:
+                    self._verified.popitem(last=False)
+            else:
+                self._failures.setdefault(email, deque()).append(now)
+                if now >= self._next_prune:
+                    self._prune(now)
+        return ok, "" if ok else "Incorrect email or password."
+
+    # --- Attempt limiting ---
+    def locked(self, email):
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._failures.get(email)
+            if not attempts:
+                return False
+            while attempts and attempts[0] < now - ATTEMPT_WINDOW:
+                attempts.popleft()
+            if not attempts:
+                del self._failures[email]
+                return False
+            return len(attempts) >= MAX_ATTEMPTS
+
+    def _prune(self, now):
+        """Drops failure records whose attempts have all left the window (caller holds the lock)."""
+        self._next_prune = now + PRUNE_EVERY
+        cutoff = now - ATTEMPT_WINDOW
+        for email in [e for e, attempts in self._failures.items() if attempts[-1] < cutoff]:
+            del self._failures[email]
+
+    # --- Metrics ---
+    def metrics(self):
+        """Count, p50, p95 and max duration (ms) of hash and verify calls."""
+        out = {"cost": {"n": SCRYPT_N, "r": SCRYPT_R, "p": SCRYPT_P}, "cache_hits": self.cache_hits}
+        with self._lock:
+            out["tracked_failures"] = len(self._failures)
+            for kind, samples in self._timings.items():
+                ordered = sorted(samples)
+                if not ordered:
+                    out[kind] = {"count": 0}
+                    continue
+                pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+                out[kind] = {
+                    "count": len(ordered),
+                    "p50_ms": pick(0.50),
+                    "p95_ms": pick(0.95),
+                    "max_ms": round(ordered[-1] * 1000, 1),
+                }
+        return out
+
+
+@st.cache_resource
+def get_credentials():
+    """One credential service (thread pool, limiter, cache) per server process."""
+    return CredentialService()
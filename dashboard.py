@@ -1,11 +1,128 @@
 # dashboard.py
 import streamlit as st # type: ignore
-import pandas as pd # type: ignore
 import altair as alt # type: ignore
-from datetime import datetime
+from datetime import timedelta
 # Assuming medication_tracker.py is in the same directory and contains top_nav_bar()
 from medication_tracker import top_nav_bar
-from schedtracker import schedule_tracker_page  # ✅ IMPORT Schedule Tracker
+from trends import TREND_METHODS, compute_trends, trend_table
+from result_cache import get_result_cache
+from patient_index import patient_picker
+from downsample import CHART_WIDTH, downsample_series
+from vitals_table import vitals_table
+from ingest import import_panel
+from storage import get_storage
+from live_feed import live_vitals_panel, simulation_toggle
+from alerts import get_alert_engine
+from startup import get_startup_report
+from dataset import get_dataset
+from exports import export_panel
+from vitals_stats import STATISTICS, stats_frame
+from cohorts import ALL, ANY, cohort_frame, query_frame
+from profiler import span, fragment_span
+
+
+# --- FRAGMENTS ---
+# Widgets inside a fragment rerun only that fragment, not the whole page.
+@st.fragment
+def _table_section(store, sel_ids, cache, data_key):
+    # Server-side sorted index; only the visible page of rows is materialized
+    with fragment_span("dashboard", "vitals_table"):
+        vitals_table(store, sel_ids, key="dash_table", cache=cache, data_key=data_key)
+
+
+@st.fragment
+def _trend_section(store, sel_ids, cache, data_key):
+    tcol1, tcol2 = st.columns(2)
+    with tcol1:
+        window = st.slider("Readings per trend window", min_value=2, max_value=20, value=3)
+    with tcol2:
+        method = st.selectbox("Trend method", TREND_METHODS)
+    # One grouped pass over all selected patients and all four vitals
+    with fragment_span("dashboard", "trends"):
+        trends = cache.get_or_compute(
+            ("trends", window, method) + data_key,
+            lambda: trend_table(compute_trends(store, sel_ids, window=window, method=method))
+        )
+    st.table(trends)
+
+
+@st.fragment
+def _hr_chart_section(df, cache, data_key):
+    # Slider bounds are whole hours so the widget keeps its state while readings stream in
+    first = df["time"].min().floor("h").to_pydatetime()
+    last = df["time"].max().ceil("h").to_pydatetime()
+    visible = (first, last)
+    if last > first:
+        visible = st.slider("Visible time range", min_value=first, max_value=last, value=visible,
+                            step=timedelta(hours=1), format="YYYY-MM-DD HH:mm", key="hr_range")
+    # Server-side downsampling of the visible range keeps each series within the chart's
+    # point budget; one series per patient id, so patients sharing a name stay separate
+    with fragment_span("dashboard", "hr_chart"):
+        hr_chart = cache.get_or_compute(
+            ("hr_chart", CHART_WIDTH, visible) + data_key,
+            lambda: alt.Chart(downsample_series(df[["patient_id", "patient", "time", "hr"]], "hr",
+                                                time_range=visible)).mark_line(point=True).encode(
+                x='time:T',
+                y='hr:Q',
+                color='patient:N',
+                detail='patient_id:N',
+                tooltip=['patient', 'patient_id', 'time', 'hr', 'bucket']
+            ).properties(height=320)
+        )
+    st.altair_chart(hr_chart, use_container_width=True)
+
+
+@st.fragment
+def _aggregation_section(store, sel_ids):
+    stat = st.radio("Statistic", STATISTICS, horizontal=True, key="agg_stat")
+    # Running per-patient statistics: O(patients) whatever the reading history
+    with fragment_span("dashboard", "aggregations"):
+        table = stats_frame(store, sel_ids, stat)
+    st.table(table)
+    st.caption("p50 / p95 are sketch estimates (within about 1% of the true value).")
+
+
+@st.fragment
+def _cohort_section(cohorts):
+    stat = st.radio("Statistic", STATISTICS, horizontal=True, key="cohort_stat")
+    # Pre-aggregated per cohort; recomputed only when readings or memberships change
+    with fragment_span("dashboard", "cohorts"):
+        table = cohort_frame(cohorts, stat)
+    st.table(table)
+
+    st.write("**Combine cohorts**")
+    c1, c2 = st.columns([3, 1])
+    chosen = c1.multiselect("Cohorts", cohorts.cohorts(), key="cohort_query")
+    match = c2.radio("Match", ("All (AND)", "Any (OR)"), key="cohort_match")
+    if not chosen:
+        st.caption("Pick cohorts, e.g. Age 65+ and On Metformin.")
+        return
+    # Bitmap AND / OR, then a merge of the members' running statistics
+    with fragment_span("dashboard", "cohort_query"):
+        size, stats = cohorts.query(chosen, ALL if match.startswith("All") else ANY)
+    joiner = " AND " if match.startswith("All") else " OR "
+    st.write(f"{joiner.join(chosen)}: **{size:,}** patients")
+    if size:
+        st.table(query_frame(stats))
+
+
+@st.fragment
+def _live_section(store, sel_ids):
+    simulation_toggle(sel_ids)
+    # Fragment: refreshes on its own timer, the rest of the page is not rerun
+    live_vitals_panel(tuple(sel_ids), names=store.name)
+
+
+@st.fragment
+def _import_section():
+    with fragment_span("dashboard", "import"):
+        # Stored chunk by chunk, then published into the shared dataset in one write
+        totals = import_panel(get_storage(), get_dataset())
+    if totals is not None:
+        st.success(
+            f"Imported {totals['imported']:,} of {totals['rows']:,} rows "
+            f"({totals['rejected']:,} rejected)."
+        )
 
 
 # --- DASHBOARD PAGE ---
@@ -15,79 +132,75 @@ def dashboard():
     st.write("")  # spacing
     st.write("---")  # spacing
 
-    patients = st.session_state.patients
-    patient_choices = {f"{p['id']} — {p['name']}": p for p in patients}
-    
-    # Multiselect for patient filtering
-    sel_keys = st.multiselect(
-        "Select patients to include", 
-        list(patient_choices.keys()), 
-        default=list(patient_choices.keys())[:5]
+    counts = get_alert_engine().counts()
+    if counts:
+        st.warning(" · ".join(f"{n} {severity}" for severity, n in sorted(counts.items())) + " alerts active")
+
+    data = get_dataset()
+    index = data.patient_index
+
+    # Search-driven, paged multiselect for patient filtering
+    sel_ids = patient_picker(
+        index,
+        key="dash_patients",
+        label="Select patients to include",
+        multi=True,
+        default=index.ids[:5]
     )
 
-    if not sel_keys:
+    if not sel_ids:
         st.info("Select at least one patient to view metrics.")
         return
 
-    # gather readings from selected patients
-    records = []
-    for key in sel_keys:
-        p = patient_choices[key]
-        for r in p['readings']:
-            records.append({
-                "patient": p['name'],
-                # Convert time string to datetime object
-                "time": datetime.strptime(r['time'], "%Y-%m-%d %H:%M"), 
-                "hr": r['hr'],
-                "bp_sys": r['bp_sys'],
-                "bp_dia": r['bp_dia'],
-                "temp": r['temp']
-            })
-    df = pd.DataFrame(records)
+    # gather readings from selected patients (columnar store, no per-row parsing);
+    # one snapshot per run, so live writes never mix into a half-read table
+    store = data.vitals_store.snapshot()
+
+    # Derived results are cached on (data set, data version, selection)
+    cache = get_result_cache()
+    data_key = (store.token, store.version, tuple(sel_ids))
+
+    with span("frame"):
+        df = cache.get_or_compute(("frame",) + data_key, lambda: store.frame(sel_ids))
     if df.empty:
         st.warning("No readings available.")
         return
 
     st.write("### Combined Vitals Table (Most Recent First)")
-    # Data structure usage: DataFrame sorting
-    st.dataframe(df.sort_values("time", ascending=False).reset_index(drop=True), use_container_width=True)
+    _table_section(store, sel_ids, cache, data_key)
     st.markdown("</div>", unsafe_allow_html=True)
 
     st.write("---")
     
-    # Aggregation: averages
-    st.write("### 📈 Aggregations (Averages)")
-    avg = df.groupby("patient")[["hr","bp_sys","bp_dia","temp"]].mean().round(1).reset_index()
-    st.table(avg)
-    
+    # Aggregations from running statistics (no regrouping of the reading history)
+    st.write("### 📈 Aggregations")
+    _aggregation_section(store, sel_ids)
+
+    # Whole-ward cohorts (age bands, medications), independent of the selection
+    st.write("### 👥 Cohort Analytics")
+    _cohort_section(data.cohorts)
+
     st.write("### Heart Rate Trend Over Time")
-    hr_chart = alt.Chart(df).mark_line(point=True).encode(
-        x='time:T',
-        y='hr:Q',
-        color='patient:N',
-        tooltip=['patient','time','hr']
-    ).properties(height=320)
-    st.altair_chart(hr_chart, use_container_width=True)
+    _hr_chart_section(df, cache, data_key)
+
+    st.write("### Trend Detection (All Vitals)")
+    _trend_section(store, sel_ids, cache, data_key)
 
-    st.write("### Simple Trend Detection (Last 3 HR Readings)")
-    trends = []
-    # Trend detection uses comparison of the newest reading against the oldest in a small window (last 3)
-    for key in sel_keys:
-        pname = patient_choices[key]['name']
-        # Uses DataFrame slicing and sorting for time-series analysis
-        p_df = df[df['patient'] == pname].sort_values('time', ascending=False).head(3)
-        if len(p_df) < 2:
-            trend = "not enough data"
-        else:
-            hr_vals = p_df['hr'].values
-            # hr_vals[0] is the newest, hr_vals[-1] is the oldest of the last 3
-            if hr_vals[0] > hr_vals[-1]:
-                trend = "**increasing** ⬆️"
-            elif hr_vals[0] < hr_vals[-1]:
-                trend = "**decreasing** ⬇️"
-            else:
-                trend = "stable ➡️"
-        trends.append({"patient": pname, "hr_trend": trend})
-    st.table(pd.DataFrame(trends))
+    st.write("### 📡 Live Monitor")
+    _live_section(store, sel_ids)
+
+    stats = cache.stats()
+    st.caption(f"Result cache: {stats['hits']} hits / {stats['misses']} misses ({stats['entries']} entries)")
+
+    st.write("---")
+    with st.expander("📥 Import Vitals / Medications"):
+        _import_section()
+        # Outside the fragment: one page run shows imported rows in every section
+        st.button("Reload data", key="import_reload")
 
+    # Exports run on a background pool; the page only queues them and polls progress
+    with st.expander("📤 Export Reports"):
+        export_panel(data, sel_ids, st.session_state.current_user)
 
+    with st.expander("⏱ Startup Timing"):
+        st.json(get_startup_report().as_dict())
@@ -0,0 +1,202 @@
+# datagen.py
+"""
+Seeded, vectorized synthetic data generator for load and scale testing.
+
+Produces patients, medications and readings in chunks and streams them to
+CSV, Parquet or the app's SQLite storage. Output depends only on the seed,
+the chunk size and the anchor time, so runs are reproducible across builds.
+
+    python datagen.py --patients 100000 --seed 42 --format parquet --out data/
+    python datagen.py --patients 5000 --format db
+"""
+import os
+import json
+import argparse
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+from sample_data import MEDS
+
+
+# --- Generator settings ---
+DEFAULT_SEED = 42
+DEFAULT_ANCHOR = "2025-01-01 00:00"   # fixed "now", so timestamps are reproducible
+CHUNK_PATIENTS = 10_000
+READING_SPAN_HOURS = 73          # readings fall in the last 72 h, or further back when there are more
+
+
+def _time_strings(times):
+    """datetime64 array -> 'YYYY-MM-DD HH:MM' strings (the app's time format)."""
+    return np.char.replace(np.datetime_as_string(times, unit="m"), "T", " ")
+
+
+def _unique_offsets(rng, counts, min_span=READING_SPAN_HOURS):
+    """
+    Distinct hour offsets for each patient's readings (readings are keyed by
+    patient and time). A patient with k readings draws k of max(min_span, k)
+    hours: k sorted draws from [0, span - k] plus their rank are strictly
+    increasing, so no two land on the same hour.
+    """
+    owner = np.repeat(np.arange(len(counts)), counts)
+    span = np.maximum(min_span, counts)[owner]
+    draws = rng.integers(0, span - counts[owner] + 1)
+    order = np.lexsort((draws, owner))
+    rank = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return draws[order] + rank
+
+
+# --------------------------
+# CHUNK GENERATION
+# --------------------------
+def generate_chunk(rng, start, count, anchor, readings=(5, 10), meds=(3, 5), times=(2, 4)):
+    """
+    Generates `count` patients numbered from `start` with the same distributions
+    as `generate_sample_patients`, drawn in bulk from the numpy Generator `rng`.
+
+    Returns a dict of DataFrames: patients, medications, readings.
+    """
+    anchor = np.datetime64(anchor, "m")
+    idx = np.arange(start, start + count)
+    ids = np.char.add("PT", (1000 + idx).astype(str))
+
+    patients = pd.DataFrame({
+        "id": ids,
+        "name": np.char.add("Patient ", (idx + 1).astype(str)),
+        "age": rng.integers(20, 86, size=count),
+    })
+
+    # --- Medications: 3-5 distinct drugs per patient, 2-4 schedule times each ---
+    med_counts = rng.integers(meds[0], min(meds[1], len(MEDS)) + 1, size=count)
+    n_meds = int(med_counts.sum())
+    # first med_counts[i] drugs of a random permutation of the formulary per patient
+    drugs = np.argsort(rng.random((count, len(MEDS))), axis=1)[np.arange(len(MEDS)) < med_counts[:, None]]
+    time_counts = rng.integers(times[0], times[1] + 1, size=n_meds)
+    offsets = (
+        rng.integers(-24, 73, size=int(time_counts.sum())) * 60
+        + rng.choice(np.array([0, 15, 30, 45]), size=int(time_counts.sum()))
+    )
+    sched = _time_strings(anchor + offsets.astype("timedelta64[m]"))
+    # sorted, de-duplicated times per medication, serialized like storage does
+    per_med = np.split(sched, np.cumsum(time_counts)[:-1])
+    medications = pd.DataFrame({
+        "patient_id": np.repeat(ids, med_counts),
+        "name": np.array(MEDS)[drugs],
+        "dose": np.char.add(rng.integers(1, 3, size=n_meds).astype(str), " tablet(s)"),
+        "times": [json.dumps(sorted(set(t.tolist()))) for t in per_med],
+    })
+
+    # --- Readings ---
+    reading_counts = rng.integers(readings[0], readings[1] + 1, size=count)
+    n_readings = int(reading_counts.sum())
+    hours_ago = _unique_offsets(rng, reading_counts).astype("timedelta64[h]")
+    readings_df = pd.DataFrame({
+        "patient_id": np.repeat(ids, reading_counts),
+        "time": (anchor - hours_ago).astype("datetime64[s]"),
+        "hr": rng.integers(55, 111, size=n_readings).astype(np.int16),
+        "bp_sys": rng.integers(100, 151, size=n_readings).astype(np.int16),
+        "bp_dia": rng.integers(60, 96, size=n_readings).astype(np.int16),
+        "temp": np.round(rng.uniform(36.0, 38.2, size=n_readings), 1),
+    })
+
+    return {"patients": patients, "medications": medications, "readings": readings_df}
+
+
+def generate_bulk(n_patients, seed=DEFAULT_SEED, chunk_size=CHUNK_PATIENTS, anchor=DEFAULT_ANCHOR, **dist):
+    """
+    Yields chunks (see `generate_chunk`) covering `n_patients` patients.
+    Every chunk gets its own child seed, so chunk k is identical across runs.
+    """
+    seeds = np.random.SeedSequence(seed).spawn((n_patients + chunk_size - 1) // chunk_size)
+    for k, child in enumerate(seeds):
+        start = k * chunk_size
+        count = min(chunk_size, n_patients - start)
+        yield generate_chunk(np.random.default_rng(child), start, count, anchor, **dist)
+
+
+# --------------------------
+# WRITERS
+# --------------------------
+def write_csv(chunks, out_dir):
+    """Appends every chunk to patients.csv, medications.csv and readings.csv."""
+    os.makedirs(out_dir, exist_ok=True)
+    first = True
+    for chunk in chunks:
+        for table, df in chunk.items():
+            df.to_csv(
+                os.path.join(out_dir, f"{table}.csv"),
+                mode="w" if first else "a",
+                header=first,
+                index=False,
+            )
+        first = False
+        yield chunk
+
+
+def write_parquet(chunks, out_dir):
+    """Streams every chunk into one Parquet file per table (row group per chunk)."""
+    try:
+        import pyarrow as pa  # type: ignore
+        import pyarrow.parquet as pq  # type: ignore
+    except ImportError as exc:
+        raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow).") from exc
+
+    os.makedirs(out_dir, exist_ok=True)
+    writers = {}
+    try:
+        for chunk in chunks:
+            for table, df in chunk.items():
+                batch = pa.Table.from_pandas(df, preserve_index=False)
+                if table not in writers:
+                    writers[table] = pq.ParquetWriter(os.path.join(out_dir, f"{table}.parquet"), batch.schema)
+                writers[table].write_table(batch)
+            yield chunk
+    finally:
+        for w in writers.values():
+            w.close()
+
+
+def write_storage(chunks, storage):
+    """Writes every chunk straight into the app's SQLite storage."""
+    for chunk in chunks:
+        storage.save_frames(chunk["patients"], chunk["medications"], chunk["readings"])
+        yield chunk
+
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate seeded synthetic patients, medications and readings.")
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_PATIENTS)
+    parser.add_argument("--anchor", default=DEFAULT_ANCHOR, help="time treated as 'now' (YYYY-MM-DD HH:MM)")
+    parser.add_argument("--min-readings", type=int, default=5)
+    parser.add_argument("--max-readings", type=int, default=10)
+    parser.add_argument("--format", choices=["csv", "parquet", "db"], default="parquet")
+    parser.add_argument("--out", help="output directory for csv/parquet (default: data/) or database path for db")
+    args = parser.parse_args(argv)
+
+    chunks = generate_bulk(
+        args.patients,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        anchor=args.anchor,
+        readings=(args.min_readings, args.max_readings),
+    )
+    if args.format == "csv":
+        chunks = write_csv(chunks, args.out or "data")
+    elif args.format == "parquet":
+        chunks = write_parquet(chunks, args.out or "data")
+    else:
+        from storage import DB_PATH, Storage
+        chunks = write_storage(chunks, Storage(args.out or DB_PATH))
+
+    done = readings = 0
+    for chunk in chunks:
+        done += len(chunk["patients"])
+        readings += len(chunk["readings"])
+        print(f"{done}/{args.patients} patients, {readings} readings", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# dataset.py
+"""
+Process-wide patient dataset.
+
+All sessions read one `SharedDataset` (patients, roster index, vitals store,
+schedule index, cohort index) held by st.cache_resource, without copying it. A session's
+edits go into its own `SessionOverlay`. The overlay copies only the patients
+it changes (copy-on-write), so an idle session holds a few hundred bytes.
+On commit the overlay writes its changes to storage and merges them into the
+shared dataset, and every session then sees them.
+
+Each server process holds its own dataset. Every write to storage advances a
+change counter (Storage.versions), and get_dataset() compares the counters at
+most every SYNC_SECONDS, pulling the patients and readings that other
+processes wrote since, so all workers converge on the stored data.
+"""
+import json
+import time
+import threading
+import streamlit as st  # type: ignore
+from sample_data import generate_sample_patients
+from storage import get_storage
+from patient_index import PatientIndex
+from schedule_index import ScheduleIndex
+from cohorts import CohortIndex
+from vitals_store import METRICS
+
+
+SEED_PATIENTS = 25               # sample patients written into an empty database
+SYNC_SECONDS = 1.0               # minimum gap between change-counter checks
+
+
+def _placeholder(pid):
+    """A patient known only by id (as Storage.ensure_patients registers it)."""
+    return {"id": pid, "name": pid, "age": None, "medications": []}
+
+
+# --------------------------
+# SHARED DATASET
+# --------------------------
+class SharedDataset:
+    """
+    Read-mostly views over the stored patients; changed only through `merge`
+    and the add_* methods, which publish data already written to storage.
+    """
+
+    SHARED = True                    # session memory estimates skip it
+
+    def __init__(self, patients, store):
+        self.patient_index = PatientIndex(patients)
+        self.vitals_store = store
+        store.statistics()               # running per-patient stats, built once with the dataset
+        self.schedule_index = ScheduleIndex.build(patients, store)
+        self.cohorts = CohortIndex.build(patients, store)
+        self.version = 0
+        self.synced = None               # Storage.versions() the data is known to include
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._next_sync = 0.0
+
+    @classmethod
+    def load(cls, storage):
+        if not storage.has_patients():
+            storage.save_patients(generate_sample_patients(SEED_PATIENTS))
+        # counters first: a write landing during the load is pulled again by the next sync
+        versions = storage.versions()
+        data = cls(storage.load_patients(), storage.load_vitals_store())
+        data.synced = versions
+        return data
+
+    def get(self, pid):
+        return self.patient_index.get(pid)
+
+    def add_readings(self, readings):
+        """
+        Publishes persisted readings (a DataFrame of patient_id, time and the
+        vitals) into the shared store, so every session's statistics, cohorts
+        and tables include them without a reload. A reading for a (patient, time)
+        already held replaces it, as in storage. Returns the rows added or changed.
+        """
+        return self._add_rows(
+            readings["patient_id"].tolist(), readings["time"].to_numpy(),
+            {m: readings[m].to_numpy() for m in METRICS}
+        )
+
+    def _add_rows(self, pids, time, cols):
+        with self._lock:
+            for pid in dict.fromkeys(pids):
+                if self.get(pid) is None:            # registered by Storage.ensure_patients
+                    self.patient_index.add(_placeholder(pid))
+            return self.vitals_store.add_rows(pids, time, cols)
+
+    def add_medications(self, medications):
+        """
+        Publishes imported medications (a DataFrame like Storage.upsert_medications
+        takes): a medication replaces the patient's one of the same name, else it
+        is added.
+        """
+        changed = {}
+        for row in medications.to_dict("records"):
+            pid = row["patient_id"]
+            p = changed.get(pid)
+            if p is None:
+                base = self.get(pid) or _placeholder(pid)
+                p = changed[pid] = {**base, "medications": list(base["medications"])}
+            schedule = row.get("schedule")
+            med = {"name": row["name"], "dose": row["dose"], "times": json.loads(row["times"]),
+                   "schedule": schedule if isinstance(schedule, str) else None}
+            p["medications"] = [m for m in p["medications"] if m["name"] != med["name"]] + [med]
+        self.merge(changed.values())
+
+    def merge(self, patients):
+        """Publishes committed patient dicts (new objects, never mutated afterwards)."""
+        with self._lock:
+            for p in patients:
+                self.patient_index.add(p)
+                self.vitals_store.add_patient(p["id"], p["name"])    # no-op for known patients
+                self.schedule_index.set_medications(p["id"], p["medications"])
+                self.cohorts.update(p)
+            self.version += 1
+
+    def sync(self, storage):
+        """
+        Pulls the patients and readings other processes stored since the last
+        sync. Rows this process wrote come back too; publishing them again
+        changes nothing. One thread syncs at a time; the others skip.
+        """
+        now = time.monotonic()
+        if now < self._next_sync or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + SYNC_SECONDS
+            versions, seen = storage.versions(), self.synced
+            if seen is None:                     # built without load(): nothing to compare against
+                self.synced = versions
+                return
+            if versions["patients"] > seen["patients"]:
+                self.merge(storage.patients_since(seen["patients"], versions["patients"]))
+            if versions["readings"] > seen["readings"]:
+                self._add_rows(*storage.readings_since(seen["readings"], versions["readings"]))
+            self.synced = versions
+        finally:
+            self._sync_lock.release()
+
+
+# --------------------------
+# SESSION OVERLAY (COPY-ON-WRITE)
+# --------------------------
+class SessionOverlay:
+    """A session's uncommitted patient edits layered over the shared dataset."""
+
+    def __init__(self, shared):
+        self.shared = shared
+        self._changes = {}           # pid -> this session's private copy
+
+    def get(self, pid):
+        """The session's view of a patient: its own copy if edited, else the shared one."""
+        p = self._changes.get(pid)
+        return p if p is not None else self.shared.get(pid)
+
+    def edit(self, pid):
+        """Returns a private, mutable copy of the patient (copied on first edit)."""
+        p = self._changes.get(pid)
+        if p is None:
+            base = self.shared.get(pid)
+            p = self._changes[pid] = {
+                **base, "medications": [dict(m, times=list(m["times"])) for m in base["medications"]]
+            }
+        return p
+
+    @property
+    def dirty(self):
+        return len(self._changes)
+
+    def commit(self, storage):
+        """Writes the edited patients to storage, then merges them into the shared dataset."""
+        changed = list(self._changes.values())
+        if not changed:
+            return 0
+        storage.save_patients(changed)
+        self.shared.merge(changed)
+        self._changes.clear()
+        return len(changed)
+
+    def discard(self):
+        self._changes.clear()
+
+    def rebase(self, shared):
+        """Moves pending edits onto a reloaded dataset, dropping patients it no longer has."""
+        self.shared = shared
+        self._changes = {pid: p for pid, p in self._changes.items() if shared.get(pid) is not None}
+
+
+@st.cache_resource
+def _load_dataset():
+    return SharedDataset.load(get_storage())
+
+
+def get_dataset():
+    """
+    One dataset per server process, shared read-only by every session, first
+    caught up with what other processes stored.
+    """
+    data = _load_dataset()
+    data.sync(get_storage())
+    return data
+
+
+def session_overlay():
+    """This session's overlay, re-pointed at the current dataset if it was reloaded."""
+    shared = get_dataset()
+    overlay = st.session_state.get("overlay")
+    if overlay is None:
+        overlay = st.session_state.overlay = SessionOverlay(shared)
+    elif overlay.shared is not shared:
+        overlay.rebase(shared)
+    return overlay
@@ -0,0 +1,315 @@
+# doses.py
+"""
+Append-only dose event log with incremental adherence rollups.
+
+Every taken / late / skipped dose is appended to an in-memory buffer and
+written to storage in batches by a background flusher, and at exit. The
+adherence rollups per patient and per (patient, medication) are updated as
+each event arrives, so the adherence screens read counters instead of
+rescanning the history. Adherence is measured against the doses the
+medication schedules made due, so a dose nobody recorded counts as missed.
+
+Times are stored like readings: naive local times as epoch seconds read as
+UTC, so both tables share one convention.
+
+Each server process keeps its own log. get_dose_log() replays the events
+other processes stored since it last looked (at most every SYNC_SECONDS), so
+every worker's adherence figures include every recorded dose.
+"""
+import time
+import atexit
+import sqlite3
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np  # type: ignore
+import streamlit as st  # type: ignore
+from sample_data import TIME_FORMAT, _parse_time
+from storage import get_storage
+from recurrence import medication_doses
+from vitals_store import to_datetime64
+
+
+# --- Dose log settings ---
+STATUSES = ("taken", "late", "skipped")
+LATE_AFTER_MINUTES = 30          # doses taken later than this after schedule count as late
+FLUSH_SECONDS = 2.0
+FLUSH_BATCH = 500                # flush early once this many events are pending
+RECENT_EVENTS = 50               # per-patient history kept for display
+SYNC_SECONDS = 1.0               # minimum gap between checks for other processes' events
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(dt):
+    """Naive datetime -> epoch seconds read as UTC (the readings table's convention)."""
+    return int(to_datetime64([dt]).astype(np.int64)[0])
+
+
+def _from_epoch(seconds):
+    return _EPOCH + timedelta(seconds=seconds)
+
+
+def due_counts(medications, today=None, now=None):
+    """
+    Doses the medications made due (scheduled at or before now) on `today`
+    and in its ISO week, as (day, week). Only the week's window is expanded.
+    """
+    now = now or datetime.now()
+    day = datetime.combine(today or now.date(), datetime.min.time())
+    week = day - timedelta(days=day.weekday())
+    day_end, week_end = min(now, day + timedelta(days=1)), min(now, week + timedelta(days=7))
+    n_day = n_week = 0
+    for med in medications:
+        for t in medication_doses(med, week, week_end + timedelta(seconds=1)):
+            if t <= week_end:
+                n_week += 1
+                n_day += day <= t <= day_end
+    return n_day, n_week
+
+
+def classify(scheduled, taken_at):
+    """'taken' if within the grace period of the scheduled time, else 'late'."""
+    return "late" if taken_at - scheduled > timedelta(minutes=LATE_AFTER_MINUTES) else "taken"
+
+
+# --------------------------
+# ROLLUPS
+# --------------------------
+class Adherence:
+    """Running adherence counters for one patient or one patient's medication."""
+
+    __slots__ = ("daily", "weekly", "streak", "best_streak", "late_minutes", "on_record", "last")
+
+    def __init__(self):
+        self.daily = {}          # date -> [taken, late, skipped]
+        self.weekly = {}         # (iso year, iso week) -> [taken, late, skipped]
+        self.streak = 0          # consecutive doses not skipped, up to the latest event
+        self.best_streak = 0
+        self.late_minutes = 0.0  # total minutes after schedule over taken/late doses
+        self.on_record = 0       # taken + late doses
+        self.last = None         # latest event dict
+
+    def add(self, event):
+        scheduled = event["scheduled"]
+        slot = STATUSES.index(event["status"])
+        for table, key in ((self.daily, scheduled.date()), (self.weekly, scheduled.isocalendar()[:2])):
+            counts = table.get(key)
+            if counts is None:
+                counts = table[key] = [0, 0, 0]
+            counts[slot] += 1
+
+        if event["status"] == "skipped":
+            self.streak = 0
+        else:
+            self.streak += 1
+            self.best_streak = max(self.best_streak, self.streak)
+            self.on_record += 1
+            self.late_minutes += max(0.0, (event["recorded"] - scheduled).total_seconds() / 60)
+        self.last = event
+
+    @staticmethod
+    def _pct(counts, due=None):
+        """Taken + late over the doses due (or recorded, if more were recorded early)."""
+        counts = counts or (0, 0, 0)
+        total = max(sum(counts), due or 0)
+        return round(100.0 * (counts[0] + counts[1]) / total, 1) if total else None
+
+    def summary(self, today=None, due=(None, None)):
+        today = today or datetime.now().date()
+        return {
+            "today_pct": self._pct(self.daily.get(today), due[0]),
+            "week_pct": self._pct(self.weekly.get(today.isocalendar()[:2]), due[1]),
+            "streak": self.streak,
+            "best_streak": self.best_streak,
+            "avg_late_min": round(self.late_minutes / self.on_record, 1) if self.on_record else None,
+        }
+
+
+# --------------------------
+# DOSE LOG
+# --------------------------
+class DoseLog:
+    """
+    In-memory view of the dose event log plus a write-behind buffer.
+    Each scheduled dose counts once in the rollups; a repeated event for the
+    same dose is still logged but does not change adherence.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage
+        self._lock = threading.Lock()
+        self._pending = []
+        self._doses = {}                     # (pid, med, scheduled) -> status
+        self._by_patient = {}                # pid -> Adherence
+        self._by_medication = {}             # (pid, med) -> Adherence
+        self._recent = {}                    # pid -> deque of recent events
+        self.version = 0
+        self._seen = 0                       # highest stored event id replayed or written here
+        self._own = set()                    # ids above _seen that this process wrote
+        self._io = threading.Lock()          # orders flushes and syncs
+        self._next_sync = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- Loading / applying ---
+    def load(self, rows):
+        """
+        Replays stored (id, patient_id, medication, scheduled, recorded, status)
+        rows, skipping the events this process wrote itself.
+        """
+        with self._lock:
+            for event_id, pid, med, scheduled, recorded, status in rows:
+                self._seen = max(self._seen, event_id)
+                if event_id in self._own:
+                    self._own.discard(event_id)
+                    continue
+                self._apply({
+                    "patient_id": pid, "medication": med, "status": status,
+                    "scheduled": _from_epoch(scheduled),
+                    "recorded": _from_epoch(recorded),
+                })
+            self.version += 1
+
+    def sync(self):
+        """Replays the events other processes stored since the last sync."""
+        now = time.monotonic()
+        if self.storage is None or now < self._next_sync or not self._io.acquire(blocking=False):
+            return
+        try:
+            self._next_sync = now + SYNC_SECONDS
+            rows = list(self.storage.dose_events(after=self._seen))
+            if rows:
+                self.load(rows)
+        finally:
+            self._io.release()
+
+    def _apply(self, event):
+        key = (event["patient_id"], event["medication"], event["scheduled"])
+        recent = self._recent.get(event["patient_id"])
+        if recent is None:
+            recent = self._recent[event["patient_id"]] = deque(maxlen=RECENT_EVENTS)
+        recent.append(event)
+        if key in self._doses:
+            return
+        self._doses[key] = event["status"]
+        for table, rkey in ((self._by_patient, event["patient_id"]),
+                            (self._by_medication, (event["patient_id"], event["medication"]))):
+            rollup = table.get(rkey)
+            if rollup is None:
+                rollup = table[rkey] = Adherence()
+            rollup.add(event)
+
+    # --- Writes ---
+    def record(self, pid, medication, scheduled, status=None, at=None):
+        """
+        Logs a dose. `scheduled` is a datetime or 'YYYY-MM-DD HH:MM' string;
+        without `status` the dose counts as taken at `at` (now), late if past the grace period.
+        """
+        if isinstance(scheduled, str):
+            scheduled = _parse_time(scheduled)
+        at = at or datetime.now().replace(microsecond=0)
+        status = status or classify(scheduled, at)
+        if status not in STATUSES:
+            raise ValueError(f"Unknown dose status: {status}")
+
+        event = {"patient_id": pid, "medication": medication, "scheduled": scheduled,
+                 "recorded": at, "status": status}
+        with self._lock:
+            self._apply(event)
+            self._pending.append((pid, medication, _epoch(scheduled), _epoch(at), status))
+            self.version += 1
+            flush_now = len(self._pending) >= FLUSH_BATCH
+        if flush_now:
+            self.flush()
+        return event
+
+    def flush(self):
+        """Writes pending events to storage in one transaction."""
+        with self._io:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if rows and self.storage is not None:
+                try:
+                    ids = self.storage.append_dose_events(rows)
+                except sqlite3.Error:
+                    with self._lock:
+                        self._pending[:0] = rows     # keep them for the next attempt
+                    raise
+                with self._lock:
+                    if ids and ids[0] == self._seen + 1:
+                        self._seen = ids[-1]     # nothing from other processes in between
+                    else:
+                        self._own.update(ids)    # already applied; sync skips them
+
+    def start(self):
+        """Starts the background flusher (once)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="dose-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_SECONDS):
+            try:
+                self.flush()
+            except sqlite3.Error:
+                time.sleep(FLUSH_SECONDS)    # storage busy; events stay pending
+
+    # --- Queries (O(1) / O(recent)) ---
+    def status(self, pid, medication, scheduled):
+        if isinstance(scheduled, str):
+            scheduled = _parse_time(scheduled)
+        with self._lock:
+            return self._doses.get((pid, medication, scheduled))
+
+    def last_event(self, pid, medication):
+        with self._lock:
+            rollup = self._by_medication.get((pid, medication))
+            return rollup.last if rollup else None
+
+    def recent(self, pid):
+        """Latest events for a patient, newest first."""
+        with self._lock:
+            return list(reversed(self._recent.get(pid, ())))
+
+    def adherence(self, pid, medication=None, today=None, medications=None):
+        """
+        Adherence summary of a patient (or one of its medications). Pass the
+        patient's `medications` so today / this week are measured against the
+        doses they scheduled; without them only recorded doses count.
+        """
+        due = (None, None)
+        if medications is not None:
+            if medication is not None:
+                medications = [m for m in medications if m["name"] == medication]
+            due = due_counts(medications, today)
+        with self._lock:
+            rollup = (self._by_patient.get(pid) if medication is None
+                      else self._by_medication.get((pid, medication)))
+            return (rollup or Adherence()).summary(today, due)
+
+
+def format_time(dt):
+    return dt.strftime(TIME_FORMAT) if dt else "—"
+
+
+@st.cache_resource
+def _load_dose_log():
+    storage = get_storage()
+    log = DoseLog(storage)
+    log.load(storage.dose_events())
+    log.start()
+    return log
+
+
+def get_dose_log():
+    """
+    One dose log per process, replayed from storage once and then updated
+    incrementally, with the events other processes logged since.
+    """
+    log = _load_dose_log()
+    log.sync()
+    return log
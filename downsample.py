@@ -0,0 +1,123 @@
+# downsample.py
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+
+
+# --- Chart budget ---
+CHART_WIDTH = 900          # assumed plot width in pixels
+PX_PER_POINT = 3           # at most one point every few pixels per series
+MAX_POINTS = 500           # hard cap per series
+MINMAX_DENSITY = 8         # above this many raw points per slot, use min/max buckets
+
+
+def point_budget(width=CHART_WIDTH):
+    """Points a single series may send for a chart of `width` pixels."""
+    return max(3, min(MAX_POINTS, width // PX_PER_POINT))
+
+
+def _fmt_seconds(secs):
+    minutes = secs / 60
+    if minutes < 60:
+        return f"{minutes:.0f} min"
+    if minutes < 48 * 60:
+        return f"{minutes / 60:.1f} h"
+    return f"{minutes / 1440:.1f} d"
+
+
+# --------------------------
+# ALGORITHMS
+# --------------------------
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: returns indices of `n_out` points that keep
+    the visual shape of (x, y). x must be sorted ascending.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+
+def minmax_buckets(t, y, n_buckets):
+    """Indices of the min and max point inside each of `n_buckets` equal time buckets."""
+    t = np.asarray(t, dtype=np.float64)
+    span = t[-1] - t[0]
+    if span <= 0:
+        return np.array([int(np.argmin(y)), int(np.argmax(y))])
+    bucket = np.minimum(((t - t[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    frame = pd.DataFrame({"b": bucket, "y": y})
+    grouped = frame.groupby("b")["y"]
+    return np.unique(np.concatenate([grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy()]))
+
+
+# --------------------------
+# SERIES DOWNSAMPLING
+# --------------------------
+def downsample_series(df, value, group="patient_id", time="time", width=CHART_WIDTH, time_range=None):
+    """
+    Caps every series (one per `group`, a unique key such as the patient id)
+    at the chart's point budget.
+
+    `time_range` is the chart's visible (start, end); only points inside it
+    are kept, so zooming in lowers the bucket size. The method depends on how
+    many raw points fall into each pixel slot of that range: a few -> LTTB
+    (keeps the line's shape), many -> min/max per time bucket (keeps spikes).
+    Adds a `bucket` column describing the aggregation, for tooltips.
+    """
+    if time_range is not None:
+        start, end = time_range
+        df = df[(df[time] >= start) & (df[time] <= end)]
+    budget = point_budget(width)
+
+    parts = []
+    for _, g in df.groupby(group, sort=False):
+        g = g.sort_values(time, kind="stable").reset_index(drop=True)
+        n = len(g)
+        if n <= budget:
+            parts.append(g.assign(bucket="raw"))
+            continue
+        t = g[time].to_numpy().astype("datetime64[s]").astype(np.int64)
+        y = g[value].to_numpy()
+        span = float(t[-1] - t[0])
+        if n / budget > MINMAX_DENSITY:
+            n_buckets = budget // 2
+            keep = minmax_buckets(t, y, n_buckets)
+            label = f"{_fmt_seconds(span / n_buckets)} min/max"
+        else:
+            keep = lttb(t, y, budget)
+            label = f"~{_fmt_seconds(span / budget)} LTTB"
+        parts.append(g.iloc[keep].assign(bucket=label))
+
+    if not parts:
+        return df.assign(bucket=pd.Series(dtype=object))
+    return pd.concat(parts, ignore_index=True)
+
+
+def bucket_events(df, group, time="time", width=CHART_WIDTH):
+    """
+    Downsamples point events (no value axis) by counting them per (group, time bucket).
+    Small inputs pass through with count 1 and bucket 'raw'.
+    """
+    budget = point_budget(width)
+    df = df.assign(**{time: pd.to_datetime(df[time])})
+    if df.empty or df.groupby(group).size().max() <= budget:
+        return df.assign(count=1, bucket="raw")
+    t0, t1 = df[time].min(), df[time].max()
+    size = max(((t1 - t0) / budget).ceil("min"), pd.Timedelta(minutes=1))
+    binned = df.assign(**{time: t0 + ((df[time] - t0) // size) * size})
+    out = binned.groupby([group, time]).size().reset_index(name="count")
+    return out.assign(bucket=_fmt_seconds(size.total_seconds()))
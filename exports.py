@@ -0,0 +1,337 @@
+# exports.py
+"""
+Background report / export jobs.
+
+A report is a generator of DataFrame chunks covering a bounded group of
+patients at a time: combined vitals, per-patient aggregations or missed
+doses. A writer streams each chunk to disk as it arrives (CSV, Parquet or
+HTML), so memory stays flat whatever the ward size. Jobs run on a small
+thread pool, not on a Streamlit script thread. They report progress per
+chunk, can be cancelled between chunks, and leave a file that the export
+panel offers through st.download_button. The file is read only when the
+user clicks the button.
+"""
+import os
+import html
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+import streamlit as st  # type: ignore
+from recurrence import dose_stream
+from vitals_stats import stats_columns
+
+
+# --- Export settings ---
+EXPORT_DIR = os.environ.get("HEALTH_EXPORT_DIR", "exports")
+EXPORT_WORKERS = int(os.environ.get("HEALTH_EXPORT_WORKERS", 2))
+CHUNK_PATIENTS = 500             # patients per chunk: bounds memory and time between progress/cancel checks
+YIELD_SECONDS = 0.005            # pause between chunks so page scripts get the GIL
+MAX_JOBS = 50                    # finished jobs kept (with their files) per process
+MISSED_LOOKBACK = timedelta(days=7)
+JOB_REFRESH = 1.0                # seconds between progress refreshes while jobs run
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+# --------------------------
+# REPORTS (CHUNK GENERATORS)
+# --------------------------
+def _chunks(pids, size=CHUNK_PATIENTS):
+    for i in range(0, len(pids), size):
+        yield pids[i:i + size]
+
+
+def vitals_report(data, pids, log=None):
+    """Every reading of the patients: patient_id, patient, time, hr, bp_sys, bp_dia, temp."""
+    store = data.vitals_store.snapshot()          # rows as of the job's start
+    for chunk in _chunks([pid for pid in pids if pid in store]):
+        yield store.frame(chunk)
+
+
+def aggregations_report(data, pids, log=None):
+    """Per-patient count, mean, std, min, max, p50 and p95 of each vital (from the running statistics)."""
+    store = data.vitals_store
+    for chunk in _chunks([pid for pid in pids if pid in store]):
+        frame = pd.DataFrame({"patient_id": chunk, "patient": [store.name(pid) for pid in chunk]}
+                             | stats_columns(store, chunk))
+        yield frame.round(2)
+
+
+def missed_doses_report(data, pids, log, lookback=MISSED_LOOKBACK):
+    """Doses due in the lookback window that were skipped or never recorded."""
+    now = datetime.now()
+    for chunk in _chunks(pids):
+        rows = []
+        for pid in chunk:
+            patient = data.get(pid)
+            if patient is None:
+                continue
+            for due, med in dose_stream(patient["medications"], now - lookback, now):
+                status = log.status(pid, med["name"], due)
+                if status is None or status == "skipped":
+                    rows.append({"patient_id": pid, "patient": patient["name"], "medication": med["name"],
+                                 "dose": med["dose"], "scheduled": due, "status": status or "missed"})
+        yield pd.DataFrame(rows, columns=["patient_id", "patient", "medication", "dose", "scheduled", "status"])
+
+
+REPORTS = {
+    "Combined vitals": ("vitals", vitals_report),
+    "Aggregations": ("aggregations", aggregations_report),
+    "Missed doses": ("missed_doses", missed_doses_report),
+}
+
+
+# --------------------------
+# STREAMING WRITERS
+# --------------------------
+class CsvWriter:
+    mime = "text/csv"
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._header = True
+
+    def write(self, df):
+        df.to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """One row group per chunk; later chunks are cast to the first chunk's schema."""
+    mime = "application/vnd.apache.parquet"
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa  # type: ignore
+            import pyarrow.parquet as pq  # type: ignore
+        except ImportError as exc:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow).") from exc
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self._writer = None
+
+    def write(self, df):
+        if df.empty:
+            return
+        if self._writer is None:
+            table = self._pa.Table.from_pandas(df, preserve_index=False)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class HtmlWriter:
+    """A standalone HTML table written row by row (no full-table render)."""
+    mime = "text/html"
+
+    def __init__(self, path, title="Export"):
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write(
+            f"<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>{html.escape(title)}</title>"
+            "<style>table{border-collapse:collapse;font-family:sans-serif;font-size:13px}"
+            "td,th{border:1px solid #ccc;padding:2px 6px}</style></head><body>\n"
+        )
+        self._columns = None
+
+    def write(self, df):
+        if self._columns is None:
+            self._columns = list(df.columns)
+            head = "".join(f"<th>{html.escape(str(c))}</th>" for c in self._columns)
+            self._file.write(f"<table>\n<thead><tr>{head}</tr></thead>\n<tbody>\n")
+        for row in df.itertuples(index=False, name=None):
+            self._file.write("<tr>" + "".join(f"<td>{html.escape(str(v))}</td>" for v in row) + "</tr>\n")
+
+    def close(self):
+        if self._columns is not None:
+            self._file.write("</tbody>\n</table>\n")
+        self._file.write("</body></html>\n")
+        self._file.close()
+
+
+WRITERS = {"csv": CsvWriter, "parquet": ParquetWriter, "html": HtmlWriter}
+
+
+# --------------------------
+# JOBS
+# --------------------------
+class ExportJob:
+    """One export: its parameters, live progress and, once done, the output file."""
+
+    def __init__(self, owner, report, fmt, pids):
+        self.id = uuid.uuid4().hex[:12]
+        self.owner = owner
+        self.report = report
+        self.fmt = fmt
+        self.pids = list(pids)
+        self.status = QUEUED
+        self.progress = 0.0
+        self.rows = 0
+        self.error = None
+        self.created = datetime.now()
+        self.finished = None
+        slug = REPORTS[report][0]
+        self.file_name = f"{slug}_{self.created:%Y%m%d_%H%M%S}.{fmt}"
+        self.path = os.path.join(EXPORT_DIR, f"{self.id}_{self.file_name}")
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def active(self):
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def mime(self):
+        return WRITERS[self.fmt].mime
+
+    def read(self):
+        """The finished file's bytes (called by st.download_button only when clicked)."""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ExportManager:
+    """Job queue on a bounded thread pool, shared by every session of the process."""
+
+    def __init__(self, workers=EXPORT_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="export")
+        self._lock = threading.Lock()
+        self._jobs = {}                      # id -> ExportJob, oldest first
+
+    def submit(self, owner, report, fmt, pids, data, log):
+        """Queues an export of `pids` from a snapshot of the shared dataset; returns the job."""
+        if report not in REPORTS or fmt not in WRITERS:
+            raise ValueError(f"Unknown export: {report} / {fmt}")
+        job = ExportJob(owner, report, fmt, pids)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        job.future = self._pool.submit(self._run, job, data, log)
+        return job
+
+    def _run(self, job, data, log):
+        if job.cancel_event.is_set():
+            return
+        job.status = RUNNING
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        total = max(1, -(-len(job.pids) // CHUNK_PATIENTS))
+        writer = None
+        try:
+            writer = WRITERS[job.fmt](job.path)
+            for i, chunk in enumerate(REPORTS[job.report][1](data, job.pids, log)):
+                if job.cancel_event.is_set():
+                    break
+                writer.write(chunk)
+                job.rows += len(chunk)
+                job.progress = min(1.0, (i + 1) / total)
+                time.sleep(YIELD_SECONDS)
+        except Exception as exc:             # surfaced to the user in the job list
+            job.error = str(exc) or type(exc).__name__
+        finally:
+            if writer is not None:
+                writer.close()
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+        elif job.error is not None:
+            job.status = FAILED
+        else:
+            job.status, job.progress = DONE, 1.0
+        if job.status != DONE:
+            self._remove_file(job)
+        job.finished = datetime.now()
+
+    def cancel(self, job_id):
+        """Stops a job: a queued job never starts, a running one stops before its next chunk."""
+        job = self._jobs.get(job_id)
+        if job is None or not job.active:
+            return
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status, job.finished = CANCELLED, datetime.now()
+
+    def jobs(self, owner):
+        """The owner's jobs, newest first."""
+        with self._lock:
+            return [j for j in reversed(self._jobs.values()) if j.owner == owner]
+
+    def _evict(self):
+        finished = [j for j in self._jobs.values() if not j.active]
+        for job in finished[:max(0, len(self._jobs) - MAX_JOBS)]:
+            del self._jobs[job.id]
+            self._remove_file(job)
+
+    @staticmethod
+    def _remove_file(job):
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+
+
+@st.cache_resource
+def get_exports():
+    """One export pool and job table per server process."""
+    return ExportManager()
+
+
+# --------------------------
+# UI
+# --------------------------
+def export_panel(data, sel_ids, owner):
+    """Form to queue an export of the selected or all patients, and the owner's job list."""
+    from doses import get_dose_log
+
+    with st.form("export_form", border=False):
+        c1, c2, c3 = st.columns(3)
+        report = c1.selectbox("Report", list(REPORTS), key="export_report")
+        fmt = c2.selectbox("Format", list(WRITERS), key="export_format")
+        scope = c3.radio("Patients", ("Selected", "All"), horizontal=True, key="export_scope")
+        submitted = st.form_submit_button("Start export")
+    if submitted:
+        pids = sel_ids if scope == "Selected" else data.patient_index.ids
+        get_exports().submit(owner, report, fmt, pids, data, get_dose_log())
+
+    # Refresh on a timer only while this user has jobs in flight
+    active = any(j.active for j in get_exports().jobs(owner))
+    st.fragment(_job_list, run_every=JOB_REFRESH if active else None)(owner)
+
+
+def _job_list(owner):
+    jobs = get_exports().jobs(owner)
+    if not jobs:
+        st.caption("No exports yet.")
+        return
+    for job in jobs:
+        c1, c2 = st.columns([4, 1])
+        label = f"**{job.report}** · {job.fmt.upper()} · {len(job.pids):,} patients · {job.created:%H:%M:%S}"
+        with c1:
+            if job.active:
+                st.progress(job.progress, text=f"{label} — {job.status}, {job.rows:,} rows")
+            elif job.status == DONE:
+                st.write(f"{label} — ✅ {job.rows:,} rows")
+            elif job.status == FAILED:
+                st.write(f"{label} — ❌ failed: {job.error}")
+            else:
+                st.write(f"{label} — cancelled")
+        with c2:
+            if job.active:
+                st.button("Cancel", key=f"export_cancel_{job.id}", on_click=get_exports().cancel, args=(job.id,))
+            elif job.status == DONE and os.path.exists(job.path):
+                st.download_button("Download", job.read, file_name=job.file_name, mime=job.mime,
+                                   key=f"export_download_{job.id}", on_click="ignore")
+    # the last job just finished: rerun once without the refresh timer
+    if not any(j.active for j in jobs) and st.session_state.get("export_polling"):
+        st.session_state.export_polling = False
+        st.rerun()
+    st.session_state.export_polling = any(j.active for j in jobs)
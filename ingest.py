@@ -0,0 +1,279 @@
+# ingest.py
+"""
+Chunked bulk import of vitals and medication files (CSV, JSON lines, Parquet).
+
+Files are read in bounded-size chunks; every chunk is validated and
+normalized with vectorized operations, deduplicated on (patient id, time)
+and upserted into storage before the next chunk is read, so the raw file is
+never held in memory. When the app imports, the cleaned rows (compact typed
+columns, which the in-memory dataset holds anyway) are published into it
+once, after the last chunk; corrected readings replace the stored ones
+there as they do in storage.
+
+    python ingest.py readings.csv --kind vitals
+    python ingest.py meds.jsonl --kind medications --chunk-size 50000
+"""
+import os
+import json
+import argparse
+import pandas as pd  # type: ignore
+import streamlit as st  # type: ignore
+from sample_data import parse_times, TIME_FORMAT
+from recurrence import Recurrence
+from vitals_store import METRICS
+
+
+# --- Import settings ---
+CHUNK_ROWS = 100_000
+FORMATS = ("csv", "jsonl", "parquet")
+KINDS = ("vitals", "medications")
+
+VITALS_COLUMNS = ("patient_id", "time") + METRICS
+MEDICATION_COLUMNS = ("patient_id", "name", "dose", "times")     # plus an optional "schedule"
+
+# Plausible ranges; readings outside them are rejected as device/entry errors
+VALID_RANGES = {
+    "hr": (20, 250),
+    "bp_sys": (50, 260),
+    "bp_dia": (30, 160),
+    "temp": (30.0, 45.0),
+}
+
+
+def detect_format(name):
+    ext = os.path.splitext(name)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    return "csv"
+
+
+# --------------------------
+# CHUNKED READERS
+# --------------------------
+def read_chunks(source, fmt, chunk_rows=CHUNK_ROWS):
+    """Yields DataFrames of at most `chunk_rows` rows from a path or file-like object."""
+    if fmt == "csv":
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype={"patient_id": str})
+    elif fmt == "jsonl":
+        yield from pd.read_json(source, lines=True, chunksize=chunk_rows, dtype={"patient_id": str})
+    elif fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq  # type: ignore
+        except ImportError as exc:
+            raise RuntimeError("Parquet import needs pyarrow (pip install pyarrow).") from exc
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+# --------------------------
+# VALIDATION & NORMALIZATION
+# --------------------------
+def _require(df, columns):
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+
+def normalize_vitals(df):
+    """
+    Returns (clean, rejected): typed readings with parsed timestamps, rows with
+    unparseable or out-of-range values dropped, deduplicated on (patient_id, time)
+    keeping the last occurrence.
+    """
+    _require(df, VITALS_COLUMNS)
+    out = pd.DataFrame({
+        "patient_id": df["patient_id"].astype("string").str.strip(),
+        "time": parse_times(df["time"]).dt.floor("s"),
+    })
+    valid = out["patient_id"].notna() & (out["patient_id"] != "") & out["time"].notna()
+    for m, (lo, hi) in VALID_RANGES.items():
+        out[m] = pd.to_numeric(df[m], errors="coerce")
+        valid &= out[m].between(lo, hi)
+
+    clean = out[valid].drop_duplicates(["patient_id", "time"], keep="last")
+    clean = clean.astype({"hr": "int16", "bp_sys": "int16", "bp_dia": "int16", "temp": "float64"})
+    return clean, int(len(df) - len(clean))
+
+
+def _split_times(value):
+    """A medication's raw `times` cell as a list of strings."""
+    if isinstance(value, str):
+        value = value.strip()
+        return json.loads(value) if value.startswith("[") else value.split(";")
+    return list(value) if value is not None else []
+
+
+def _normalize_times(times):
+    """Parses every medication's times in one vectorized pass -> sorted JSON lists."""
+    exploded = times.map(_split_times).explode()
+    parsed = parse_times(exploded.astype("string").str.strip())
+    formatted = pd.Series(parsed.dt.strftime(TIME_FORMAT).to_numpy(), index=exploded.index).dropna()
+    grouped = formatted.groupby(level=0).agg(lambda ts: json.dumps(sorted(set(ts))))
+    return grouped.reindex(times.index, fill_value="[]")
+
+
+def _normalize_schedule(value):
+    """A recurrence rule in canonical form, or None if the cell is empty or not a valid rule."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        return str(Recurrence.parse(value))
+    except ValueError:
+        return None
+
+
+def normalize_medications(df):
+    """
+    Returns (clean, rejected) medications; `times` may be a JSON list or ';'-separated.
+    A medication needs one-off times, a valid `schedule` rule, or both.
+    """
+    _require(df, MEDICATION_COLUMNS)
+    schedule = df["schedule"] if "schedule" in df else pd.Series(None, index=df.index, dtype=object)
+    out = pd.DataFrame({
+        "patient_id": df["patient_id"].astype("string").str.strip(),
+        "name": df["name"].astype("string").str.strip(),
+        "dose": df["dose"].astype("string").fillna(""),
+        "times": _normalize_times(df["times"].fillna("")),
+        "schedule": schedule.map(_normalize_schedule, na_action="ignore").astype(object),
+    })
+    bad_rule = schedule.notna() & schedule.astype("string").str.strip().ne("") & out["schedule"].isna()
+    valid = (out["patient_id"].notna() & out["name"].notna() & ~bad_rule
+             & ((out["times"] != "[]") | out["schedule"].notna()))
+    clean = out[valid].drop_duplicates(["patient_id", "name"], keep="last")
+    return clean, int(len(df) - len(clean))
+
+
+# --------------------------
+# PIPELINE
+# --------------------------
+def ingest(source, storage, kind="vitals", fmt=None, chunk_rows=CHUNK_ROWS, progress=None, dataset=None):
+    """
+    Streams `source` into storage chunk by chunk; returns totals
+    {"rows", "imported", "rejected", "chunks"}. With `dataset` (the app's
+    SharedDataset) the stored rows are also published into it in one write,
+    at the end (or when a chunk fails, up to the last stored chunk).
+
+    `progress(done_fraction_or_None, totals)` is called after each chunk; the
+    fraction is known when reading from a sized file object or a path.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    fmt = fmt or detect_format(getattr(source, "name", str(source)))
+    size = _size_of(source)
+    totals = {"rows": 0, "imported": 0, "rejected": 0, "chunks": 0}
+    stored = []                      # cleaned chunks already in storage, for the dataset
+
+    try:
+        for chunk in read_chunks(source, fmt, chunk_rows):
+            if kind == "vitals":
+                clean, rejected = normalize_vitals(chunk)
+                storage.ensure_patients(clean["patient_id"].unique().tolist())
+                storage.upsert_readings(clean)
+            else:
+                clean, rejected = normalize_medications(chunk)
+                storage.ensure_patients(clean["patient_id"].unique().tolist())
+                storage.upsert_medications(clean)
+            if dataset is not None:
+                stored.append(clean)
+
+            totals["rows"] += len(chunk)
+            totals["imported"] += len(clean)
+            totals["rejected"] += rejected
+            totals["chunks"] += 1
+            if progress is not None:
+                progress(_position(source, size), totals)
+    finally:
+        if stored:
+            _publish(dataset, kind, pd.concat(stored, ignore_index=True))
+    return totals
+
+
+def _publish(dataset, kind, clean):
+    """One write into the app's dataset; later chunks win, as they did in storage."""
+    if kind == "vitals":
+        dataset.add_readings(clean)
+    else:
+        dataset.add_medications(clean.drop_duplicates(["patient_id", "name"], keep="last"))
+
+
+def _size_of(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if hasattr(source, "size"):
+        return source.size
+    try:
+        return os.fstat(source.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _position(source, size):
+    """Fraction of a file object consumed so far, if it can be told."""
+    if not size or not hasattr(source, "tell"):
+        return None
+    try:
+        return min(1.0, source.tell() / size)
+    except (OSError, ValueError):
+        return None
+
+
+# --------------------------
+# UPLOAD UI
+# --------------------------
+def import_panel(storage, dataset=None):
+    """Streamlit upload form; returns the totals of a finished import, else None."""
+    kind = st.radio("Data type", KINDS, horizontal=True, key="import_kind")
+    upload = st.file_uploader(
+        "Vitals or medication file", type=["csv", "jsonl", "ndjson", "json", "parquet"], key="import_file"
+    )
+    if upload is None or not st.button("Import", key="import_run"):
+        return None
+
+    bar = st.progress(0.0, text="Starting import...")
+
+    def report(fraction, totals):
+        text = f"{totals['imported']:,} imported · {totals['rejected']:,} rejected · {totals['chunks']} chunks"
+        bar.progress(fraction if fraction is not None else 0.0, text=text)
+
+    try:
+        totals = ingest(upload, storage, kind=kind, fmt=detect_format(upload.name), progress=report,
+                        dataset=dataset)
+    except ValueError as exc:
+        st.error(f"Import failed: {exc}")
+        return None
+    bar.progress(1.0, text="Import finished.")
+    return totals
+
+
+# --------------------------
+# CLI
+# --------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import vitals or medication files into the app database.")
+    parser.add_argument("path")
+    parser.add_argument("--kind", choices=KINDS, default="vitals")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--db", help="database path (default: HEALTH_DB_PATH or health.db)")
+    args = parser.parse_args(argv)
+
+    from storage import DB_PATH, Storage
+    storage = Storage(args.db or DB_PATH)
+
+    def report(fraction, totals):
+        pct = f"{fraction:.0%} " if fraction is not None else ""
+        print(f"{pct}{totals['rows']:,} rows read, {totals['imported']:,} imported, "
+              f"{totals['rejected']:,} rejected", flush=True)
+
+    with open(args.path, "rb") as source:
+        totals = ingest(source, storage, kind=args.kind, fmt=args.format or detect_format(args.path),
+                        chunk_rows=args.chunk_size, progress=report)
+    print(f"Done: {totals['imported']:,} of {totals['rows']:,} rows imported in {totals['chunks']} chunks.")
+
+
+if __name__ == "__main__":
+    main()
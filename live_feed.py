@@ -0,0 +1,274 @@
+# live_feed.py
+"""
+Live vitals ingestion.
+
+An asyncio service on a background thread accepts readings as JSON lines on a
+local TCP socket (and/or from a simulated device feed) and writes them into
+fixed-size per-patient ring buffers. Pages read the buffers from
+`st.fragment(run_every=...)` panels, so only those panels refresh. Every
+FLUSH_SECONDS the buffered readings are persisted to storage and added to
+the shared vitals store (statistics, cohorts and tables).
+
+    {"patient_id": "PT1000", "time": "2025-01-01 10:00", "hr": 88, "bp_sys": 120, "bp_dia": 80, "temp": 36.9}
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+import streamlit as st  # type: ignore
+from vitals_store import METRICS, METRIC_DTYPES, to_datetime64
+from storage import get_storage
+from dataset import get_dataset
+
+
+# --- Feed settings ---
+FEED_HOST = os.environ.get("HEALTH_FEED_HOST", "127.0.0.1")
+FEED_PORT = int(os.environ.get("HEALTH_FEED_PORT", 8765))
+RING_CAPACITY = 512              # readings kept per patient
+FLUSH_SECONDS = 5.0              # how often buffered readings are persisted
+SIMULATE_INTERVAL = 1.0          # seconds between simulated reading rounds
+LIVE_REFRESH = "2s"              # how often live panels re-render
+
+
+# --------------------------
+# RING BUFFER
+# --------------------------
+class RingBuffer:
+    """Fixed-capacity columnar buffer of one patient's most recent readings."""
+
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.time = np.zeros(capacity, dtype=np.int64)       # epoch seconds
+        self.cols = {m: np.zeros(capacity, dtype=dt) for m, dt in METRIC_DTYPES.items()}
+        self.head = 0        # next write position
+        self.count = 0
+
+    def append(self, epoch, reading):
+        """Writes one reading. A missing or unrepresentable value raises before any column is written."""
+        values = {m: np.asarray(reading[m], dtype=self.cols[m].dtype) for m in METRICS}
+        i = self.head
+        self.time[i] = epoch
+        for m in METRICS:
+            self.cols[m][i] = values[m]
+        self.head = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def snapshot(self):
+        """Copies the buffer out oldest-first as a dict of arrays."""
+        order = (np.arange(self.count) + self.head - self.count) % self.capacity
+        out = {"time": self.time[order].astype("datetime64[s]")}
+        for m in METRICS:
+            out[m] = self.cols[m][order]
+        return out
+
+
+# --------------------------
+# FEED SERVICE
+# --------------------------
+class LiveFeed:
+    """
+    Owns the ring buffers and the asyncio loop that fills them.
+    `versions[pid]` increases with every reading, so panels can tell
+    whether anything changed for the patients they show.
+    """
+
+    def __init__(self, sink=None, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.buffers = {}
+        self.versions = {}
+        self.sink = sink                 # called with a DataFrame of readings to persist
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._simulating = {}            # pid -> token of the simulation driving it
+        self._listeners = []             # called with every published reading
+        self.server_error = None
+
+    # --- Writes (called on the feed loop) ---
+    def publish(self, reading):
+        """Adds one reading dict (patient_id, time, hr, bp_sys, bp_dia, temp)."""
+        pid = reading["patient_id"]
+        epoch = int(to_datetime64([reading["time"]]).astype(np.int64)[0])
+        with self._lock:
+            buf = self.buffers.get(pid)
+            if buf is None:
+                buf = self.buffers[pid] = RingBuffer(self.capacity)
+            buf.append(epoch, reading)
+            self.versions[pid] = self.versions.get(pid, 0) + 1
+            if self.sink is not None:
+                self._pending.append((pid, epoch) + tuple(reading[m] for m in METRICS))
+        for listener in self._listeners:
+            listener(reading)
+
+    def subscribe(self, listener):
+        """Registers a callback run (on the feed thread) for every new reading."""
+        self._listeners.append(listener)
+
+    def flush(self):
+        """Hands buffered readings to the sink in one batch."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if rows and self.sink is not None:
+            df = pd.DataFrame(rows, columns=("patient_id", "time") + METRICS)
+            df["time"] = df["time"].astype("datetime64[s]")
+            self.sink(df)
+
+    # --- Reads (called from script threads) ---
+    def version(self, pids):
+        with self._lock:
+            return tuple(self.versions.get(pid, 0) for pid in pids)
+
+    def snapshot(self, pid):
+        with self._lock:
+            buf = self.buffers.get(pid)
+            return buf.snapshot() if buf is not None else None
+
+    def frame(self, pids, names=None):
+        """Live readings of several patients as one DataFrame (patient, time, metrics)."""
+        parts = []
+        for pid in pids:
+            snap = self.snapshot(pid)
+            if snap is None or not len(snap["time"]):
+                continue
+            part = pd.DataFrame(snap)
+            part.insert(0, "patient", names(pid) if names else pid)
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=("patient", "time") + METRICS)
+        return pd.concat(parts, ignore_index=True)
+
+    # --- Service loop ---
+    def start(self, host=FEED_HOST, port=FEED_PORT):
+        """Starts the asyncio loop (socket server + flusher) on a daemon thread, once."""
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, args=(host, port), name="live-feed", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, host, port):
+        asyncio.set_event_loop(self._loop)
+        self._loop.create_task(self._serve(host, port))
+        self._loop.create_task(self._flusher())
+        self._loop.run_forever()
+
+    async def _serve(self, host, port):
+        try:
+            await asyncio.start_server(self._handle, host, port)
+        except OSError as exc:
+            # another worker already owns the port; simulated feeds still work
+            self.server_error = str(exc)
+
+    async def _handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    item = json.loads(line)
+                    for reading in item if isinstance(item, list) else [item]:
+                        self.publish(reading)
+                except (ValueError, KeyError, TypeError):
+                    continue
+        finally:
+            writer.close()
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            await asyncio.to_thread(self.flush)
+
+    # --- Simulated device feed ---
+    def simulate(self, pids):
+        """Starts simulated devices for `pids` (random-walk vitals each interval)."""
+        with self._lock:
+            new = [pid for pid in pids if pid not in self._simulating]
+            token = object()
+            for pid in new:
+                self._simulating[pid] = token
+        if new and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._simulate(new, token), self._loop)
+
+    def stop_simulation(self, pids=None):
+        with self._lock:
+            for pid in list(pids or self._simulating):
+                self._simulating.pop(pid, None)
+
+    async def _simulate(self, pids, token):
+        state = {pid: {"hr": 80, "bp_sys": 120, "bp_dia": 80, "temp": 36.8} for pid in pids}
+        while True:
+            # a device stops when it is switched off or taken over by a newer simulation
+            active = [pid for pid in pids if self._simulating.get(pid) is token]
+            if not active:
+                return
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            for pid in active:
+                last = state[pid]
+                last = state[pid] = {
+                    "hr": int(np.clip(last["hr"] + random.randint(-3, 3), 45, 140)),
+                    "bp_sys": int(np.clip(last["bp_sys"] + random.randint(-2, 2), 90, 170)),
+                    "bp_dia": int(np.clip(last["bp_dia"] + random.randint(-2, 2), 55, 105)),
+                    "temp": round(float(np.clip(last["temp"] + random.uniform(-0.1, 0.1), 35.5, 39.5)), 1),
+                }
+                self.publish({"patient_id": pid, "time": now, **last})
+            await asyncio.sleep(SIMULATE_INTERVAL)
+
+
+@st.cache_resource
+def get_live_feed():
+    """
+    One feed service per server process; readings are persisted to storage in
+    batches, then published into the shared dataset's store.
+    """
+    storage = get_storage()
+
+    def persist(readings):
+        storage.ensure_patients(readings["patient_id"].unique().tolist())
+        storage.upsert_readings(readings)
+        get_dataset().add_readings(readings)
+
+    feed = LiveFeed(sink=persist)
+    feed.start()
+    return feed
+
+
+# --------------------------
+# LIVE PANELS (FRAGMENTS)
+# --------------------------
+def _toggle_simulation(toggle_key, pids):
+    feed = get_live_feed()
+    if st.session_state[toggle_key]:
+        feed.simulate(pids)
+    else:
+        feed.stop_simulation(pids)
+
+
+def simulation_toggle(pids, key="live_simulate"):
+    """Switch for simulated devices on `pids`; only acts when this session flips it."""
+    on = st.toggle("Simulate device feed for selected patients", key=key,
+                   on_change=_toggle_simulation, args=(key, list(pids)))
+    if on:
+        get_live_feed().simulate(pids)   # picks up newly selected patients
+
+
+@st.fragment(run_every=LIVE_REFRESH)
+def live_vitals_panel(pids, names=None):
+    """
+    Latest live readings and a live HR chart for `pids`. Runs as a fragment:
+    it refreshes on its own timer without rerunning the rest of the page.
+    """
+    df = get_live_feed().frame(pids, names=names)
+    if df.empty:
+        st.info("No live readings for these patients yet. Start the simulated feed "
+                f"or send JSON lines to {FEED_HOST}:{FEED_PORT}.")
+        return
+
+    latest = df.sort_values("time").groupby("patient", sort=False).tail(1)
+    st.dataframe(latest.reset_index(drop=True), use_container_width=True)
+    st.line_chart(df, x="time", y="hr", color="patient", height=220)
+    st.caption(f"Live · refreshed {time.strftime('%H:%M:%S')}")
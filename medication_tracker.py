@@ -1,8 +1,52 @@
 import streamlit as st  # type: ignore
 import pandas as pd  # type: ignore
 import altair as alt  # type: ignore
-from datetime import datetime
-from sample_data import go_to, _parse_time
+from datetime import datetime, timedelta
+from sample_data import go_to, log_out, _parse_time, TIME_FORMAT
+from patient_index import patient_picker
+from downsample import bucket_events
+from profiler import span, fragment_span
+from doses import get_dose_log, format_time
+from dataset import get_dataset, session_overlay
+from storage import get_storage
+from recurrence import Recurrence, medication_doses, dose_stream, describe_medication
+
+
+DOSE_WINDOW = timedelta(hours=24)    # how far back unrecorded doses are offered
+TIMELINE_PAST = timedelta(hours=24)  # timeline window around now; recurring
+TIMELINE_AHEAD = timedelta(hours=72) # schedules are expanded only inside it
+
+
+def _pct(value):
+    return f"{value:.0f}%" if value is not None else "—"
+
+
+def _stage_medications(overlay, pid, edited):
+    """
+    Copies the edited medication rows into the session overlay (not yet saved).
+    Raises ValueError, before staging anything, if a row's recurrence rule is
+    invalid or a medication is listed twice (doses are logged per medication name).
+    """
+    meds = []
+    for row in edited.to_dict("records"):
+        name = str(row.get("Medication") or "").strip()
+        if not name:
+            continue
+        if any(m["name"] == name for m in meds):
+            raise ValueError(f"{name} is listed twice; merge its times into one row")
+        times = [_parse_time(t.strip()) for t in str(row.get("Times") or "").split(";")]
+        rule = str(row.get("Repeats") or "").strip()
+        try:
+            schedule = str(Recurrence.parse(rule)) if rule else None
+        except ValueError as exc:
+            raise ValueError(f"{name}: {exc}") from None
+        meds.append({
+            "name": name,
+            "dose": str(row.get("Dose") or ""),
+            "times": sorted({t.strftime(TIME_FORMAT) for t in times if t is not None}),
+            "schedule": schedule,
+        })
+    overlay.edit(pid)["medications"] = meds
 
 
 # --- Small top nav for logged-in pages ---
@@ -18,22 +62,149 @@ def top_nav_bar(title=""):
             unsafe_allow_html=True
         )
 
+    # Callbacks switch the page before the rerun, so one click costs one rerun
     with cols[1]:
-        if st.button("Dashboard", key="nav_dash"):
-            go_to("dashboard")
+        st.button("Dashboard", key="nav_dash", on_click=go_to, args=("dashboard",))
     with cols[2]:
-        if st.button("Medication", key="nav_med"):
-            go_to("medication")
+        st.button("Medication", key="nav_med", on_click=go_to, args=("medication",))
     with cols[3]:
-        if st.button("Profile", key="nav_profile"):
-            go_to("user_info")
+        st.button("Profile", key="nav_profile", on_click=go_to, args=("user_info",))
     with cols[4]:
-        if st.button("Schedule Tracker"):
-            go_to("schedule")
+        st.button("Schedule Tracker", key="nav_schedule", on_click=go_to, args=("schedule",))
     with cols[5]:
-        if st.button("Logout", key="nav_logout"):
-            st.session_state.current_user = None
-            go_to("auth")
+        st.button("Logout", key="nav_logout", on_click=log_out)
+
+
+@st.fragment
+def _dose_section(patient):
+    """Medication status, doses to record, dose history and adherence for one patient."""
+    with fragment_span("medication", "doses"):
+        _render_doses(patient)
+
+
+def _render_doses(patient):
+    log = get_dose_log()
+    now = datetime.now()
+
+    # Medication List (with Status) — status of each medication's latest dose due in the window
+    med_rows = []
+    due_doses = {}                   # (medication, time) -> med; the dose log keys doses the same way
+    for m in patient['medications']:
+        scheduled = list(medication_doses(m, now - DOSE_WINDOW, now + timedelta(hours=1)))
+        due = [t for t in scheduled if t <= now]
+        status = log.status(patient['id'], m['name'], due[-1]) if due else None
+        last = log.last_event(patient['id'], m['name'])
+        med_rows.append({
+            "Medication": m['name'],
+            "Dose": m['dose'],
+            "Schedule": describe_medication(m),
+            "Last taken": f"{format_time(last['recorded'])} ({last['status']})" if last else "—",
+            "Status": status.title() if status else ("Pending" if due else "Upcoming")
+        })
+        # doses from the last day (and the next hour) that have no event yet
+        for t in scheduled:
+            if log.status(patient['id'], m['name'], t) is None:
+                due_doses.setdefault((m['name'], t), m)
+
+    st.write("### Medication List (with Status)")
+    st.dataframe(pd.DataFrame(med_rows), use_container_width=True)
+
+    # Doses awaiting a taken / skipped record
+    st.write("### Doses to Record")
+    if due_doses:
+        for (_, t), m in sorted(due_doses.items(), key=lambda d: (d[0][1], d[0][0])):
+            c1, c2, c3 = st.columns([3, 1, 1])
+            c1.write(f"**{m['name']}** ({m['dose']}) — scheduled {t.strftime('%Y-%m-%d %H:%M')}")
+            c2.button("Mark taken", key=f"dose_take_{m['name']}_{t:%Y%m%d%H%M}",
+                      on_click=log.record, args=(patient['id'], m['name'], t))
+            c3.button("Skip", key=f"dose_skip_{m['name']}_{t:%Y%m%d%H%M}",
+                      on_click=log.record, args=(patient['id'], m['name'], t, "skipped"))
+    else:
+        st.success("No doses waiting to be recorded.")
+
+    # Dose history (append-only log, newest first)
+    st.write("### Dose History")
+    history = [
+        {"Medication": e['medication'], "Scheduled": format_time(e['scheduled']),
+         "Recorded": format_time(e['recorded']), "Status": e['status']}
+        for e in log.recent(patient['id'])
+    ]
+    if history:
+        st.dataframe(pd.DataFrame(history), use_container_width=True)
+    else:
+        st.info(f"👤 **Patient:** {patient['name']} — no doses recorded yet.")
+
+    # Adherence rollups (maintained incrementally by the dose log)
+    st.write("### Adherence")
+    overall = log.adherence(patient['id'], medications=patient['medications'])
+    st.caption(
+        f"Overall — today: {_pct(overall['today_pct'])} · this week: {_pct(overall['week_pct'])} · "
+        f"streak: {overall['streak']} (best {overall['best_streak']})"
+    )
+    adherence_rows = []
+    for m in patient['medications']:
+        a = log.adherence(patient['id'], m['name'], medications=patient['medications'])
+        adherence_rows.append({
+            "Medication": m['name'],
+            "Today": _pct(a['today_pct']),
+            "This week": _pct(a['week_pct']),
+            "Streak": a['streak'],
+            "Best streak": a['best_streak'],
+            "Avg. lateness (min)": a['avg_late_min'] if a['avg_late_min'] is not None else "—"
+        })
+    st.dataframe(pd.DataFrame(adherence_rows), use_container_width=True)
+
+
+@st.fragment
+def _med_editor(pid, patient):
+    """Medication table editor; typing reruns only this fragment."""
+    with fragment_span("medication", "edit"):
+        editor = pd.DataFrame(
+            [{"Medication": m['name'], "Dose": m['dose'], "Times": "; ".join(m['times']),
+              "Repeats": m.get('schedule') or ""}
+             for m in patient['medications']],
+            columns=["Medication", "Dose", "Times", "Repeats"]
+        )
+        edited = st.data_editor(editor, num_rows="dynamic", key=f"med_edit_{pid}", use_container_width=True)
+        # the buttons outside the fragment read the latest edits from here
+        st.session_state.med_edited = (pid, edited)
+
+
+def _apply_edits(overlay, pid):
+    owner, edited = st.session_state.get("med_edited", (None, None))
+    if owner != pid:
+        return
+    try:
+        _stage_medications(overlay, pid, edited)
+    except ValueError as exc:
+        st.session_state.med_edit_error = f"Invalid edit — {exc}"
+
+
+def _save_edits(overlay):
+    overlay.commit(get_storage())
+
+
+def _edit_section(overlay, pid, patient):
+    """
+    Editor plus Apply / Save / Discard. The buttons sit outside the editor's
+    fragment and act in callbacks, so a click costs one page run that already
+    shows the change.
+    """
+    with st.expander("✏️ Edit Medications"):
+        _med_editor(pid, patient)
+        e1, e2, e3 = st.columns(3)
+        # Edits stay in this session's overlay until saved
+        e1.button("Apply edits", key="med_apply", on_click=_apply_edits, args=(overlay, pid))
+        e2.button("Save", key="med_save", disabled=not overlay.dirty, on_click=_save_edits, args=(overlay,))
+        e3.button("Discard", key="med_discard", disabled=not overlay.dirty, on_click=overlay.discard)
+        st.caption("Times: one-off 'YYYY-MM-DD HH:MM' separated by ';'. Repeats: a rule such as "
+                   "DTSTART=20250101;FREQ=DAILY;BYHOUR=8,20;BYMINUTE=0;COUNT=60.")
+        error = st.session_state.pop("med_edit_error", None)
+        if error:
+            st.error(error)
+        if overlay.dirty:
+            st.caption(f"{overlay.dirty} patient(s) with unsaved changes.")
+
 
 # --- MEDICATION TRACKER PAGE ---
 def medication_page():
@@ -41,21 +212,17 @@ def medication_page():
     top_nav_bar("Medication Reminder & Tracker")
     st.write("")
 
-    patients = st.session_state.patients
+    data = get_dataset()
+    overlay = session_overlay()
+    index = data.patient_index
 
     # Patient selector and quick stats
     colp1, colp2 = st.columns([2, 1])
     with colp1:
-        sel = st.selectbox(
-            "Select patient",
-            [f"{p['id']} — {p['name']}" for p in patients],
-            index=0
-        )
-        patient_index = next(
-            i for i, p in enumerate(patients)
-            if f"{p['id']} — {p['name']}" == sel
-        )
-        patient = patients[patient_index]
+        pid = patient_picker(index, key="med_patient", label="Select patient")
+        if pid is None:
+            return
+        patient = overlay.get(pid)      # this session's unsaved edits, else the shared record
 
         st.markdown(
             f"<div class='card'><b>{patient['name']}</b> — Age: {patient['age']}</div>",
@@ -65,75 +232,37 @@ def medication_page():
     with colp2:
         st.write("**Quick Stats**")
         st.write(f"Med count: {len(patient['medications'])}")
-        st.write(f"Readings: {len(patient['readings'])}")
+        st.write(f"Readings: {data.vitals_store.count(patient['id'])}")
         st.markdown("</div>", unsafe_allow_html=True)
 
     st.write("---")
 
-    # Medication List (with Status)
-    med_rows = []
-    for m in patient['medications']:
-        med_rows.append({
-            "Medication": m['name'],
-            "Dose": m['dose'],
-            "Times": ", ".join(m['times']),
-            "Last taken": m['last_taken'] or "—",
-            "Status": "Taken" if m['last_taken'] else "Pending"
-        })
-
-    st.write("### Medication List (with Status)")
-    st.dataframe(pd.DataFrame(med_rows), use_container_width=True)
-
-    st.write("---")
+    # Fragment: recording a dose reruns only the dose sections
+    _dose_section(patient)
 
-    # Medications Already Taken
-    st.write("### Medications Already Taken")
-
-    taken_rows = []
-    now = datetime.now()
-
-    for i, m in enumerate(patient['medications']):
-        if m['last_taken']:
-            taken_rows.append({
-                "Medication": m['name'],
-                "Dose": m['dose'],
-                "Times": ", ".join(m['times']),
-                "Taken at": m['last_taken']
-            })
-        else:
-            # ✅ Example taken data per patient
-            example_time = now.replace(hour=8 + i, minute=0).strftime("%Y-%m-%d %H:%M")
-            taken_rows.append({
-                "Medication": m['name'],
-                "Dose": m['dose'],
-                "Times": ", ".join(m['times']),
-                "Taken at": example_time
-            })
-
-    st.info(
-        f"👤 **Patient:** {patient['name']} — showing taken medications (sample times used where data is missing)."
-    )
-
-    df_taken = pd.DataFrame(taken_rows)
-    st.dataframe(df_taken, use_container_width=True)
+    _edit_section(overlay, pid, patient)
 
     st.write("---")
 
     # Timeline chart
     st.write("### Medication Schedule Timeline")
 
-    timeline = []
-    for m in patient['medications']:
-        for t in m['times']:
-            timeline.append({"med": m['name'], "time": t})
+    # Lazy, due-ordered stream over every medication; only the window is expanded
+    now = datetime.now()
+    timeline = [
+        {"med": m['name'], "time": t}
+        for t, m in dose_stream(patient['medications'], now - TIMELINE_PAST, now + TIMELINE_AHEAD)
+    ]
 
     if timeline:
-        df_t = pd.DataFrame(timeline)
-        chart = alt.Chart(df_t).mark_circle(size=90).encode(
-            x='time:T',
-            y=alt.Y('med:N', sort=alt.EncodingSortField(field='med')),
-            tooltip=['med', 'time']
-        ).properties(height=300)
+        # Dense schedules are counted per time bucket instead of sent point by point
+        with span("timeline_chart"):
+            df_t = bucket_events(pd.DataFrame(timeline), group="med")
+            chart = alt.Chart(df_t).mark_circle(size=90).encode(
+                x='time:T',
+                y=alt.Y('med:N', sort=alt.EncodingSortField(field='med')),
+                tooltip=['med', 'time', 'count', 'bucket']
+            ).properties(height=300)
 
         st.altair_chart(chart, use_container_width=True)
 
@@ -0,0 +1,169 @@
+# patient_index.py
+import math
+import threading
+from bisect import bisect_left, insort
+import streamlit as st  # type: ignore
+
+
+# --- Selector settings ---
+PAGE_SIZE = 50
+
+
+def patient_label(p):
+    return f"{p['id']} — {p['name']}"
+
+
+def _tokens(p):
+    """Searchable keys of a patient: id, full name and each word of the name."""
+    name = p["name"].lower()
+    return {p["id"].lower(), name, *name.split()}
+
+
+# --------------------------
+# PATIENT INDEX
+# --------------------------
+class PatientIndex:
+    """
+    Roster index shared by the pages.
+
+    - id -> patient and id -> label lookups are O(1) hash map reads
+    - prefix search runs on a sorted array of (token, id) keys (a flattened trie):
+      two binary searches find the matching range, so a query costs
+      O(log n + matches) instead of a scan over the roster
+    - one index is shared by every session; updates and searches hold a lock
+    """
+
+    def __init__(self, patients=()):
+        self.by_id = {}
+        self.labels = {}
+        self.ids = []            # roster order
+        self._order = {}         # id -> roster position
+        self._keys = []          # sorted (token, id)
+        self._next = 0
+        self._lock = threading.RLock()
+        for p in patients:
+            self.add(p)
+
+    # --- Maintenance ---
+    def add(self, p):
+        """Adds a patient, or re-indexes it if the id is already known."""
+        pid = p["id"]
+        with self._lock:
+            if pid in self.by_id:
+                self._drop_keys(self.by_id[pid])
+            else:
+                self.ids.append(pid)
+                self._order[pid] = self._next
+                self._next += 1
+            self.by_id[pid] = p
+            self.labels[pid] = patient_label(p)
+            for token in _tokens(p):
+                insort(self._keys, (token, pid))
+
+    def remove(self, pid):
+        with self._lock:
+            p = self.by_id.pop(pid, None)
+            if p is None:
+                return
+            self._drop_keys(p)
+            del self.labels[pid]
+            del self._order[pid]
+            self.ids.remove(pid)
+
+    def _drop_keys(self, p):
+        for token in _tokens(p):
+            i = bisect_left(self._keys, (token, p["id"]))
+            if i < len(self._keys) and self._keys[i] == (token, p["id"]):
+                del self._keys[i]
+
+    # --- Lookups ---
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, pid):
+        return pid in self.by_id
+
+    def get(self, pid):
+        return self.by_id.get(pid)
+
+    def label(self, pid):
+        return self.labels[pid]
+
+    def search(self, query, offset=0, limit=PAGE_SIZE):
+        """
+        Returns (page of ids, total matches) for a name/id prefix query, in roster order.
+        An empty query pages through the whole roster.
+        """
+        q = query.strip().lower()
+        with self._lock:
+            if not q:
+                return self.ids[offset:offset + limit], len(self.ids)
+            lo = bisect_left(self._keys, (q,))
+            hi = bisect_left(self._keys, (q + "\uffff",))
+            matches = sorted({pid for _, pid in self._keys[lo:hi]}, key=self._order.__getitem__)
+        return matches[offset:offset + limit], len(matches)
+
+
+# --------------------------
+# PAGED SEARCH SELECTOR
+# --------------------------
+def _set_page(page_key, page):
+    st.session_state[page_key] = page
+
+
+def patient_picker(index, key, label="Select patient", multi=False, default=(), page_size=PAGE_SIZE):
+    """
+    Search-driven, paged patient selector. Only the current page of labels
+    (plus anything already selected) is sent to the browser.
+
+    Returns a list of ids when `multi`, otherwise a single id (or None).
+    """
+    sel_key, page_key, query_key = f"{key}_selected", f"{key}_page", f"{key}_query"
+    if sel_key not in st.session_state:
+        st.session_state[sel_key] = list(default)
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    selected = [pid for pid in st.session_state[sel_key] if pid in index]
+
+    c_search, c_prev, c_page, c_next = st.columns([4, 1, 2, 1])
+    with c_search:
+        # a new query starts again from the first page
+        query = st.text_input(
+            "Search by name or ID", key=query_key,
+            on_change=_set_page, args=(page_key, 1)
+        )
+
+    page = st.session_state[page_key]
+    ids, total = index.search(query, offset=(page - 1) * page_size, limit=page_size)
+    pages = max(1, math.ceil(total / page_size))
+    if page > pages:
+        page = st.session_state[page_key] = pages
+        ids, total = index.search(query, offset=(page - 1) * page_size, limit=page_size)
+
+    with c_prev:
+        st.button("◀", key=f"{key}_prev", disabled=page <= 1,
+                  on_click=_set_page, args=(page_key, page - 1))
+    with c_page:
+        st.caption(f"Page {page} of {pages} · {total} patients")
+    with c_next:
+        st.button("▶", key=f"{key}_next", disabled=page >= pages,
+                  on_click=_set_page, args=(page_key, page + 1))
+
+    # options: current selection first, then this page's matches
+    chosen_set = set(selected)
+    options = selected + [pid for pid in ids if pid not in chosen_set]
+    # the widget key follows the option list, so a new page starts from the stored selection
+    widget_key = f"{key}_widget_{hash(tuple(options))}"
+
+    if multi:
+        chosen = st.multiselect(label, options, default=selected,
+                                format_func=index.label, key=widget_key)
+        st.session_state[sel_key] = chosen
+        return chosen
+
+    if not options:
+        st.info("No patients match this search.")
+        return None
+    chosen = st.selectbox(label, options, index=0, format_func=index.label, key=widget_key)
+    st.session_state[sel_key] = [chosen]
+    return chosen
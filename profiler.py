@@ -0,0 +1,231 @@
+# profiler.py
+"""
+Render profiler.
+
+`span(name)` times a block of a page render. Nested spans are recorded as
+"page/section" paths. Spans are aggregated per path (count, total, max)
+and kept as raw events for JSON-lines export. Reruns are counted per page,
+and the session's st.session_state footprint can be estimated on demand.
+
+Enable it with HEALTH_PROFILE=1, or from the admin debug panel (admins are
+listed in HEALTH_ADMIN_EMAILS, comma-separated). When it is off, `span()`
+returns a shared no-op context manager, so instrumentation costs one
+attribute check.
+"""
+import os
+import sys
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import streamlit as st  # type: ignore
+
+
+# --- Profiler settings ---
+ENABLED = os.environ.get("HEALTH_PROFILE") == "1"
+ADMIN_EMAILS = {e.strip() for e in os.environ.get("HEALTH_ADMIN_EMAILS", "").split(",") if e.strip()}
+MAX_EVENTS = 20_000              # raw span events kept for export
+_NOOP = nullcontext()
+
+
+def _session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx  # type: ignore
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def _fragment_rerun():
+    """True while only fragments (not the whole app script) are rerunning."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx  # type: ignore
+    ctx = get_script_run_ctx()
+    return bool(ctx is not None and ctx.fragment_ids_this_run)
+
+
+# --------------------------
+# MEMORY ESTIMATE
+# --------------------------
+def estimate_size(value, _seen=None):
+    """Approximate bytes held by a value: arrays/frames report their buffers, containers recurse."""
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if getattr(value, "SHARED", False):                 # process-wide data, not held by the session
+        return 0
+
+    usage = getattr(value, "memory_usage", None)
+    if callable(usage):                                  # DataFrame / Series
+        try:
+            total = usage(index=True, deep=True)
+            return int(total.sum()) if hasattr(total, "sum") else int(total)
+        except TypeError:
+            pass
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):                          # numpy arrays
+        return nbytes
+
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset, deque)):
+        size += sum(estimate_size(v, seen) for v in value)
+    elif hasattr(value, "__dict__"):                     # our index / store objects
+        size += estimate_size(vars(value), seen)
+    return size
+
+
+def session_memory():
+    """Estimated bytes per st.session_state key of the current session, largest first."""
+    sizes = {key: estimate_size(st.session_state[key]) for key in list(st.session_state.keys())}
+    return dict(sorted(sizes.items(), key=lambda kv: -kv[1]))
+
+
+# --------------------------
+# PROFILER
+# --------------------------
+class Profiler:
+    """Process-wide span statistics, rerun counters and an export buffer."""
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()      # per script thread: stack of open span names
+        self.stats = {}                      # path -> [count, total_ms, max_ms, last_ms]
+        self.reruns = {}                     # page -> count
+        self.events = deque(maxlen=MAX_EVENTS)
+
+    def span(self, name):
+        """Context manager timing `name` under the currently open span (no-op when disabled)."""
+        if not self.enabled:
+            return _NOOP
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(name)
+        path = "/".join(stack)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            stack.pop()
+            self._record(path, ms)
+
+    def _record(self, path, ms):
+        event = {"ts": round(time.time(), 3), "session": _session_id(), "span": path, "ms": round(ms, 3)}
+        with self._lock:
+            entry = self.stats.get(path)
+            if entry is None:
+                entry = self.stats[path] = [0, 0.0, 0.0, 0.0]
+            entry[0] += 1
+            entry[1] += ms
+            entry[2] = max(entry[2], ms)
+            entry[3] = ms
+            self.events.append(event)
+
+    def count_rerun(self, page):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.reruns[page] = self.reruns.get(page, 0) + 1
+
+    # --- Reporting ---
+    def table(self):
+        """Span statistics as rows, slowest total first."""
+        with self._lock:
+            rows = [
+                {"span": path, "count": c, "total_ms": round(t, 1), "mean_ms": round(t / c, 2),
+                 "max_ms": round(m, 1), "last_ms": round(last, 1)}
+                for path, (c, t, m, last) in self.stats.items()
+            ]
+        return sorted(rows, key=lambda r: -r["total_ms"])
+
+    def export_jsonl(self):
+        """Raw span events followed by rerun counters, one JSON object per line."""
+        with self._lock:
+            lines = [json.dumps(e) for e in self.events]
+            lines += [json.dumps({"rerun_page": p, "count": n}) for p, n in self.reruns.items()]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.reruns.clear()
+            self.events.clear()
+
+
+# A plain module singleton rather than st.cache_resource: span() sits on hot
+# paths and must stay a single attribute check when profiling is off.
+_profiler = Profiler()
+
+
+def get_profiler():
+    return _profiler
+
+
+def span(name):
+    return _profiler.span(name)
+
+
+def fragment_span(page, name):
+    """
+    Span for a fragment body. In a full rerun it nests under the page span; when
+    only the fragment reruns it is counted as a rerun of its own, 'page/name'.
+    """
+    if not _profiler.enabled:
+        return _NOOP
+    if _fragment_rerun():
+        _profiler.count_rerun(f"{page}/{name}")
+        return _profiler.span(f"{page}/{name}")
+    return _profiler.span(name)
+
+
+def is_admin(email):
+    return email is not None and email in ADMIN_EMAILS
+
+
+# --------------------------
+# DEBUG PANEL (ADMIN ONLY)
+# --------------------------
+def _set_enabled():
+    _profiler.enabled = st.session_state.profiler_enabled
+
+
+def debug_panel():
+    """Profiler controls and results; renders nothing for non-admin users."""
+    if not is_admin(st.session_state.get("current_user")):
+        return
+    with st.expander("🛠 Render Profiler (admin)"):
+        st.toggle("Profiling enabled", value=_profiler.enabled, key="profiler_enabled", on_change=_set_enabled)
+
+        st.write("**Spans**")
+        rows = _profiler.table()
+        if rows:
+            st.dataframe(rows, use_container_width=True)
+        else:
+            st.caption("No spans recorded yet.")
+
+        st.write("**Reruns per page (page/fragment: fragment-only reruns)**")
+        st.json(dict(_profiler.reruns))
+
+        st.write("**Session state (estimated bytes)**")
+        memory = session_memory()
+        st.caption(f"Total ≈ {sum(memory.values()) / 1024:,.1f} KiB")
+        st.json(memory)
+
+        # KDF cost vs. login latency: raise HEALTH_SCRYPT_N while verify p95 stays acceptable
+        from credentials import get_credentials
+        st.write("**Password hashing (scrypt cost and timings)**")
+        st.json(get_credentials().metrics())
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Export JSON lines", _profiler.export_jsonl(),
+                               file_name="profile.jsonl", mime="application/json")
+        with col2:
+            st.button("Reset", on_click=_profiler.reset)
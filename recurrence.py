@@ -0,0 +1,249 @@
+# recurrence.py
+"""
+Recurring medication schedules.
+
+A medication may carry a `schedule`: a subset of iCalendar RRULE written on
+one line, with DTSTART as one more key, e.g.
+
+    DTSTART=20250101T080000;FREQ=DAILY;BYHOUR=8,20;BYMINUTE=0;COUNT=60
+    DTSTART=20250101T060000;FREQ=HOURLY;INTERVAL=6;UNTIL=20250114T235900
+    DTSTART=20250106T090000;FREQ=WEEKLY;BYDAY=MO,TH
+
+Supported keys: FREQ (HOURLY, DAILY, WEEKLY), INTERVAL, BYDAY (WEEKLY only),
+BYHOUR / BYMINUTE (DAILY, WEEKLY), COUNT and UNTIL. A rule is never
+materialized. Occurrence n is computed arithmetically from its period and
+slot, so `occurrences(start, end)` jumps straight to the window and
+yields only what falls inside it. A 30-day or open-ended regimen costs
+nothing until it is viewed.
+"""
+import heapq
+import itertools
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+
+# --- Rule settings ---
+FREQS = {"HOURLY": 3600, "DAILY": 86400, "WEEKLY": 7 * 86400}
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+STAMP_FORMAT = "%Y%m%dT%H%M%S"
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def _stamp(value):
+    for fmt in (STAMP_FORMAT, "%Y%m%dT%H%M", "%Y%m%d"):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Bad date-time in schedule: {value!r}")
+
+
+def _ints(value, lo, hi, key):
+    out = sorted({int(v) for v in value.split(",")})
+    if not out or out[0] < lo or out[-1] > hi:
+        raise ValueError(f"{key} must be between {lo} and {hi}")
+    return out
+
+
+# --------------------------
+# RECURRENCE RULE
+# --------------------------
+class Recurrence:
+    """
+    Occurrences are anchor + k * period + slot, for k = 0, 1, ... and each
+    offset in `slots` (sorted seconds within one period). Slots of the first
+    period that fall before DTSTART are skipped. COUNT counts occurrences
+    from DTSTART on and UNTIL is inclusive.
+    """
+
+    __slots__ = ("dtstart", "freq", "interval", "byday", "byhour", "byminute", "count", "until",
+                 "anchor", "period", "slots", "skip")
+
+    def __init__(self, dtstart, freq="DAILY", interval=1, byday=None, byhour=None, byminute=None,
+                 count=None, until=None):
+        if freq not in FREQS:
+            raise ValueError(f"FREQ must be one of {', '.join(FREQS)}")
+        if interval < 1:
+            raise ValueError("INTERVAL must be at least 1")
+        if freq == "HOURLY" and (byhour or byminute or byday):
+            raise ValueError("HOURLY rules take no BYHOUR, BYMINUTE or BYDAY")
+        if byday and freq != "WEEKLY":
+            raise ValueError("BYDAY is only supported with FREQ=WEEKLY")
+        if count is not None and count < 1:
+            raise ValueError("COUNT must be at least 1")
+
+        self.dtstart = dtstart.replace(microsecond=0)
+        self.freq, self.interval = freq, interval
+        self.byday, self.byhour, self.byminute = byday, byhour, byminute
+        self.count, self.until = count, until
+
+        self.period = FREQS[freq] * interval
+        if freq == "HOURLY":
+            self.anchor, self.slots = self.dtstart, [0]
+        else:
+            hours = byhour or [self.dtstart.hour]
+            minutes = byminute or [self.dtstart.minute]
+            times = [h * 3600 + m * 60 for h in hours for m in minutes]
+            day = datetime.combine(self.dtstart.date(), datetime.min.time())
+            if freq == "DAILY":
+                self.anchor, days = day, [0]
+            else:
+                self.anchor = day - timedelta(days=day.weekday())
+                days = byday or [self.dtstart.weekday()]
+            self.slots = sorted(d * 86400 + t for d in days for t in times)
+        self.skip = bisect_left(self.slots, (self.dtstart - self.anchor).total_seconds())
+
+    # --- Parsing / formatting ---
+    @classmethod
+    def parse(cls, text):
+        """Builds a rule from its one-line text form; raises ValueError on anything unsupported."""
+        parts = {}
+        for item in text.strip().replace("RRULE:", "").replace("\n", ";").split(";"):
+            if not item.strip():
+                continue
+            key, sep, value = item.partition("=")
+            if not sep:
+                key, _, value = item.partition(":")          # DTSTART:... as in iCalendar
+            parts[key.strip().upper()] = value.strip().upper()
+        if "DTSTART" not in parts:
+            raise ValueError("Schedule needs a DTSTART")
+        unknown = set(parts) - {"DTSTART", "FREQ", "INTERVAL", "BYDAY", "BYHOUR", "BYMINUTE", "COUNT", "UNTIL"}
+        if unknown:
+            raise ValueError(f"Unsupported schedule keys: {', '.join(sorted(unknown))}")
+        try:
+            byday = [WEEKDAYS.index(d) for d in parts["BYDAY"].split(",")] if "BYDAY" in parts else None
+        except ValueError:
+            raise ValueError(f"BYDAY must list days from {','.join(WEEKDAYS)}") from None
+        return cls(
+            _stamp(parts["DTSTART"]),
+            freq=parts.get("FREQ", "DAILY"),
+            interval=int(parts.get("INTERVAL", 1)),
+            byday=sorted(set(byday)) if byday else None,
+            byhour=_ints(parts["BYHOUR"], 0, 23, "BYHOUR") if "BYHOUR" in parts else None,
+            byminute=_ints(parts["BYMINUTE"], 0, 59, "BYMINUTE") if "BYMINUTE" in parts else None,
+            count=int(parts["COUNT"]) if "COUNT" in parts else None,
+            until=_stamp(parts["UNTIL"]) if "UNTIL" in parts else None,
+        )
+
+    def __str__(self):
+        parts = [f"DTSTART={self.dtstart.strftime(STAMP_FORMAT)}", f"FREQ={self.freq}"]
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.byday:
+            parts.append("BYDAY=" + ",".join(WEEKDAYS[d] for d in self.byday))
+        if self.byhour:
+            parts.append("BYHOUR=" + ",".join(map(str, self.byhour)))
+        if self.byminute:
+            parts.append("BYMINUTE=" + ",".join(map(str, self.byminute)))
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.strftime(STAMP_FORMAT)}")
+        return ";".join(parts)
+
+    def describe(self):
+        """Short human-readable form, e.g. '08:00, 20:00 daily · 60 doses from 2025-01-01'."""
+        if self.freq == "HOURLY":
+            text = f"every {self.interval} h"
+        else:
+            times = sorted({(s % 86400) for s in self.slots})
+            text = ", ".join(f"{t // 3600:02d}:{t % 3600 // 60:02d}" for t in times)
+            once, many = {"DAILY": ("daily", "days"), "WEEKLY": ("weekly", "weeks")}[self.freq]
+            text += f" every {self.interval} {many}" if self.interval > 1 else f" {once}"
+            if self.byday:
+                text += " on " + ",".join(WEEKDAYS[d].title() for d in self.byday)
+        if self.count is not None:
+            text += f" · {self.count} doses"
+        elif self.until is not None:
+            text += f" · until {self.until:%Y-%m-%d}"
+        start = f"{self.dtstart:%Y-%m-%d %H:%M}" if self.freq == "HOURLY" else f"{self.dtstart:%Y-%m-%d}"
+        return f"{text} from {start}"
+
+    # --- Expansion ---
+    def _at(self, raw):
+        """The occurrence with raw index `raw` (slot number counted from the anchor)."""
+        k, slot = divmod(raw, len(self.slots))
+        return self.anchor + timedelta(seconds=k * self.period + self.slots[slot])
+
+    def _first_raw(self, start):
+        """Raw index of the first occurrence at or after `start`."""
+        offset = (start - self.anchor).total_seconds()
+        if offset <= 0:
+            return self.skip
+        k = int(offset // self.period)
+        slot = bisect_left(self.slots, offset - k * self.period)
+        return max(self.skip, k * len(self.slots) + slot)
+
+    def last(self):
+        """The final occurrence, or None for an open-ended rule."""
+        if self.count is not None:
+            last = self._at(self.skip + self.count - 1)
+            return min(last, self.until) if self.until is not None and last > self.until else last
+        return self.until
+
+    def occurrences(self, start, end):
+        """Yields occurrences with start <= t < end in order, without expanding anything before `start`."""
+        raw = self._first_raw(start)
+        stop = self.skip + self.count if self.count is not None else None
+        while stop is None or raw < stop:
+            t = self._at(raw)
+            if t >= end or (self.until is not None and t > self.until):
+                return
+            yield t
+            raw += 1
+
+
+@lru_cache(maxsize=4096)
+def parse_rule(text):
+    """Parsed (immutable) rule for a schedule string, or None for an empty one; cached per text."""
+    return Recurrence.parse(text) if text else None
+
+
+def daily(start, times, days=None):
+    """Rule for 'HH:MM' `times` every day from `start` (a date), for `days` days or open-ended."""
+    hours = sorted({int(t[:2]) for t in times})
+    minutes = sorted({int(t[3:5]) for t in times})
+    if len(hours) * len(minutes) != len(set(times)):
+        raise ValueError("times must share one set of minutes (BYHOUR x BYMINUTE)")
+    return Recurrence(datetime.combine(start, datetime.min.time()), byhour=hours, byminute=minutes,
+                      count=days * len(hours) * len(minutes) if days else None)
+
+
+# --------------------------
+# MEDICATION STREAMS
+# --------------------------
+def _explicit(med, start, end):
+    """One-off 'YYYY-MM-DD HH:MM' times of a medication inside the window (already sorted)."""
+    for value in med.get("times", ()):
+        try:
+            t = datetime.strptime(value, TIME_FORMAT)
+        except (TypeError, ValueError):
+            continue
+        if start <= t < end:
+            yield t
+
+
+def medication_doses(med, start, end):
+    """A medication's dose times inside [start, end): one-off times merged with its recurrence."""
+    rule = parse_rule(med.get("schedule"))
+    if rule is None:
+        return _explicit(med, start, end)
+    return heapq.merge(_explicit(med, start, end), rule.occurrences(start, end))
+
+
+def dose_stream(medications, start, end):
+    """Yields (time, medication) over all `medications` inside the window, in due-time order."""
+    streams = [
+        zip(medication_doses(m, start, end), itertools.repeat(m)) for m in medications
+    ]
+    return heapq.merge(*streams, key=lambda item: item[0])
+
+
+def describe_medication(med):
+    """The medication's schedule for display: the rule's description and/or its one-off times."""
+    rule = parse_rule(med.get("schedule"))
+    parts = [rule.describe()] if rule is not None else []
+    if med.get("times"):
+        parts.append(", ".join(med["times"]))
+    return "; ".join(parts) or "—"
@@ -0,0 +1,128 @@
+# result_cache.py
+import sys
+import threading
+from collections import OrderedDict
+import streamlit as st  # type: ignore
+
+
+# --- Cache limits ---
+MAX_ENTRIES = 256
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def _sizeof(value):
+    """
+    Rough in-memory size of a cached value. DataFrames count their object and
+    string columns in full; charts count the data they embed.
+    """
+    if isinstance(value, tuple):
+        return sum(_sizeof(v) for v in value)
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes
+    usage = getattr(value, "memory_usage", None)
+    if callable(usage):
+        try:
+            total = usage(index=True, deep=True)
+            return int(total.sum()) if hasattr(total, "sum") else int(total)
+        except TypeError:
+            pass
+    if _is_chart(value):
+        return sys.getsizeof(value) + _chart_data_size(value)
+    return sys.getsizeof(value)
+
+
+def _is_chart(value):
+    return type(value).__module__.startswith("altair.")
+
+
+def _chart_data_size(chart):
+    """Bytes of the DataFrames a chart (and its layers / concatenated parts) embeds."""
+    size = 0
+    data = getattr(chart, "data", None)
+    if callable(getattr(data, "memory_usage", None)):
+        size += _sizeof(data)
+    for part in ("layer", "hconcat", "vconcat", "concat"):
+        for sub in getattr(chart, part, None) or ():
+            if _is_chart(sub):
+                size += _chart_data_size(sub)
+    return size
+
+
+# --------------------------
+# RESULT CACHE
+# --------------------------
+class ResultCache:
+    """
+    Thread-safe LRU cache for derived page results.
+
+    Keys must include everything a result depends on: the data set's token,
+    its version counter, the selection and any parameters. When the data
+    changes its version bumps, so stale entries are never hit again and simply
+    age out of the LRU order.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()   # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for `key`, computing and storing it on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # compute outside the lock so other sessions are not blocked
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        size = _sizeof(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Hit/miss counters and current footprint."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+@st.cache_resource
+def get_result_cache():
+    """Process-wide cache shared by every session; keys carry the data token, so
+    sessions only share entries when they share the same data set."""
+    return ResultCache()
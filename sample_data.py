@@ -2,6 +2,7 @@
 import streamlit as st # type: ignore
 import random
 from datetime import datetime, timedelta
+from sessions import get_sessions, COOKIE_NAME, SESSION_TTL
 
 
 # --- Shared Data ---
@@ -12,21 +13,74 @@ MEDS = [
 
 # --- Helpers ---
 def go_to(page_name):
-    """Sets the session state to navigate to a new page."""
+    """
+    Navigation callback: pass as a button's `on_click` (args=(page,)) so the page
+    changes before the rerun and the new page renders in that same rerun.
+    """
     st.session_state.page = page_name
-    # Streamlit automatically reruns, no need for explicit rerun
+
+def log_in(email):
+    """Starts a session for `email`; the token is kept in session state and a cookie."""
+    token = get_sessions().issue(email)
+    st.session_state.session_token = token
+    st.session_state.session_cookie = (token, SESSION_TTL)
+    st.session_state.current_user = email
+
+def log_out():
+    """Logout callback: revokes the session token in every process."""
+    get_sessions().revoke(st.session_state.get("session_token"))
+    st.session_state.session_cookie = ("", 0)
+    st.session_state.session_token = None
+    st.session_state.current_user = None
+    st.session_state.page = "auth"
+
+def write_session_cookie():
+    """
+    Sends a pending cookie change from log_in / log_out to the browser. The
+    server only sees cookies when a session connects, so the cookie is set by
+    a script on the page rather than a response header.
+    """
+    pending = st.session_state.pop("session_cookie", None)
+    if pending is None:
+        return
+    token, max_age = pending
+    secure = "; Secure" if (st.context.url or "").startswith("https:") else ""
+    st.html(
+        f"<script>document.cookie = '{COOKIE_NAME}={token}; Path=/; Max-Age={max_age}; SameSite=Strict{secure}';</script>",
+        unsafe_allow_javascript=True
+    )
 
 def is_authenticated():
-    """Checks if a user is currently logged in."""
-    return st.session_state.current_user is not None
+    """
+    Checks the session token (from session state, else the cookie after a reconnect)
+    against the session store and sets `current_user` from it.
+    """
+    token = st.session_state.get("session_token") or st.context.cookies.get(COOKIE_NAME)
+    email = get_sessions().validate(token)
+    st.session_state.session_token = token if email else None
+    st.session_state.current_user = email
+    return email is not None
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
 
 def _parse_time(tstr):
     """Parses a time string into a datetime object."""
     try:
-        return datetime.strptime(tstr, "%Y-%m-%d %H:%M")
-    except:
+        return datetime.strptime(tstr, TIME_FORMAT)
+    except (TypeError, ValueError):
         return None
 
+def parse_times(values):
+    """Vectorized time parsing: app-format strings, ISO strings or datetimes -> datetime64 (NaT if invalid)."""
+    import pandas as pd  # type: ignore  # only bulk paths need pandas; keep it off the login path
+    values = pd.Series(values)
+    parsed = pd.to_datetime(values, format=TIME_FORMAT, errors="coerce")
+    # fall back to general parsing only for values not in the app's own format
+    retry = parsed.isna() & values.notna()
+    if retry.any():
+        parsed[retry] = pd.to_datetime(values[retry], format="mixed", errors="coerce")
+    return parsed
+
 # --- Data Generation ---
 def random_schedule_times(count=3):
     """Generates random upcoming/past schedule times."""
@@ -38,18 +92,27 @@ def random_schedule_times(count=3):
         times.append(t)
     return sorted(list(set(times)))[:count]
 
+REGIMENS = (["08:00"], ["08:00", "20:00"], ["08:00", "14:00", "20:00"])
+
+def random_regimen():
+    """A recurring daily regimen (e.g. 08:00 and 20:00 for 30 days) that started in the last 10 days."""
+    from recurrence import daily  # only the sample generator needs it here
+    start = (datetime.now() - timedelta(days=random.randint(0, 10))).date()
+    return str(daily(start, random.choice(REGIMENS), days=random.choice([7, 14, 30, None])))
+
 def generate_sample_patients(n=25):
-    """Generates a list of sample patient data."""
+    """Generates a list of sample patient data (about half the medications recur daily)."""
     patients = []
     for i in range(n):
         meds_count = random.randint(3,5)
         meds = []
-        for j in range(meds_count):
+        for name in random.sample(MEDS, meds_count):      # a patient takes each drug once
+            recurring = random.random() < 0.5
             med = {
-                "name": random.choice(MEDS),
+                "name": name,
                 "dose": f"{random.randint(1,2)} tablet(s)",
-                "times": random_schedule_times(count=random.randint(2,4)),
-                "last_taken": None
+                "times": [] if recurring else random_schedule_times(count=random.randint(2,4)),
+                "schedule": random_regimen() if recurring else None
             }
             meds.append(med)
         readings = []
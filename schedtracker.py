@@ -1,9 +1,18 @@
 import streamlit as st  # type: ignore
 import pandas as pd     # type: ignore
-import heapq
-from datetime import datetime
-from sample_data import go_to, _parse_time
+from datetime import datetime, timedelta
+from sample_data import go_to
 from medication_tracker import top_nav_bar
+from patient_index import patient_picker
+from live_feed import live_vitals_panel
+from alerts import get_alert_engine
+from profiler import span, fragment_span
+from dataset import get_dataset
+
+
+# Recurring schedules are expanded lazily, only inside this window around now
+MISSED_WINDOW = timedelta(hours=24)
+UPCOMING_WINDOW = timedelta(hours=72)
 
 
 # ----------------------------------------
@@ -17,88 +26,73 @@ def schedule_tracker_page():
     - Follow-ups
 
     Uses DSA:
-    - Priority Queue (heap)
+    - Priority Queue (fleet-wide ScheduleIndex, bucketed by due time)
     - Queue (FIFO)
     - Stack (LIFO)
     """
     top_nav_bar("Schedule Tracker")
     st.write("")
 
-    patients = st.session_state.patients
+    data = get_dataset()
+    roster = data.patient_index
 
     # -----------------------------
-    # PATIENT SELECTION (HASH MAP)
+    # PATIENT SELECTION (HASH MAP + PREFIX SEARCH)
     # -----------------------------
-    patient_map = {f"{p['id']} — {p['name']}": p for p in patients}
-    selected_key = st.selectbox("Select Patient", list(patient_map.keys()))
-    patient = patient_map[selected_key]
+    pid = patient_picker(roster, key="sched_patient", label="Select Patient")
+    if pid is None:
+        return
+    patient = roster.get(pid)
 
     st.markdown(f"<b>{patient['name']}</b> | Age: {patient['age']}</div>", unsafe_allow_html=True)
     st.write("---")
 
     # -----------------------------
-    # BUILD SCHEDULE HEAP
+    # READ SCHEDULE INDEX
     # -----------------------------
-    schedule_heap = []        # Priority Queue
+    index = data.schedule_index
     missed_queue = []         # Queue
     emergency_stack = []      # Stack
     notifications = []        # Notifications for UI
 
     now = datetime.now()
 
-    # ---- MEDICATION SCHEDULES
-    for med in patient["medications"]:
-        for t in med["times"]:
-            dt = _parse_time(t)
-            if not dt:
-                continue
-            diff = (dt - now).total_seconds()
-            heapq.heappush(schedule_heap, (diff, dt, "Medication", med["name"]))
-
-    # ---- VITAL CHECK SCHEDULES
-    for reading in patient["readings"][-3:]:
-        dt = _parse_time(reading["time"])
-        if not dt:
-            continue
-        heapq.heappush(schedule_heap, ((dt-now).total_seconds(), dt, "Vitals Check", "Vitals Review"))
-
-    # -----------------------------
-    # PROCESS SCHEDULES
-    # -----------------------------
-    upcoming = []
-    while schedule_heap:
-        secs, dt, s_type, label = heapq.heappop(schedule_heap)
-        if secs < 0:
-            missed_queue.append({
-                "Type": s_type,
-                "Task": label,
-                "Time": dt.strftime("%Y-%m-%d %H:%M")
-            })
-            notifications.append({
-                "type": "missed",
-                "msg": f"❌ {label} ({s_type}) missed at {dt.strftime('%H:%M')}"
-            })
-        else:
-            upcoming.append({
-                "Type": s_type,
-                "Task": label,
-                "Time": dt.strftime("%Y-%m-%d %H:%M"),
-                "Minutes Left": int(secs // 60)
-            })
-            if secs < 3600:  # less than 1 hour
+    # ---- MEDICATION + VITAL CHECK SCHEDULES (already ordered by due time)
+    with span("schedule"):
+        upcoming = []
+        window = index.patient_between(patient["id"], now - MISSED_WINDOW, now + UPCOMING_WINDOW)
+        for dt, _, _, s_type, label in window:
+            secs = (dt - now).total_seconds()
+            if secs < 0:
+                missed_queue.append({
+                    "Type": s_type,
+                    "Task": label,
+                    "Time": dt.strftime("%Y-%m-%d %H:%M")
+                })
                 notifications.append({
-                    "type": "upcoming",
-                    "msg": f"⏰ {label} ({s_type}) due in {int(secs//60)} min"
+                    "type": "missed",
+                    "msg": f"❌ {label} ({s_type}) missed at {dt.strftime('%H:%M')}"
+                })
+            else:
+                upcoming.append({
+                    "Type": s_type,
+                    "Task": label,
+                    "Time": dt.strftime("%Y-%m-%d %H:%M"),
+                    "Minutes Left": int(secs // 60)
                 })
+                if secs < 3600:  # less than 1 hour
+                    notifications.append({
+                        "type": "upcoming",
+                        "msg": f"⏰ {label} ({s_type}) due in {int(secs//60)} min"
+                    })
 
     # -----------------------------
-    # EMERGENCY STACK CHECK
+    # EMERGENCY STACK CHECK (FROM THE FLEET-WIDE ALERT INDEX)
     # -----------------------------
-    latest = patient["readings"][-1]
-    if latest["hr"] > 100:
-        emergency_stack.append("🚨 High Heart Rate Detected")
-    if latest["temp"] > 38:
-        emergency_stack.append("🔥 High Temperature Alert")
+    engine = get_alert_engine()
+    with span("alerts"):
+        for alert in engine.for_patient(patient["id"]):
+            emergency_stack.append(f"{alert['icon']} {alert['rule']} — {alert['message']}")
 
     # -----------------------------
     # DISPLAY EMERGENCIES (STACK)
@@ -110,6 +104,12 @@ def schedule_tracker_page():
     else:
         st.success("No emergency alerts.")
 
+    # -----------------------------
+    # LIVE VITALS (FRAGMENT, SELF-REFRESHING)
+    # -----------------------------
+    st.write("### 📡 Live Vitals")
+    live_vitals_panel((patient["id"],), names=roster.label)
+
     # -----------------------------
     # DISPLAY NOTIFICATIONS
     # -----------------------------
@@ -141,6 +141,55 @@ def schedule_tracker_page():
     else:
         st.success("No missed schedules 🎉")
 
+    # -----------------------------
+    # WARD VIEW (ALL PATIENTS)
+    # -----------------------------
+    st.write("---")
+    st.write("### 🚑 Active Alerts (All Patients)")
+    alert_rows = [
+        {"Patient": roster.label(a["patient_id"]) if a["patient_id"] in roster else a["patient_id"],
+         "Severity": a["severity"], "Alert": f"{a['icon']} {a['rule']}", "Detail": a["message"],
+         "Reading Time": a["time"]}
+        for a in engine.active()
+    ]
+    if alert_rows:
+        st.dataframe(pd.DataFrame(alert_rows), use_container_width=True)
+    else:
+        st.success("No active alerts.")
+
+    st.write("### 🏥 Ward View (All Patients)")
+    _ward_view(roster, index)
 
 
+@st.fragment
+def _ward_view(roster, index):
+    """Ward-wide due / missed lists; changing the windows reruns only this fragment."""
+    wcol1, wcol2 = st.columns(2)
+    with wcol1:
+        ahead = st.number_input("Due within (minutes)", min_value=15, max_value=24 * 60, value=60, step=15)
+    with wcol2:
+        lookback = st.number_input("Missed within (hours)", min_value=1, max_value=72, value=4, step=1)
 
+    now = datetime.now()
+    with fragment_span("schedule", "ward"):
+        due_rows = [
+            {"Patient": roster.label(pid), "Type": s_type, "Task": label,
+             "Time": dt.strftime("%Y-%m-%d %H:%M"), "Minutes Left": int((dt - now).total_seconds() // 60)}
+            for dt, _, pid, s_type, label in index.due_within(now, ahead)
+        ]
+        missed_rows = [
+            {"Patient": roster.label(pid), "Type": s_type, "Task": label, "Time": dt.strftime("%Y-%m-%d %H:%M")}
+            for dt, _, pid, s_type, label in index.missed_since(now - timedelta(hours=lookback), now)
+        ]
+
+    st.write(f"**Due in the next {ahead} minutes**")
+    if due_rows:
+        st.dataframe(pd.DataFrame(due_rows), use_container_width=True)
+    else:
+        st.info("Nothing due in this window.")
+
+    st.write(f"**Missed in the last {lookback} hours**")
+    if missed_rows:
+        st.dataframe(pd.DataFrame(missed_rows), use_container_width=True)
+    else:
+        st.success("No missed schedules in this window.")
@@ -0,0 +1,260 @@
+# schedule_index.py
+import heapq
+import itertools
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from sample_data import _parse_time
+from recurrence import parse_rule
+
+
+# --- Index settings ---
+BUCKET_MINUTES = 15
+HORIZON_HOURS = 6           # recurring doses are laid out this far past the latest queried window
+RETAIN_HOURS = 96           # ... and kept this long behind the horizon (covers the 72 h missed lookback)
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _bucket(dt, width):
+    return int((dt - _EPOCH).total_seconds() // width)
+
+
+# --------------------------
+# SCHEDULE INDEX
+# --------------------------
+class ScheduleIndex:
+    """
+    Fleet-wide index of due tasks (medication doses, vitals checks), ordered by due time.
+
+    Entries are hashed into fixed-width time buckets like a timing wheel; a sorted
+    list of non-empty bucket numbers lets a range query jump straight to the
+    first relevant bucket, so "due in the next hour" or "missed since T" cost
+    time proportional to the buckets touched and the result, not the index size.
+
+    Each entry is a tuple (due, seq, patient_id, type, task). Entries are owned
+    by a (patient_id, type) source so one patient's schedule can be replaced
+    incrementally when its medications or readings change. One index is shared
+    by every session, so updates and queries hold a lock.
+
+    Recurring medication schedules are kept as rules. Their occurrences are
+    laid out in a second wheel over a rolling horizon [lo, hi): a heap holds
+    each rule's next occurrence at or after hi, so moving the horizon forward
+    pops only the rules that fire before the new end, and buckets that fall
+    RETAIN_HOURS behind are dropped. A query inside the horizon therefore
+    touches only doses in its window; one far outside it expands the rules
+    directly instead of laying out the gap.
+    """
+
+    def __init__(self, bucket_minutes=BUCKET_MINUTES):
+        self.width = bucket_minutes * 60
+        self._buckets = {}       # bucket number -> sorted list of entries
+        self._keys = []          # sorted bucket numbers that hold entries
+        self._owned = {}         # (patient_id, type) -> list of entries
+        self._rules = {}         # patient_id -> [(rule, seq, medication, first, last)]
+        self._doses = {}         # bucket number -> sorted list of recurring occurrences in [lo, hi)
+        self._dose_keys = []     # sorted bucket numbers that hold occurrences
+        self._horizon = None     # (lo, hi) once the first window is queried
+        self._next = []          # heap of (next occurrence >= hi, seq, patient_id, medication, rule)
+        self._live = set()       # seqs of current rules; heap items of replaced rules are skipped
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, patients, store):
+        """Indexes every patient's medication times and 3 most recent readings."""
+        index = cls()
+        for p in patients:
+            index.set_medications(p["id"], p["medications"])
+            index.set_vitals_checks(p["id"], store.latest(p["id"], 3)["time"].tolist())
+        return index
+
+    # --- Incremental updates ---
+    def set_medications(self, pid, medications):
+        """Replaces a patient's medication entries (one-off times) and recurring rules."""
+        tasks, rules = [], []
+        for med in medications:
+            for t in med["times"]:
+                dt = _parse_time(t)
+                if dt:
+                    tasks.append((dt, med["name"]))
+            rule = parse_rule(med.get("schedule"))
+            if rule is not None:
+                rules.append((rule, next(self._seq), med["name"], rule.dtstart, rule.last()))
+        with self._lock:
+            self._replace((pid, "Medication"), tasks)
+            self._set_rules(pid, rules)
+
+    def set_vitals_checks(self, pid, times):
+        """Replaces a patient's vitals-check entries (datetimes of recent readings)."""
+        self._replace((pid, "Vitals Check"), [(dt, "Vitals Review") for dt in times])
+
+    def _replace(self, owner, tasks):
+        pid, kind = owner
+        with self._lock:
+            for entry in self._owned.pop(owner, ()):
+                self._discard(entry)
+            entries = [(dt, next(self._seq), pid, kind, label) for dt, label in tasks]
+            for entry in entries:
+                self._insert(entry)
+            if entries:
+                self._owned[owner] = sorted(entries)
+
+    def _insert(self, entry):
+        b = _bucket(entry[0], self.width)
+        bucket = self._buckets.get(b)
+        if bucket is None:
+            bucket = self._buckets[b] = []
+            insort(self._keys, b)
+        insort(bucket, entry)
+
+    def _discard(self, entry, buckets=None, keys=None):
+        buckets, keys = (self._buckets, self._keys) if buckets is None else (buckets, keys)
+        b = _bucket(entry[0], self.width)
+        bucket = buckets[b]
+        del bucket[bisect_left(bucket, entry)]
+        if not bucket:
+            del buckets[b]
+            del keys[bisect_left(keys, b)]
+
+    # --- Recurring doses ---
+    def _set_rules(self, pid, rules):
+        """Swaps a patient's rules, re-laying their occurrences inside the horizon."""
+        old = self._rules.pop(pid, ())
+        if rules:
+            self._rules[pid] = rules
+        if self._horizon is None:
+            return
+        lo, hi = self._horizon
+        for rule, seq, label, _, _ in old:
+            self._live.discard(seq)
+            for dt in rule.occurrences(lo, hi):
+                self._discard((dt, seq, pid, "Medication", label), self._doses, self._dose_keys)
+        for rule, seq, label, _, _ in rules:
+            self._live.add(seq)
+            self._lay((dt, seq, pid, "Medication", label) for dt in rule.occurrences(lo, hi))
+            self._push(rule, seq, pid, label, hi)
+
+    def _lay(self, entries):
+        """Adds occurrences to the dose wheel, sorting each touched bucket once."""
+        touched = {}
+        for entry in entries:
+            touched.setdefault(_bucket(entry[0], self.width), []).append(entry)
+        for b, new in touched.items():
+            bucket = self._doses.get(b)
+            if bucket is None:
+                self._doses[b] = sorted(new)
+                insort(self._dose_keys, b)
+            else:
+                bucket.extend(new)
+                bucket.sort()
+
+    def _push(self, rule, seq, pid, label, after):
+        """Queues the rule's first occurrence at or after `after`, if it has one."""
+        due = next(rule.occurrences(after, datetime.max), None)
+        if due is not None:
+            heapq.heappush(self._next, (due, seq, pid, label, rule))
+
+    def _cover(self, start, end):
+        """
+        Extends the horizon so it holds [start, end); False when the window is
+        so far from it that expanding the rules directly is cheaper.
+        """
+        if self._horizon is None:
+            self._horizon = (start, start)
+            self._live = {seq for rules in self._rules.values() for _, seq, _, _, _ in rules}
+            for pid, rules in self._rules.items():
+                for rule, seq, label, _, _ in rules:
+                    self._push(rule, seq, pid, label, start)
+        lo, hi = self._horizon
+        retain = timedelta(hours=RETAIN_HOURS)
+        if start >= hi + retain or end <= lo - retain:
+            return False
+        if start < lo:
+            # Rare: a window reaching back past anything kept. Lays out [start, lo) for every rule.
+            self._lay((dt, seq, pid, "Medication", label)
+                      for pid, rules in self._rules.items()
+                      for rule, seq, label, _, _ in rules
+                      for dt in rule.occurrences(start, lo))
+            lo = start
+        if end > hi:
+            hi, due_now = end + timedelta(hours=HORIZON_HOURS), []
+            while self._next and self._next[0][0] < hi:
+                due, seq, pid, label, rule = heapq.heappop(self._next)
+                if seq not in self._live:
+                    continue
+                for dt in rule.occurrences(due, datetime.max):
+                    if dt >= hi:
+                        heapq.heappush(self._next, (dt, seq, pid, label, rule))
+                        break
+                    due_now.append((dt, seq, pid, "Medication", label))
+            self._lay(due_now)
+            cutoff = _bucket(min(start, hi - retain), self.width)
+            if _bucket(lo, self.width) < cutoff:
+                drop = bisect_left(self._dose_keys, cutoff)
+                for b in self._dose_keys[:drop]:
+                    del self._doses[b]
+                del self._dose_keys[:drop]
+                lo = _EPOCH + timedelta(seconds=cutoff * self.width)
+        self._horizon = (lo, hi)
+        return True
+
+    # --- Queries ---
+    def __len__(self):
+        """Bucketed entries plus recurring rules (each rule counts once, however long)."""
+        with self._lock:
+            return sum(len(v) for v in self._owned.values()) + sum(len(r) for r in self._rules.values())
+
+    @staticmethod
+    def _expand(pid, rules, start, end, out):
+        """Appends the rules' occurrences inside the window, skipping rules not active in it."""
+        for rule, seq, label, first, last in rules:
+            if first >= end or (last is not None and last < start):
+                continue
+            out.extend((dt, seq, pid, "Medication", label) for dt in rule.occurrences(start, end))
+
+    def _scan(self, buckets, keys, start, end, out):
+        """Appends the bucketed entries with start <= due < end, in order."""
+        first, last = _bucket(start, self.width), _bucket(end, self.width)
+        for b in keys[bisect_left(keys, first):bisect_right(keys, last)]:
+            bucket = buckets[b]
+            lo = bisect_left(bucket, (start,)) if b == first else 0
+            for entry in bucket[lo:]:
+                if entry[0] >= end:
+                    break
+                out.append(entry)
+
+    def between(self, start, end):
+        """Entries with start <= due < end, in due-time order."""
+        out, recurring = [], []
+        with self._lock:
+            self._scan(self._buckets, self._keys, start, end, out)
+            if self._cover(start, end):
+                self._scan(self._doses, self._dose_keys, start, end, recurring)
+            else:
+                for pid, rules in self._rules.items():
+                    self._expand(pid, rules, start, end, recurring)
+                recurring.sort()
+        if recurring:
+            out = list(heapq.merge(out, recurring))
+        return out
+
+    def due_within(self, now, minutes=60):
+        """Entries due from `now` up to `minutes` ahead."""
+        return self.between(now, now + timedelta(minutes=minutes))
+
+    def missed_since(self, since, now):
+        """Entries that fell due between `since` and `now`."""
+        return self.between(since, now)
+
+    def patient_between(self, pid, start, end):
+        """One patient's entries with start <= due < end, in due-time order."""
+        out = []
+        with self._lock:
+            for kind in ("Medication", "Vitals Check"):
+                owned = self._owned.get((pid, kind), [])
+                for entry in owned[bisect_left(owned, (start,)):]:
+                    if entry[0] >= end:
+                        break
+                    out.append(entry)
+            self._expand(pid, self._rules.get(pid, ()), start, end, out)
+        return sorted(out)
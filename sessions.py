@@ -0,0 +1,155 @@
+# sessions.py
+"""
+Signed, expiring login sessions.
+
+Logging in issues a token '<session id>.<expiry>.<signature>'. The signature
+is an HMAC under a secret kept in the database, so every server process
+sharing that database accepts the token. The token is kept in session state
+and in a SameSite cookie (never in the URL, where it would end up in history,
+referrers and proxy logs), so it also survives a browser reconnect, and a
+load balancer may send the user to any process.
+
+A token is valid while its signature checks out, it has not expired and
+its session row is still in the store. Logging out deletes the row. Store
+lookups are cached in-process for CACHE_TTL seconds, so a logout seen by
+another process takes effect there within that time.
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+import streamlit as st  # type: ignore
+
+
+# --- Session settings ---
+SESSION_TTL = int(os.environ.get("HEALTH_SESSION_TTL", 12 * 60 * 60))
+SESSION_STORE = os.environ.get("HEALTH_SESSION_STORE", "sqlite")   # "sqlite" or "memory"
+CACHE_TTL = 30                   # seconds a validated token is trusted without a store lookup
+CACHE_SIZE = 4096
+PURGE_EVERY = 15 * 60            # seconds between sweeps of expired rows
+COOKIE_NAME = "health_session"
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _row_id(sid):
+    """Sessions are stored under a hash of their id, so a copied table holds no usable tokens."""
+    return hashlib.sha256(sid.encode("ascii")).hexdigest()
+
+
+# --------------------------
+# IN-MEMORY STAND-IN
+# --------------------------
+class MemorySessionStore:
+    """Same interface as Storage's session methods, kept in this process (tests, single process)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._secret = secrets.token_bytes(32)
+
+    def create_session(self, sid, email, expires):
+        with self._lock:
+            self._rows[sid] = (email, expires)
+
+    def get_session(self, sid):
+        with self._lock:
+            return self._rows.get(sid)
+
+    def delete_session(self, sid):
+        with self._lock:
+            self._rows.pop(sid, None)
+
+    def purge_sessions(self, now):
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._rows.items() if expires <= now]
+            for sid in expired:
+                del self._rows[sid]
+        return len(expired)
+
+    def secret(self, name, size=32):
+        return self._secret
+
+
+# --------------------------
+# SESSION MANAGER
+# --------------------------
+class SessionManager:
+    """Issues, validates and revokes session tokens against a session store."""
+
+    def __init__(self, store, secret=None, ttl=SESSION_TTL):
+        self.store = store
+        self.ttl = ttl
+        self._secret = secret or store.secret("session")
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()          # token -> (email, trusted until)
+        self._next_purge = 0.0
+        self.cache_hits = 0
+
+    def _sign(self, payload):
+        return _b64(hmac.new(self._secret, payload.encode("ascii"), "sha256").digest())
+
+    def issue(self, email):
+        """Creates a session for `email` and returns its token."""
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + PURGE_EVERY
+            self.store.purge_sessions(int(now))
+        sid = secrets.token_urlsafe(18)
+        expires = int(now) + self.ttl
+        self.store.create_session(_row_id(sid), email, expires)
+        payload = f"{sid}.{expires}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def validate(self, token):
+        """The token's email if it is signed, unexpired and not revoked; else None."""
+        if not token or not token.isascii():        # signatures and ids are ASCII; anything else is forged
+            return None
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(token)
+            if cached is not None and cached[1] > now:
+                self._cache.move_to_end(token)
+                self.cache_hits += 1
+                return cached[0]
+
+        try:
+            sid, expires, signature = token.split(".")
+            expires = int(expires)
+        except ValueError:
+            return None
+        # Forged or expired tokens are refused without touching the store
+        if not hmac.compare_digest(signature, self._sign(f"{sid}.{expires}")) or expires <= now:
+            return None
+        row = self.store.get_session(_row_id(sid))
+        if row is None or row[1] <= now:
+            return None
+
+        with self._lock:
+            self._cache[token] = (row[0], min(now + CACHE_TTL, expires))
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return row[0]
+
+    def revoke(self, token):
+        """Ends the session (in every process: here at once, elsewhere within CACHE_TTL)."""
+        with self._lock:
+            self._cache.pop(token, None)
+        sid = (token or "").split(".")[0]
+        if sid and sid.isascii():
+            self.store.delete_session(_row_id(sid))
+
+
+@st.cache_resource
+def get_sessions():
+    """One session manager per server process; the store itself is shared through the database."""
+    if SESSION_STORE == "memory":
+        return SessionManager(MemorySessionStore())
+    from storage import get_storage
+    return SessionManager(get_storage())
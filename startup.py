@@ -0,0 +1,70 @@
+# startup.py
+"""
+Cold-start timing.
+
+Records, once per server process, how long each page module took to import,
+how long each page's first render took and how long the shared data took to
+load, so cold start and login latency can be watched. Set HEALTH_STARTUP_LOG=1
+to also print each measurement as it is taken.
+"""
+import os
+import sys
+import time
+import threading
+from contextlib import contextmanager
+import streamlit as st  # type: ignore
+
+
+PROCESS_START = time.perf_counter()
+LOG = os.environ.get("HEALTH_STARTUP_LOG") == "1"
+
+
+class StartupReport:
+    """Process-wide first-occurrence timings (milliseconds since the event started)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.imports = {}        # module name -> import ms
+        self.renders = {}        # page name -> first render ms
+        self.data = {}           # step name -> ms
+        self.first_page_at = None
+
+    def _record(self, kind, key, ms):
+        table = getattr(self, kind)
+        with self._lock:
+            if key in table:
+                return
+            table[key] = round(ms, 1)
+            if table is self.renders and self.first_page_at is None:
+                self.first_page_at = round((time.perf_counter() - PROCESS_START) * 1000, 1)
+        if LOG:
+            print(f"[startup] {kind} {key}: {ms:.1f} ms", file=sys.stderr, flush=True)
+
+    @contextmanager
+    def timed(self, kind, key):
+        """Times the block and keeps the measurement if it is the first for `key`."""
+        table = getattr(self, kind)
+        if key in table:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(kind, key, (time.perf_counter() - start) * 1000)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "first_page_ms": self.first_page_at,
+                "imports_ms": dict(self.imports),
+                "first_render_ms": dict(self.renders),
+                "data_ms": dict(self.data),
+                "heavy_modules_loaded": [m for m in ("numpy", "pandas", "altair") if m in sys.modules],
+            }
+
+
+@st.cache_resource
+def get_startup_report():
+    """One report per server process."""
+    return StartupReport()
@@ -0,0 +1,536 @@
+# storage.py
+import os
+import json
+import queue
+import sqlite3
+from datetime import datetime
+from contextlib import contextmanager
+import numpy as np  # type: ignore
+import streamlit as st  # type: ignore
+from vitals_store import METRICS, VitalsStore, to_datetime64
+
+
+# --- Storage settings ---
+DB_PATH = os.environ.get("HEALTH_DB_PATH", "health.db")
+POOL_SIZE = 4
+BATCH_SIZE = 5000
+SCHEMA_VERSION = 2               # PRAGMA user_version; see Storage._migrate
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email       TEXT NOT NULL,
+    password    TEXT NOT NULL,
+    first_name  TEXT,
+    last_name   TEXT,
+    age         INTEGER,
+    gender      TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email);
+
+CREATE TABLE IF NOT EXISTS avatars (
+    email   TEXT PRIMARY KEY,
+    digest  TEXT NOT NULL,           -- sha256 of the image bytes
+    image   BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS patients (
+    id    TEXT PRIMARY KEY,
+    name  TEXT NOT NULL,
+    age   INTEGER,
+    seq   INTEGER NOT NULL DEFAULT 0   -- 'patients' change that last wrote the row or its medications
+);
+
+CREATE TABLE IF NOT EXISTS medications (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id  TEXT NOT NULL REFERENCES patients (id),
+    name        TEXT NOT NULL,
+    dose        TEXT,
+    times       TEXT NOT NULL,       -- JSON list of one-off 'YYYY-MM-DD HH:MM'
+    schedule    TEXT                 -- recurrence rule (see recurrence.py), or NULL
+);
+-- UNIQUE (patient_id, name): idx_medications_patient_name, created by Storage._migrate
+
+CREATE TABLE IF NOT EXISTS readings (
+    patient_id  TEXT NOT NULL REFERENCES patients (id),
+    time        INTEGER NOT NULL,    -- epoch seconds
+    hr          INTEGER,
+    bp_sys      INTEGER,
+    bp_dia      INTEGER,
+    temp        REAL,
+    seq         INTEGER NOT NULL DEFAULT 0   -- 'readings' change that last wrote the row
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_readings_patient_time ON readings (patient_id, time);
+
+-- append-only: rows are never updated or deleted
+CREATE TABLE IF NOT EXISTS dose_events (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id  TEXT NOT NULL REFERENCES patients (id),
+    medication  TEXT NOT NULL,
+    scheduled   INTEGER NOT NULL,    -- epoch seconds of the scheduled dose (naive time as UTC, like readings)
+    recorded    INTEGER NOT NULL,    -- epoch seconds the event was logged / dose taken
+    status      TEXT NOT NULL CHECK (status IN ('taken', 'late', 'skipped'))
+);
+CREATE INDEX IF NOT EXISTS idx_dose_events_patient ON dose_events (patient_id, medication);
+
+-- login sessions shared by every server process
+CREATE TABLE IF NOT EXISTS sessions (
+    id       TEXT PRIMARY KEY,       -- sha256 of the token's session id
+    email    TEXT NOT NULL,
+    expires  INTEGER NOT NULL        -- epoch seconds
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires);
+
+CREATE TABLE IF NOT EXISTS app_secrets (
+    name   TEXT PRIMARY KEY,
+    value  BLOB NOT NULL
+);
+
+-- change counters ('patients', 'readings'), advanced by every write; see Storage.versions
+CREATE TABLE IF NOT EXISTS data_versions (
+    kind     TEXT PRIMARY KEY,
+    version  INTEGER NOT NULL
+);
+"""
+
+USER_FIELDS = ("first_name", "last_name", "age", "gender")
+MEDICATION_COLUMNS = ("patient_id", "name", "dose", "times", "schedule")
+INSERT_MEDICATION = (
+    "INSERT INTO medications (patient_id, name, dose, times, schedule) VALUES (?, ?, ?, ?, ?)"
+)
+UPSERT_PATIENT = (
+    "INSERT INTO patients (id, name, age, seq) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (id) DO UPDATE SET name = excluded.name, age = excluded.age, seq = excluded.seq"
+)
+
+
+def _epoch(values):
+    """Converts time strings / datetimes into epoch seconds."""
+    return to_datetime64(values).astype(np.int64)
+
+
+def _medication_rows(medications):
+    """Rows from a medications DataFrame; `schedule` is optional (one-off times only)."""
+    if "schedule" not in medications:
+        medications = medications.assign(schedule=None)
+    schedule = medications["schedule"].astype(object)
+    medications = medications.assign(schedule=schedule.where(schedule.notna(), None))
+    return list(zip(*(medications[c].tolist() for c in MEDICATION_COLUMNS)))
+
+
+def _bump(conn, kind):
+    """
+    Advances a change counter inside the writing transaction and returns it;
+    the rows written are stamped with it. Writers hold the database's write
+    lock until they commit, so counters commit in order.
+    """
+    return conn.execute(
+        "INSERT INTO data_versions (kind, version) VALUES (?, 1) "
+        "ON CONFLICT (kind) DO UPDATE SET version = version + 1 RETURNING version",
+        (kind,),
+    ).fetchone()[0]
+
+
+def _dose_times_to_utc(conn):
+    """Version 1: dose event times move from local epochs to naive-as-UTC epochs like readings."""
+    rows = conn.execute("SELECT id, scheduled, recorded FROM dose_events").fetchall()
+    if not rows:
+        return
+    local = lambda col: _epoch([datetime.fromtimestamp(r[col]) for r in rows]).tolist()
+    conn.executemany(
+        "UPDATE dose_events SET scheduled = ?, recorded = ? WHERE id = ?",
+        zip(local(1), local(2), [r[0] for r in rows]),
+    )
+
+
+def _unique_medications(conn):
+    """
+    Version 2: a patient takes each medication once, since doses and adherence
+    are keyed on (patient_id, name). Keeps the latest row of each duplicate.
+    """
+    conn.execute(
+        "DELETE FROM medications WHERE id NOT IN (SELECT MAX(id) FROM medications GROUP BY patient_id, name)"
+    )
+    conn.execute("DROP INDEX IF EXISTS idx_medications_patient")       # a prefix of the unique index
+    conn.execute("CREATE UNIQUE INDEX idx_medications_patient_name ON medications (patient_id, name)")
+
+
+def _reading_rows(pid, readings):
+    times = _epoch([r["time"] for r in readings]).tolist()
+    return [
+        (pid, t, r["hr"], r["bp_sys"], r["bp_dia"], r["temp"])
+        for t, r in zip(times, readings)
+    ]
+
+
+def _patients(conn, where="", args=()):
+    """Patient dicts with their medications, for the patients matching `where`."""
+    patients = [
+        {"id": r["id"], "name": r["name"], "age": r["age"], "medications": []}
+        for r in conn.execute(f"SELECT id, name, age FROM patients {where} ORDER BY rowid", args)
+    ]
+    by_id = {p["id"]: p for p in patients}
+    only = f"WHERE patient_id IN (SELECT id FROM patients {where})" if where else ""
+    for r in conn.execute(
+        f"SELECT patient_id, name, dose, times, schedule FROM medications {only} ORDER BY id", args
+    ):
+        by_id[r["patient_id"]]["medications"].append({
+            "name": r["name"],
+            "dose": r["dose"],
+            "times": json.loads(r["times"]),
+            "schedule": r["schedule"],
+        })
+    return patients
+
+
+# --------------------------
+# CONNECTION POOL
+# --------------------------
+class ConnectionPool:
+    """Small fixed-size pool of SQLite connections in WAL mode."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._pool = queue.Queue(maxsize=size)
+        for _ in range(size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection; commits on success, rolls back on error."""
+        conn = self._pool.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+# --------------------------
+# STORAGE
+# --------------------------
+class Storage:
+    """SQLite-backed persistence for users, patients, medications and readings."""
+
+    def __init__(self, path=DB_PATH, pool_size=POOL_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+
+    @staticmethod
+    def _migrate(conn):
+        """Adds columns introduced after a database was created and converts old data."""
+        columns = {r[1] for r in conn.execute("PRAGMA table_info(medications)")}
+        if "schedule" not in columns:
+            conn.execute("ALTER TABLE medications ADD COLUMN schedule TEXT")
+        for table in ("patients", "readings"):
+            if "seq" not in {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_seq ON {table} (seq)")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            conn.commit()
+            conn.execute("BEGIN IMMEDIATE")          # one process converts; the others wait, then skip
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                _dose_times_to_utc(conn)
+            if version < 2:
+                _unique_medications(conn)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # --- Users ---
+    def get_user(self, email):
+        """Returns the user dict for `email`, or None."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT * FROM users WHERE email = ?", (email,)).fetchone()
+        return dict(row) if row else None
+
+    def create_user(self, email, password, **fields):
+        """Inserts a user (`password` is the stored hash); returns False if the email is already registered."""
+        values = [fields.get(f) for f in USER_FIELDS]
+        try:
+            with self.pool.connection() as conn:
+                conn.execute(
+                    "INSERT INTO users (email, password, first_name, last_name, age, gender) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [email, password] + values,
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def update_user(self, email, **fields):
+        """Updates profile fields (first_name, last_name, age, gender) for `email`."""
+        fields = {k: v for k, v in fields.items() if k in USER_FIELDS}
+        if not fields:
+            return
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self.pool.connection() as conn:
+            conn.execute(
+                f"UPDATE users SET {assignments} WHERE email = ?",
+                list(fields.values()) + [email],
+            )
+
+    def update_password(self, email, password_hash):
+        with self.pool.connection() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE email = ?", (password_hash, email))
+
+    # --- Avatars ---
+    def avatar_digest(self, email):
+        """Content hash of the user's avatar, or None (cheap: the image is not read)."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT digest FROM avatars WHERE email = ?", (email,)).fetchone()
+        return row[0] if row else None
+
+    def get_avatar(self, email):
+        """Returns (digest, image bytes) of the user's avatar, or None."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT digest, image FROM avatars WHERE email = ?", (email,)).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def set_avatar(self, email, digest, image):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO avatars (email, digest, image) VALUES (?, ?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET digest = excluded.digest, image = excluded.image",
+                (email, digest, sqlite3.Binary(image)),
+            )
+
+    # --- Sessions ---
+    def create_session(self, sid, email, expires):
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO sessions (id, email, expires) VALUES (?, ?, ?)", (sid, email, expires))
+
+    def get_session(self, sid):
+        """Returns (email, expires) for a session id, or None."""
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT email, expires FROM sessions WHERE id = ?", (sid,)).fetchone()
+        return tuple(row) if row else None
+
+    def delete_session(self, sid):
+        with self.pool.connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+
+    def purge_sessions(self, now):
+        """Deletes sessions that expired before `now` (epoch seconds); returns how many."""
+        with self.pool.connection() as conn:
+            return conn.execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount
+
+    def secret(self, name, size=32):
+        """A random secret shared by every process using this database (created on first use)."""
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO app_secrets (name, value) VALUES (?, ?) ON CONFLICT (name) DO NOTHING",
+                (name, sqlite3.Binary(os.urandom(size))),
+            )
+            return bytes(conn.execute("SELECT value FROM app_secrets WHERE name = ?", (name,)).fetchone()[0])
+
+    # --- Patients & medications ---
+    def has_patients(self):
+        with self.pool.connection() as conn:
+            return conn.execute("SELECT 1 FROM patients LIMIT 1").fetchone() is not None
+
+    def save_patients(self, patients):
+        """Inserts or replaces patients, their medications and readings in batched writes."""
+        with self.pool.connection() as conn:
+            seq = _bump(conn, "patients")
+            conn.executemany(UPSERT_PATIENT, [(p["id"], p["name"], p["age"], seq) for p in patients])
+            conn.executemany(
+                "DELETE FROM medications WHERE patient_id = ?",
+                [(p["id"],) for p in patients],
+            )
+            conn.executemany(
+                INSERT_MEDICATION,
+                [
+                    (p["id"], m["name"], m["dose"], json.dumps(m["times"]), m.get("schedule"))
+                    for p in patients for m in p["medications"]
+                ],
+            )
+        rows = []
+        for p in patients:
+            rows.extend(_reading_rows(p["id"], p.get("readings", ())))
+        self._write_readings(rows)
+
+    def save_frames(self, patients, medications, readings):
+        """
+        Bulk-writes column-oriented data: DataFrames of patients (id, name, age),
+        medications (patient_id, name, dose, times as JSON, optional schedule) and
+        readings (patient_id, time, hr, bp_sys, bp_dia, temp). As in save_patients,
+        the given patients' stored medications are replaced, so loading the same
+        data twice stores it once.
+        """
+        ids = patients["id"].tolist()
+        with self.pool.connection() as conn:
+            seq = _bump(conn, "patients")
+            conn.executemany(
+                UPSERT_PATIENT,
+                zip(ids, patients["name"].tolist(), patients["age"].tolist(), [seq] * len(ids)),
+            )
+            conn.executemany("DELETE FROM medications WHERE patient_id = ?", [(pid,) for pid in ids])
+            conn.executemany(INSERT_MEDICATION, _medication_rows(medications))
+        self.upsert_readings(readings)
+
+    def ensure_patients(self, ids):
+        """Registers unknown patient ids (named after their id) so their readings can be stored."""
+        with self.pool.connection() as conn:
+            seq = _bump(conn, "patients")
+            conn.executemany(
+                "INSERT INTO patients (id, name, seq) VALUES (?, ?, ?) ON CONFLICT (id) DO NOTHING",
+                [(pid, pid, seq) for pid in ids],
+            )
+
+    def upsert_medications(self, medications):
+        """
+        Replaces medications matched on (patient_id, name) and inserts new ones.
+        `medications` is a DataFrame of patient_id, name, dose, times (JSON list)
+        and optionally schedule.
+        """
+        rows = _medication_rows(medications)
+        with self.pool.connection() as conn:
+            seq = _bump(conn, "patients")
+            conn.executemany(
+                "DELETE FROM medications WHERE patient_id = ? AND name = ?",
+                [(r[0], r[1]) for r in rows],
+            )
+            conn.executemany(INSERT_MEDICATION, rows)
+            conn.executemany("UPDATE patients SET seq = ? WHERE id = ?",
+                             [(seq, pid) for pid in dict.fromkeys(r[0] for r in rows)])
+
+    def load_patients(self):
+        """Returns patient dicts with their medications (readings live in the VitalsStore)."""
+        with self.pool.connection() as conn:
+            return _patients(conn)
+
+    def patients_since(self, since, until):
+        """Patients written (or whose medications were) by 'patients' changes since < seq <= until."""
+        with self.pool.connection() as conn:
+            return _patients(conn, "WHERE seq > ? AND seq <= ?", (since, until))
+
+    # --- Change tracking ---
+    def versions(self):
+        """
+        Change counters, read each run by every server process to pick up the
+        others' writes: 'patients' and 'readings' (see _bump) and 'doses', the
+        last dose event id.
+        """
+        with self.pool.connection() as conn:
+            out = {"patients": 0, "readings": 0}
+            out.update((r[0], r[1]) for r in conn.execute("SELECT kind, version FROM data_versions"))
+            out["doses"] = conn.execute("SELECT COALESCE(MAX(id), 0) FROM dose_events").fetchone()[0]
+        return out
+
+    # --- Dose events ---
+    def append_dose_events(self, events):
+        """
+        Appends (patient_id, medication, scheduled, recorded, status) rows in one
+        transaction and returns their ids (consecutive: the transaction holds the write lock).
+        """
+        with self.pool.connection() as conn:
+            conn.executemany(
+                "INSERT INTO dose_events (patient_id, medication, scheduled, recorded, status) "
+                "VALUES (?, ?, ?, ?, ?)",
+                events,
+            )
+            last = conn.execute("SELECT MAX(id) FROM dose_events").fetchone()[0]
+        return range(last - len(events) + 1, last + 1)
+
+    def dose_events(self, after=0):
+        """
+        Yields the dose events logged after id `after`, in log order, as
+        (id, patient_id, medication, scheduled, recorded, status).
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.execute(
+                "SELECT id, patient_id, medication, scheduled, recorded, status FROM dose_events "
+                "WHERE id > ? ORDER BY id",
+                (after,),
+            )
+            while batch := cursor.fetchmany(BATCH_SIZE):
+                yield from (tuple(r) for r in batch)
+
+    # --- Readings ---
+    def add_readings(self, pid, readings):
+        """Upserts a batch of reading dicts for one patient (deduped on patient + time)."""
+        self._write_readings(_reading_rows(pid, readings))
+
+    def upsert_readings(self, readings):
+        """Upserts a DataFrame of readings (patient_id, time, hr, bp_sys, bp_dia, temp)."""
+        times = to_datetime64(readings["time"].to_numpy()).astype(np.int64).tolist()
+        self._write_readings(list(zip(
+            readings["patient_id"].tolist(),
+            times,
+            *(readings[m].tolist() for m in METRICS),
+        )))
+
+    def _write_readings(self, rows):
+        if not rows:
+            return
+        with self.pool.connection() as conn:
+            seq = (_bump(conn, "readings"),)
+            for i in range(0, len(rows), BATCH_SIZE):
+                conn.executemany(
+                    "INSERT INTO readings (patient_id, time, hr, bp_sys, bp_dia, temp, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (patient_id, time) DO UPDATE SET hr = excluded.hr, "
+                    "bp_sys = excluded.bp_sys, bp_dia = excluded.bp_dia, temp = excluded.temp, "
+                    "seq = excluded.seq",
+                    [row + seq for row in rows[i:i + BATCH_SIZE]],
+                )
+
+    def readings_since(self, since, until):
+        """
+        Readings written by 'readings' changes since < seq <= until, as
+        (patient ids, times, metric columns).
+        """
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT patient_id, time, hr, bp_sys, bp_dia, temp FROM readings "
+                "WHERE seq > ? AND seq <= ?",
+                (since, until),
+            ).fetchall()
+        cols = _columns([tuple(r)[1:] for r in rows])
+        return [r[0] for r in rows], cols.pop("time"), cols
+
+    def load_vitals_store(self):
+        """Builds a VitalsStore from every stored reading."""
+        with self.pool.connection() as conn:
+            patients = conn.execute("SELECT id, name FROM patients ORDER BY rowid").fetchall()
+            rows = conn.execute(
+                "SELECT patient_id, time, hr, bp_sys, bp_dia, temp FROM readings "
+                "ORDER BY patient_id, time"
+            ).fetchall()
+        ids = [p["id"] for p in patients]
+        pos = {pid: i for i, pid in enumerate(ids)}
+        block = np.fromiter((pos[r[0]] for r in rows), dtype=np.int64, count=len(rows))
+        cols = _columns([tuple(r)[1:] for r in rows])
+        time = cols.pop("time")
+        return VitalsStore.from_columns(ids, [p["name"] for p in patients], block, time, cols)
+
+
+def _columns(rows):
+    """Turns (time, hr, bp_sys, bp_dia, temp) rows into numpy columns."""
+    cols = list(zip(*rows)) if rows else [()] * (len(METRICS) + 1)
+    out = {"time": np.array(cols[0], dtype=np.int64).astype("datetime64[s]")}
+    for m, values in zip(METRICS, cols[1:]):
+        out[m] = np.array(values)
+    return out
+
+
+@st.cache_resource
+def get_storage():
+    """One Storage (and connection pool) per server process."""
+    return Storage()
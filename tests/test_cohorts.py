@@ -0,0 +1,56 @@
+# tests/test_cohorts.py
+import math
+from cohorts import CohortIndex, drug_cohort
+from vitals_store import VitalsStore
+
+
+PATIENTS = [
+    {"id": "P1", "name": "Alice", "age": 70, "medications": [{"name": "Aspirin"}]},
+    {"id": "P2", "name": "Bob", "age": 30, "medications": [{"name": "Aspirin"}]},
+    {"id": "P3", "name": "Cara", "age": 75, "medications": []},
+]
+
+
+def _index():
+    store = VitalsStore.from_columns(
+        ["P1", "P2", "P3"], ["Alice", "Bob", "Cara"], [0, 1, 2],
+        ["2025-01-01 08:00"] * 3,
+        {"hr": [80, 70, 60], "bp_sys": [120, 121, 122], "bp_dia": [80, 81, 82], "temp": [36.5, 36.6, 36.7]},
+    )
+    store.statistics()
+    return CohortIndex.build(PATIENTS, store), store
+
+
+def _assert_matches_members(index, store):
+    stats = store.statistics()
+    for cohort, (size, result) in index.aggregates().items():
+        blocks = index.positions([cohort])
+        expected = stats.merged(blocks)
+        assert size == len(blocks)
+        for m, values in result.items():
+            for name, value in values.items():
+                assert math.isclose(value, expected[m][name], rel_tol=1e-9) or \
+                    (math.isnan(value) and math.isnan(expected[m][name])), (cohort, m, name)
+
+
+def _rows(pids, times, hr):
+    n = len(pids)
+    return pids, times, {"hr": hr, "bp_sys": [130] * n, "bp_dia": [85] * n, "temp": [37.0] * n}
+
+
+def test_written_readings_fold_into_their_cohorts():
+    index, store = _index()
+    index.aggregates()
+    store.add_rows(*_rows(["P1", "P2", "P3"], ["2025-01-01 09:00"] * 3, [110, 90, 100]))
+    assert index.aggregates()[drug_cohort("Aspirin")][1]["hr"]["count"] == 4
+    _assert_matches_members(index, store)
+
+
+def test_replaced_reading_and_membership_change_remerge_the_cohort():
+    index, store = _index()
+    index.aggregates()
+    store.add_rows(*_rows(["P1"], ["2025-01-01 08:00"], [150]))          # replaces P1's reading
+    index.update({**PATIENTS[1], "age": 80})                              # P2 moves to Age 65+
+    assert index.aggregates()["Age 65+"][0] == 3
+    assert index.aggregates()["Age 65+"][1]["hr"]["max"] == 150
+    _assert_matches_members(index, store)
@@ -0,0 +1,89 @@
+# tests/test_recurrence.py
+import random
+from functools import lru_cache
+from datetime import timedelta
+import pytest
+from recurrence import Recurrence
+
+HORIZON = timedelta(days=90)
+RULES = [
+    "DTSTART=20250101T080000;FREQ=DAILY;BYHOUR=8,20;BYMINUTE=0;COUNT=60",
+    "DTSTART=20250101T060000;FREQ=HOURLY;INTERVAL=6;UNTIL=20250114T235900",
+    "DTSTART=20250106T090000;FREQ=WEEKLY;BYDAY=MO,TH",
+    "DTSTART=20250103T213000;FREQ=DAILY;INTERVAL=3;BYHOUR=7,21;BYMINUTE=0,30",
+    "DTSTART=20250108T120000;FREQ=WEEKLY;INTERVAL=2;BYDAY=SU,MO,FR;BYHOUR=6;COUNT=11",
+    "DTSTART=20250102T051500;FREQ=HOURLY;INTERVAL=5",
+    "DTSTART=20250110T100000;FREQ=DAILY",
+]
+
+
+def brute_force(rule, horizon=HORIZON):
+    """Every occurrence up to dtstart + horizon, by testing each minute against the rule's definition."""
+    hours = rule.byhour or [rule.dtstart.hour]
+    minutes = rule.byminute or [rule.dtstart.minute]
+    days = rule.byday or [rule.dtstart.weekday()]
+    first_day = rule.dtstart.date()
+    first_monday = first_day - timedelta(days=first_day.weekday())
+    out, t = [], rule.dtstart
+    while t < rule.dtstart + horizon:
+        if rule.freq == "HOURLY":
+            hit = (t - rule.dtstart).total_seconds() % (3600 * rule.interval) == 0
+        elif rule.freq == "DAILY":
+            hit = (t.date() - first_day).days % rule.interval == 0 and t.hour in hours and t.minute in minutes
+        else:
+            week = (t.date() - timedelta(days=t.weekday()) - first_monday).days // 7
+            hit = (week % rule.interval == 0 and t.weekday() in days
+                   and t.hour in hours and t.minute in minutes)
+        if hit:
+            if rule.until is not None and t > rule.until:
+                break
+            out.append(t)
+            if rule.count is not None and len(out) == rule.count:
+                break
+        t += timedelta(minutes=1)
+    return out
+
+
+@lru_cache(maxsize=None)
+def expected(text):
+    return brute_force(Recurrence.parse(text))
+
+
+@pytest.mark.parametrize("text", RULES)
+def test_occurrences_match_brute_force_in_random_windows(text):
+    rule = Recurrence.parse(text)
+    expected_all = expected(text)
+    rng = random.Random(text)
+    lo = rule.dtstart - timedelta(days=2)
+    for _ in range(50):
+        start = lo + timedelta(minutes=rng.randrange(0, 60 * 24 * 60))
+        end = start + timedelta(minutes=rng.randrange(1, 10 * 24 * 60))
+        assert list(rule.occurrences(start, end)) == [t for t in expected_all if start <= t < end], (start, end)
+
+
+@pytest.mark.parametrize("text", RULES)
+def test_last_matches_brute_force(text):
+    rule = Recurrence.parse(text)
+    if rule.count is not None:
+        assert rule.last() == expected(text)[-1]
+    elif rule.until is not None:
+        assert expected(text)[-1] <= rule.last()
+
+
+def test_round_trip_through_text():
+    for text in RULES:
+        assert str(Recurrence.parse(str(Recurrence.parse(text)))) == str(Recurrence.parse(text))
+
+
+@pytest.mark.parametrize("text", [
+    "FREQ=DAILY",
+    "DTSTART=20250101;FREQ=MONTHLY",
+    "DTSTART=20250101;FREQ=HOURLY;BYHOUR=8",
+    "DTSTART=20250101;FREQ=DAILY;BYDAY=MO",
+    "DTSTART=20250101;FREQ=DAILY;BYHOUR=24",
+    "DTSTART=20250101;FREQ=DAILY;COUNT=0",
+    "DTSTART=20250101;FREQ=DAILY;BYSETPOS=1",
+])
+def test_unsupported_rules_are_rejected(text):
+    with pytest.raises(ValueError):
+        Recurrence.parse(text)
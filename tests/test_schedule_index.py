@@ -0,0 +1,92 @@
+# tests/test_schedule_index.py
+import random
+from datetime import datetime, timedelta
+from recurrence import medication_doses
+from schedule_index import HORIZON_HOURS, RETAIN_HOURS, ScheduleIndex
+
+T0 = datetime(2025, 1, 6)
+SCHEDULES = [
+    "DTSTART=20250106T080000;FREQ=DAILY;BYHOUR=8,20;BYMINUTE=0",
+    "DTSTART=20250106T060000;FREQ=HOURLY;INTERVAL=6;COUNT=30",
+    "DTSTART=20250107T090000;FREQ=WEEKLY;BYDAY=MO,TH",
+    "DTSTART=20250110T213000;FREQ=DAILY;INTERVAL=2;UNTIL=20250125T000000",
+]
+
+
+def _patients(rng, n=6):
+    """Patients with a mix of recurring and one-off medications (names unique per patient)."""
+    out = {}
+    for i in range(n):
+        meds = []
+        for name in rng.sample(["Aspirin", "Metformin", "Lisinopril", "Omeprazole"], 3):
+            times = sorted({(T0 + timedelta(minutes=15 * rng.randrange(0, 4 * 24 * 20))).strftime("%Y-%m-%d %H:%M")
+                            for _ in range(rng.randrange(0, 4))})
+            meds.append({"name": name, "dose": "1", "times": times,
+                         "schedule": rng.choice(SCHEDULES + [None])})
+        out[f"P{i}"] = meds
+    return out
+
+
+def _brute_force(patients, start, end):
+    """Every medication dose due in [start, end), from each medication on its own."""
+    return sorted((t, pid, "Medication", med["name"])
+                  for pid, meds in patients.items() for med in meds
+                  for t in medication_doses(med, start, end))
+
+
+def _entries(entries):
+    """(due, patient, type, label) of index entries, checking they come in due-time order."""
+    dues = [entry[0] for entry in entries]
+    assert dues == sorted(dues)
+    return sorted((due, pid, kind, label) for due, _, pid, kind, label in entries)
+
+
+def _index(patients):
+    index = ScheduleIndex()
+    for pid, meds in patients.items():
+        index.set_medications(pid, meds)
+    return index
+
+
+def test_between_matches_brute_force_as_the_window_moves():
+    rng = random.Random(7)
+    patients = _patients(rng)
+    index = _index(patients)
+    now = T0
+    for step in range(200):
+        # mostly forward, sometimes back inside the retained range, sometimes far away
+        r = rng.random()
+        if r < 0.7:
+            now += timedelta(minutes=rng.randrange(0, 180))
+        elif r < 0.9:
+            now -= timedelta(hours=rng.randrange(0, RETAIN_HOURS))
+        else:
+            now += timedelta(days=rng.choice([-10, 15, 40]))
+        end = now + timedelta(minutes=rng.randrange(1, 60 * (HORIZON_HOURS + 24)))
+        assert _entries(index.between(now, end)) == _brute_force(patients, now, end), (step, now, end)
+
+
+def test_replaced_medications_show_up_in_later_queries():
+    rng = random.Random(11)
+    patients = _patients(rng)
+    index = _index(patients)
+    start = T0 + timedelta(days=1)
+    index.between(start, start + timedelta(hours=3))                 # lays out the horizon
+    patients["P0"] = [{"name": "Aspirin", "dose": "1", "times": [], "schedule": SCHEDULES[1]}]
+    patients["P1"] = []
+    index.set_medications("P0", patients["P0"])
+    index.set_medications("P1", patients["P1"])
+    for hours in (0, 2, 5, 30):
+        window = (start + timedelta(hours=hours), start + timedelta(hours=hours + 4))
+        assert _entries(index.between(*window)) == _brute_force(patients, *window)
+
+
+def test_patient_between_matches_brute_force():
+    rng = random.Random(3)
+    patients = _patients(rng)
+    index = _index(patients)
+    for pid in patients:
+        start = T0 + timedelta(hours=rng.randrange(0, 24 * 20))
+        end = start + timedelta(hours=rng.randrange(1, 72))
+        expected = _brute_force({pid: patients[pid]}, start, end)
+        assert _entries(index.patient_between(pid, start, end)) == expected
@@ -0,0 +1,55 @@
+# tests/test_sessions.py
+import sessions
+from sessions import MemorySessionStore, SessionManager
+
+
+def _manager(ttl=60):
+    return SessionManager(MemorySessionStore(), ttl=ttl)
+
+
+def test_issued_token_validates_until_revoked():
+    manager = _manager()
+    token = manager.issue("a@b.c")
+    assert manager.validate(token) == "a@b.c"
+    manager.revoke(token)
+    assert manager.validate(token) is None
+
+
+def test_expired_token_is_refused(monkeypatch):
+    manager = _manager(ttl=60)
+    now = sessions.time.time()
+    token = manager.issue("a@b.c")
+    monkeypatch.setattr(sessions.time, "time", lambda: now + 61)
+    assert manager.validate(token) is None
+
+
+def test_cached_token_expires_with_its_session(monkeypatch):
+    manager = _manager(ttl=10)
+    now = sessions.time.time()
+    token = manager.issue("a@b.c")
+    assert manager.validate(token) == "a@b.c"                # now trusted from the cache
+    monkeypatch.setattr(sessions.time, "time", lambda: now + 11)
+    assert manager.validate(token) is None
+
+
+def test_tampered_tokens_are_refused():
+    manager = _manager()
+    token = manager.issue("a@b.c")
+    sid, expires, signature = token.split(".")
+    forged = [
+        f"{sid}.{int(expires) + 3600}.{signature}",           # extended expiry
+        f"{sid[:-1]}{'A' if sid[-1] != 'A' else 'B'}.{expires}.{signature}",
+        f"{sid}.{expires}.{signature[:-2]}xx",
+        f"{sid}.{expires}",
+        f"{sid}.{expires}.{signature}é",
+        "",
+        None,
+    ]
+    for bad in forged:
+        assert manager.validate(bad) is None, bad
+
+
+def test_token_signed_by_another_secret_is_refused():
+    store = MemorySessionStore()
+    token = SessionManager(store, secret=b"other" * 8).issue("a@b.c")
+    assert SessionManager(store).validate(token) is None
@@ -0,0 +1,28 @@
+# tests/test_trends.py
+from vitals_store import METRICS, VitalsStore
+from trends import compute_trends, trend_table
+
+
+def _store():
+    times = ["2025-01-01 08:00", "2025-01-01 09:00", "2025-01-01 10:00"]
+    return VitalsStore.from_columns(
+        ["P1", "P2"], ["Same", "Same"], [0, 0, 0, 1, 1, 1], times * 2,
+        {"hr": [60, 70, 80, 90, 80, 70], "bp_sys": [120] * 6, "bp_dia": [80] * 6, "temp": [36.6] * 6},
+    )
+
+
+def test_trend_table_keeps_patients_with_the_same_name_apart():
+    table = trend_table(compute_trends(_store(), ["P1", "P2"], window=3))
+
+    assert table["patient_id"].tolist() == ["P1", "P2"]
+    assert table["patient"].tolist() == ["Same", "Same"]
+    assert table["hr_trend"].str.contains("increasing").tolist() == [True, False]
+    assert table["hr_trend"].str.contains("decreasing").tolist() == [False, True]
+    assert list(table.columns) == ["patient_id", "patient"] + [f"{m}_trend" for m in METRICS]
+
+
+def test_single_reading_is_not_enough_data():
+    store = VitalsStore.from_columns(["P1"], ["A"], [0], ["2025-01-01 08:00"],
+                                     {"hr": [60], "bp_sys": [120], "bp_dia": [80], "temp": [36.6]})
+    trends = compute_trends(store, ["P1"], window=3)
+    assert set(trends["trend"]) == {"not enough data"}
@@ -0,0 +1,75 @@
+# tests/test_vitals_store.py
+import numpy as np
+import pytest
+from vitals_store import METRICS, VitalsStore
+
+
+def _store():
+    store = VitalsStore.from_columns(
+        ["P1", "P2"], ["Alice", "Bob"], [0, 0, 1],
+        ["2025-01-01 10:00", "2025-01-01 09:00", "2025-01-01 08:00"],
+        {"hr": [80, 70, 60], "bp_sys": [120, 121, 122], "bp_dia": [80, 81, 82], "temp": [36.5, 36.6, 36.7]},
+    )
+    store.statistics()
+    return store
+
+
+def _row(hr, temp=36.5):
+    return {"hr": [hr], "bp_sys": [120], "bp_dia": [80], "temp": [temp]}
+
+
+def test_upsert_replaces_stored_reading_and_its_statistics():
+    store = _store()
+    before = store.snapshot()
+    assert store.add_rows(["P1"], ["2025-01-01 10:00"], _row(150)) == 1
+
+    assert store.slice("P1")["hr"].tolist() == [70, 150]
+    assert before.slice("P1")["hr"].tolist() == [70, 80]          # published rows are never rewritten
+    stats = store.statistics().table(store.positions(["P1"]))["hr"]
+    assert stats["count"][0] == 2
+    assert stats["mean"][0] == pytest.approx(110.0)
+    assert stats["max"][0] == 150.0
+
+
+def test_identical_reading_changes_nothing():
+    store = _store()
+    version = store.version
+    assert store.add_rows(["P1"], ["2025-01-01 10:00"], _row(80)) == 0
+    assert store.version == version
+
+
+def test_last_copy_in_a_batch_wins():
+    store = _store()
+    store.add_rows(["P2", "P2"], ["2025-01-02 08:00"] * 2, {m: [1, 2] if m == "hr" else [90, 90] for m in METRICS})
+    assert store.latest("P2")["hr"].tolist() == [2]
+
+
+def test_out_of_order_and_new_patient_rows_stay_sorted():
+    store = _store()
+    store.add_rows(["P1", "P9"], ["2025-01-01 09:30", "2025-01-03 00:00"], {m: [75, 90] for m in METRICS})
+    assert store.slice("P1")["time"].astype(str).tolist() == [
+        "2025-01-01T09:00:00", "2025-01-01T09:30:00", "2025-01-01T10:00:00"
+    ]
+    assert store.name("P9") == "P9"
+    assert len(store) == 5
+
+
+def test_running_statistics_match_the_rows_after_many_writes():
+    rng = np.random.default_rng(7)
+    store = _store()
+    base = np.datetime64("2025-02-01T00:00:00")
+    for k in range(60):
+        pids = rng.choice(["P1", "P2", "P3"], 20).tolist()
+        times = base + rng.integers(-5000, 5000, 20).astype("timedelta64[m]")
+        store.add_rows(pids, times, {m: rng.integers(50, 140, 20) for m in METRICS})
+
+    table = store.statistics().table(store.positions(["P1", "P2", "P3"]))
+    for i, pid in enumerate(["P1", "P2", "P3"]):
+        view = store.slice(pid)
+        assert np.all(np.diff(view["time"].astype(np.int64)) > 0)
+        x = view["hr"].astype(np.float64)
+        assert table["hr"]["count"][i] == len(x)
+        assert table["hr"]["mean"][i] == pytest.approx(x.mean())
+        assert table["hr"]["std"][i] == pytest.approx(x.std(ddof=1))
+        assert (table["hr"]["min"][i], table["hr"]["max"][i]) == (x.min(), x.max())
+        assert table["hr"]["p50"][i] == pytest.approx(np.quantile(x, 0.5, method="closest_observation"), rel=0.03)
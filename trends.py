@@ -0,0 +1,115 @@
+# trends.py
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+from vitals_store import METRICS
+
+
+# --- Trend settings ---
+TREND_METHODS = ("slope", "delta", "ewma")
+
+# Changes over the window smaller than this (in the metric's own units) count as stable
+STABLE_TOLERANCE = {"hr": 1.0, "bp_sys": 1.0, "bp_dia": 1.0, "temp": 0.1}
+
+TREND_LABELS = {1: "**increasing** ⬆️", -1: "**decreasing** ⬇️", 0: "stable ➡️"}
+
+
+# --------------------------
+# TREND ENGINE
+# --------------------------
+def compute_trends(store, pids, window=3, method="slope", span=None):
+    """
+    Computes trends for every patient in `pids` and every vital metric in one grouped pass.
+
+    Only each patient's `window` most recent readings are used. The trend label
+    comes from the score of the chosen method:
+    - slope: least-squares slope (units per hour) times the window's time span
+    - delta: newest value minus oldest value in the window
+    - ewma:  exponentially weighted mean minus the plain mean of the window
+             (`span` defaults to the window size)
+
+    Returns a tidy DataFrame with one row per (patient, metric):
+    patient_id, patient, metric, n, first, last, delta, slope, ewma, trend.
+    """
+    if method not in TREND_METHODS:
+        raise ValueError(f"Unknown trend method: {method}")
+    pids = list(pids)
+    window = max(int(window), 2)
+    span = span or window
+    alpha = 2.0 / (span + 1.0)
+
+    # --- Select the last `window` rows of each patient block ---
+    rows, n = store.rows(pids, last=window)
+    group = np.repeat(np.arange(len(pids)), n)
+
+    # position of each row inside its window (0 = oldest) and group boundaries
+    first_row = np.concatenate(([0], np.cumsum(n)[:-1]))
+    last_row = first_row + n - 1
+    pos = np.arange(len(rows)) - np.repeat(first_row, n)
+    has_data = n > 0
+    safe_first = np.where(has_data, first_row, 0)
+    safe_last = np.where(has_data, last_row, 0)
+
+    # --- Shared regression terms (time in hours, centered per group) ---
+    ngroups = len(pids)
+    counts = np.maximum(n, 1).astype(np.float64)
+    t = store.time[rows].astype("int64").astype(np.float64) / 3600.0
+    t_mean = np.bincount(group, weights=t, minlength=ngroups) / counts
+    dt = t - t_mean[group]
+    sxx = np.bincount(group, weights=dt * dt, minlength=ngroups)
+    t_span = np.where(has_data, t[safe_last] - t[safe_first] if len(t) else 0.0, 0.0)
+
+    # EWMA weights: newest reading weighs most
+    age = np.repeat(n, n) - 1 - pos
+    w = (1.0 - alpha) ** age
+    w_sum = np.bincount(group, weights=w, minlength=ngroups)
+
+    names = np.array([store.name(pid) for pid in pids], dtype=object)
+    frames = []
+    for m in METRICS:
+        y = store.cols[m][rows].astype(np.float64)
+        first = np.where(has_data, y[safe_first] if len(y) else 0.0, np.nan)
+        last = np.where(has_data, y[safe_last] if len(y) else 0.0, np.nan)
+        delta = last - first
+
+        sxy = np.bincount(group, weights=dt * y, minlength=ngroups)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = np.where(sxx > 0, sxy / sxx, np.nan)
+            ewma = np.bincount(group, weights=w * y, minlength=ngroups) / w_sum
+            mean = np.bincount(group, weights=y, minlength=ngroups) / counts
+
+        score = {"slope": slope * t_span, "delta": delta, "ewma": ewma - mean}[method]
+        direction = np.where(np.abs(score) <= STABLE_TOLERANCE[m], 0, np.sign(score))
+        trend = np.where(
+            n < 2,
+            "not enough data",
+            pd.Series(np.nan_to_num(direction)).map(TREND_LABELS).to_numpy(dtype=object),
+        )
+
+        frames.append(pd.DataFrame({
+            "patient_id": pids,
+            "patient": names,
+            "metric": m,
+            "n": n,
+            "first": first,
+            "last": last,
+            "delta": delta,
+            "slope": slope,
+            "ewma": ewma,
+            "trend": trend,
+        }))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def trend_table(trends):
+    """
+    Pivots a tidy trend result into one row per patient and one trend column per metric.
+    Rows are keyed on patient_id (names need not be unique); the name is a label column.
+    """
+    ids = pd.unique(trends["patient_id"])
+    wide = trends.pivot(index="patient_id", columns="metric", values="trend")
+    wide = wide.reindex(index=ids, columns=list(METRICS))
+    wide.columns = [f"{m}_trend" for m in wide.columns]
+    names = trends.drop_duplicates("patient_id").set_index("patient_id")["patient"]
+    wide.insert(0, "patient", names.reindex(ids).to_numpy())
+    return wide.reset_index()
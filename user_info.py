@@ -1,5 +1,36 @@
 import streamlit as st  # type: ignore
 from medication_tracker import top_nav_bar
+from storage import get_storage
+from assets import get_avatars
+
+
+def _set_edit_mode(on):
+    st.session_state.edit_mode = on
+
+
+def _save_profile(email):
+    """Form submit callback: saves the profile before the page reruns in read-only mode."""
+    get_storage().update_user(
+        email,
+        first_name=st.session_state.profile_first_name,
+        last_name=st.session_state.profile_last_name,
+        age=st.session_state.profile_age,
+        gender=st.session_state.profile_gender
+    )
+    st.session_state.profile_saved = True
+    st.session_state.edit_mode = False
+
+
+def _save_avatar(email):
+    """Upload callback: stores the new avatar before the page reruns."""
+    upload = st.session_state.get("avatar_upload")
+    if upload is None:
+        return
+    try:
+        get_avatars().save(email, upload.getvalue())
+        st.session_state.avatar_error = None
+    except ValueError as exc:
+        st.session_state.avatar_error = str(exc)
 
 
 # --------------------------
@@ -24,12 +55,12 @@ def user_info_page():
 
     current_email = st.session_state.current_user
 
-    if "users" not in st.session_state or current_email not in st.session_state.users:
+    storage = get_storage()
+    user_data = storage.get_user(current_email)
+    if user_data is None:
         st.error("User data not found. Please log in again.")
         return
 
-    user_data = st.session_state.users[current_email]
-
     # --------------------------
     # PAGE TITLE
     # --------------------------
@@ -47,7 +78,13 @@ def user_info_page():
     with left_col:
         st.write("")
         st.markdown("<div class='profile-img' style='text-align:center;'>", unsafe_allow_html=True)
-        st.image("assets/js.jpg", width=300)
+        st.image(get_avatars().thumbnail(current_email), width=300)
+        st.file_uploader(
+            "Change photo", type=["png", "jpg", "jpeg", "webp"], key="avatar_upload",
+            on_change=_save_avatar, args=(current_email,)
+        )
+        if st.session_state.get("avatar_error"):
+            st.error(st.session_state.avatar_error)
 
         st.markdown("</div>", unsafe_allow_html=True)
 
@@ -64,53 +101,33 @@ def user_info_page():
 
         # Only show form if in edit mode or display read-only
         if st.session_state.edit_mode:
-            email = st.text_input(
-                "Email address",
-                value=current_email,
-                disabled=True  # Email always disabled
-            )
-
-            first_name = st.text_input(
-                "First name",
-                value=user_data.get("first_name", ""),
-                disabled=False
-            )
-
-            last_name = st.text_input(
-                "Last name",
-                value=user_data.get("last_name", ""),
-                disabled=False
-            )
-
-            age = st.text_input(
-                "Age",
-                value=user_data.get("age", ""),
-                disabled=False
-            )
-
-            gender = st.text_input(
-                "Gender",
-                value=user_data.get("gender", ""),
-                disabled=False
-            )
-
-            st.write("")
-
-            # --------------------------
-            # SAVE BUTTON (ALIGNED BOTTOM-RIGHT)
-            # --------------------------
-            col1, col2 = st.columns([3, 1])
-            with col2:
-                if st.button("Save Changes"):
-                    st.session_state.users[current_email]["first_name"] = first_name
-                    st.session_state.users[current_email]["last_name"] = last_name
-                    st.session_state.users[current_email]["age"] = age
-                    st.session_state.users[current_email]["gender"] = gender
-
-                    st.success("Profile updated successfully!")
-                    # Reset edit mode after save to display read-only
-                    st.session_state.edit_mode = False
+            # A form sends all fields in one submission instead of rerunning per field
+            with st.form("profile_form", border=False):
+                st.text_input(
+                    "Email address",
+                    value=current_email,
+                    disabled=True  # Email always disabled
+                )
+
+                st.text_input("First name", value=user_data.get("first_name", "") or "", key="profile_first_name")
+                st.text_input("Last name", value=user_data.get("last_name", "") or "", key="profile_last_name")
+                st.text_input("Age", value=str(user_data.get("age", "") or ""), key="profile_age")
+                st.text_input("Gender", value=user_data.get("gender", "") or "", key="profile_gender")
+
+                st.write("")
+
+                # --------------------------
+                # SAVE / CANCEL (ALIGNED BOTTOM-RIGHT)
+                # --------------------------
+                col1, col2, col3 = st.columns([2, 1, 1])
+                with col2:
+                    st.form_submit_button("Cancel", on_click=_set_edit_mode, args=(False,))
+                with col3:
+                    st.form_submit_button("Save Changes", on_click=_save_profile, args=(current_email,))
         else:
+            if st.session_state.pop("profile_saved", False):
+                st.success("Profile updated successfully!")
+
             # Display read-only information
             st.write(f"**Email address:** {current_email}")
             st.write(f"**First name:** {user_data.get('first_name', '')}")
@@ -125,8 +142,7 @@ def user_info_page():
             # --------------------------
             col1, col2 = st.columns([3, 1])
             with col2:
-                if st.button("Edit Profile"):
-                    st.session_state.edit_mode = True
+                st.button("Edit Profile", on_click=_set_edit_mode, args=(True,))
 
     # --------------------------
     # FOOTER NOTE
@@ -0,0 +1,397 @@
+# vitals_stats.py
+"""
+Running per-patient, per-metric statistics for the vitals store.
+
+For every patient and vital the store keeps count, mean and variance
+(Welford's update), min and max, plus a quantile sketch for approximate p50
+and p95. The sketch follows DDSketch: a value x goes into the log-spaced
+bucket ceil(log_gamma(x)), so every quantile is within a fixed relative
+error (ACCURACY) of the true value. Two sketches merge by adding their
+bucket counts.
+
+A patient's numbers are O(1) to read, and group totals merge per-patient
+state (Chan's parallel variance, summed buckets). A summary costs the same
+at 10 readings or 10 million. Sketches are stored as one CSR array of
+(bucket, count) pairs per metric. Readings appended later go into small
+per-patient deltas, which are folded into the arrays once enough of them
+accumulate. A batch of new readings is summarized per patient with numpy
+(count, mean, M2) and merged into the running state with Chan's formula.
+A `GroupStats` keeps such a merge for a group of patients (a cohort) open,
+so later batches fold into it the same way.
+"""
+import math
+import threading
+import numpy as np  # type: ignore
+
+
+# --- Statistics settings ---
+METRICS = ("hr", "bp_sys", "bp_dia", "temp")        # same order as vitals_store.METRICS
+ACCURACY = {"hr": 0.01, "bp_sys": 0.01, "bp_dia": 0.01, "temp": 0.001}   # relative quantile error
+QUANTILES = {"p50": 0.50, "p95": 0.95}
+STATISTICS = ("mean", "std", "min", "max", "p50", "p95", "count")
+COMPACT_AFTER = 10_000           # appended readings kept as deltas before folding them in
+_TINY = 1e-9                     # vitals are positive; guards log() against bad zeros
+
+
+def _gamma(metric):
+    alpha = ACCURACY[metric]
+    return (1 + alpha) / (1 - alpha)
+
+
+def _keys(values, gamma):
+    """Sketch bucket of each value."""
+    return np.ceil(np.log(np.maximum(values, _TINY)) / math.log(gamma)).astype(np.int64)
+
+
+def _value(keys, gamma):
+    """Representative value of sketch buckets (relative error <= alpha)."""
+    return 2.0 * np.power(gamma, np.asarray(keys, dtype=np.float64)) / (gamma + 1)
+
+
+def _rank(q, total):
+    """Zero-based rank of the q-quantile among `total` values (nearest rank)."""
+    return np.floor(q * (total - 1) + 0.5)
+
+
+def _quantile(keys, counts, q, gamma):
+    """q-quantile of one sketch given as sorted bucket keys and their counts."""
+    total = counts.sum()
+    if total == 0:
+        return math.nan
+    cum = np.cumsum(counts)
+    return float(_value(keys[np.searchsorted(cum, _rank(q, total), side="right")], gamma))
+
+
+def _aggregate(blocks, keys, counts):
+    """Sums counts of equal (block, key) pairs; returns them sorted by block, then key."""
+    if len(keys) == 0:
+        return blocks[:0], keys[:0], counts[:0]
+    lo = keys.min()
+    span = int(keys.max() - lo) + 1
+    code, inverse = np.unique(blocks * span + (keys - lo), return_inverse=True)
+    summed = np.bincount(inverse, weights=counts).astype(np.int64)
+    code, summed = code[summed != 0], summed[summed != 0]          # rebuilt blocks cancel old buckets
+    return code // span, code % span + lo, summed
+
+
+# --------------------------
+# GROUP STATISTICS
+# --------------------------
+class GroupStats:
+    """
+    Statistics of a group of blocks as running state: moments, extremes and a
+    summed sketch per metric. `add` folds in a batch of readings (Chan's
+    formula, added buckets); `result` gives metric -> statistic.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max", "sketch", "version")
+
+    def __init__(self, version=0):
+        self.count = 0
+        self.mean = dict.fromkeys(METRICS, 0.0)
+        self.m2 = dict.fromkeys(METRICS, 0.0)
+        self.min = dict.fromkeys(METRICS, math.inf)
+        self.max = dict.fromkeys(METRICS, -math.inf)
+        self.sketch = {m: {} for m in METRICS}      # bucket key -> count
+        self.version = version                      # VitalsStats.version the state includes
+
+    def add(self, values):
+        """Folds a batch of readings (metric -> array) into the group."""
+        nb = len(values[METRICS[0]])
+        if not nb:
+            return
+        n = self.count + nb
+        for m in METRICS:
+            x = np.asarray(values[m], dtype=np.float64)
+            mean_b = float(x.mean())
+            d = mean_b - self.mean[m]
+            self.mean[m] += d * nb / n
+            self.m2[m] += float(((x - mean_b) ** 2).sum()) + d * d * self.count * nb / n
+            self.min[m], self.max[m] = min(self.min[m], float(x.min())), max(self.max[m], float(x.max()))
+            sketch = self.sketch[m]
+            keys, counts = np.unique(_keys(x, _gamma(m)), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                sketch[key] = sketch.get(key, 0) + count
+        self.count = n
+
+    def result(self):
+        """metric -> statistic (count, mean, std, min, max, p50, p95)."""
+        n, out = self.count, {}
+        for m in METRICS:
+            if n == 0:
+                out[m] = dict.fromkeys(STATISTICS, math.nan) | {"count": 0}
+                continue
+            lo, hi = self.min[m], self.max[m]
+            keys = np.array(sorted(self.sketch[m]), dtype=np.int64)
+            counts = np.array([self.sketch[m][k] for k in keys.tolist()], dtype=np.int64)
+            out[m] = {
+                "count": n,
+                "mean": self.mean[m],
+                "std": math.sqrt(self.m2[m] / (n - 1)) if n > 1 else math.nan,
+                "min": lo,
+                "max": hi,
+            }
+            for name, q in QUANTILES.items():
+                out[m][name] = min(hi, max(lo, _quantile(keys, counts, q, _gamma(m))))
+        return out
+
+
+# --------------------------
+# RUNNING STATISTICS
+# --------------------------
+class VitalsStats:
+    """
+    Running statistics for every patient block of a VitalsStore (same block
+    positions). Built once with `build`; kept current by the store's writes.
+    """
+
+    def __init__(self, n_blocks=0):
+        self._lock = threading.Lock()
+        self.n = n_blocks
+        self.count = np.zeros(n_blocks, dtype=np.int64)
+        self.mean = {m: np.full(n_blocks, np.nan) for m in METRICS}
+        self.m2 = {m: np.zeros(n_blocks) for m in METRICS}
+        self.min = {m: np.full(n_blocks, np.nan) for m in METRICS}
+        self.max = {m: np.full(n_blocks, np.nan) for m in METRICS}
+        # sketch: CSR (offsets per block into keys / counts), plus deltas pos -> {key: count}
+        self.offsets = {m: np.zeros(n_blocks + 1, dtype=np.int64) for m in METRICS}
+        self.keys = {m: np.empty(0, dtype=np.int64) for m in METRICS}
+        self.counts = {m: np.empty(0, dtype=np.int64) for m in METRICS}
+        self.cum = {m: np.empty(0, dtype=np.int64) for m in METRICS}
+        self.delta = {m: {} for m in METRICS}
+        self._pending = 0
+        self.version = 0                 # bumped by every update
+
+    @classmethod
+    def build(cls, offsets, cols):
+        """Vectorized build from a store's CSR offsets and metric columns."""
+        stats = cls(len(offsets) - 1)
+        lengths = np.diff(offsets)
+        block = np.repeat(np.arange(stats.n), lengths)
+        starts = offsets[:-1][lengths > 0]
+        filled = lengths > 0
+        stats.count = lengths.astype(np.int64)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for m in METRICS:
+                x = cols[m].astype(np.float64)
+                mean = np.bincount(block, weights=x, minlength=stats.n).astype(np.float64) / lengths
+                stats.mean[m] = mean
+                stats.m2[m] = np.bincount(block, weights=(x - mean[block]) ** 2, minlength=stats.n).astype(np.float64)
+                if len(x):
+                    stats.min[m][filled] = np.minimum.reduceat(x, starts)
+                    stats.max[m][filled] = np.maximum.reduceat(x, starts)
+                b, k, c = _aggregate(block, _keys(x, _gamma(m)), np.ones(len(x), dtype=np.int64))
+                stats._set_sketch(m, b, k, c)
+        return stats
+
+    def _set_sketch(self, m, blocks, keys, counts):
+        self.keys[m], self.counts[m] = keys, counts
+        self.cum[m] = np.cumsum(counts)          # for vectorized per-block quantiles
+        self.offsets[m] = np.searchsorted(blocks, np.arange(self.n + 1), side="left").astype(np.int64)
+
+    # --- Updates (called by the store) ---
+    def add_block(self):
+        with self._lock:
+            self.n += 1
+            self.count = np.append(self.count, 0)
+            for m in METRICS:
+                for table, fill in ((self.mean, np.nan), (self.m2, 0.0), (self.min, np.nan), (self.max, np.nan)):
+                    table[m] = np.append(table[m], fill)
+                self.offsets[m] = np.append(self.offsets[m], self.offsets[m][-1])
+
+    def update(self, block, values, reset=None):
+        """
+        Folds new readings into their blocks' statistics (`block` holds the block
+        of every row of `values`, metric -> array) and rebuilds the blocks in
+        `reset` (pos -> metric -> all of the block's values) whose stored
+        readings were replaced.
+        """
+        block = np.asarray(block, dtype=np.int64)
+        with self._lock:
+            if len(block):
+                self._merge(block, values)
+            for pos, full in (reset or {}).items():
+                self._reset(pos, full)
+            self.version += 1
+            if self._pending >= COMPACT_AFTER:
+                self._compact()
+
+    def _merge(self, block, values):
+        """Chan merge of each block's batch moments (computed with numpy) into its running ones."""
+        blocks, inverse, nb = np.unique(block, return_inverse=True, return_counts=True)
+        na = self.count[blocks]
+        n = na + nb
+        for m in METRICS:
+            x = np.asarray(values[m], dtype=np.float64)
+            mean_b = np.bincount(inverse, weights=x) / nb
+            m2_b = np.bincount(inverse, weights=(x - mean_b[inverse]) ** 2)
+            mean_a = np.where(na > 0, self.mean[m][blocks], 0.0)
+            d = mean_b - mean_a
+            self.mean[m][blocks] = mean_a + d * nb / n
+            self.m2[m][blocks] = self.m2[m][blocks] + m2_b + d * d * na * nb / n
+            lo, hi = np.full(len(blocks), np.inf), np.full(len(blocks), -np.inf)
+            np.minimum.at(lo, inverse, x)
+            np.maximum.at(hi, inverse, x)
+            self.min[m][blocks] = np.fmin(self.min[m][blocks], lo)
+            self.max[m][blocks] = np.fmax(self.max[m][blocks], hi)
+            b, k, c = _aggregate(block, _keys(x, _gamma(m)), np.ones(len(x), dtype=np.int64))
+            for pos, key, count in zip(b.tolist(), k.tolist(), c.tolist()):
+                delta = self.delta[m].setdefault(pos, {})
+                delta[key] = delta.get(key, 0) + count
+        self.count[blocks] = n
+        self._pending += len(block)
+
+    def _reset(self, pos, values):
+        """Recomputes one block from all of its values; its sketch delta cancels the stored buckets."""
+        n = len(values[METRICS[0]])
+        self.count[pos] = n
+        for m in METRICS:
+            x = np.asarray(values[m], dtype=np.float64)
+            mean = x.mean() if n else np.nan
+            self.mean[m][pos], self.m2[m][pos] = mean, float(((x - mean) ** 2).sum()) if n else 0.0
+            self.min[m][pos], self.max[m][pos] = (x.min(), x.max()) if n else (np.nan, np.nan)
+            keys, counts = np.unique(_keys(x, _gamma(m)), return_counts=True)
+            delta = dict(zip(keys.tolist(), counts.tolist()))
+            lo, hi = self.offsets[m][pos], self.offsets[m][pos + 1]
+            for key, count in zip(self.keys[m][lo:hi].tolist(), self.counts[m][lo:hi].tolist()):
+                delta[key] = delta.get(key, 0) - count
+            delta = {k: c for k, c in delta.items() if c}
+            if delta:
+                self.delta[m][pos] = delta
+            else:
+                self.delta[m].pop(pos, None)
+        self._pending += n
+
+    def _compact(self):
+        """Folds every delta into the CSR sketch arrays."""
+        for m in METRICS:
+            if not self.delta[m]:
+                continue
+            base_blocks = np.repeat(np.arange(self.n), np.diff(self.offsets[m]))
+            pairs = [(pos, k, c) for pos, d in self.delta[m].items() for k, c in d.items()]
+            extra = np.array(pairs, dtype=np.int64).reshape(-1, 3)
+            b, k, c = _aggregate(
+                np.concatenate([base_blocks, extra[:, 0]]),
+                np.concatenate([self.keys[m], extra[:, 1]]),
+                np.concatenate([self.counts[m], extra[:, 2]]),
+            )
+            self._set_sketch(m, b, k, c)
+            self.delta[m] = {}
+        self._pending = 0
+
+    # --- Queries ---
+    def _sketch(self, m, pos):
+        """One block's sketch as (sorted keys, counts), including its delta."""
+        lo, hi = self.offsets[m][pos], self.offsets[m][pos + 1]
+        keys, counts = self.keys[m][lo:hi], self.counts[m][lo:hi]
+        delta = self.delta[m].get(pos)
+        if delta:
+            merged = dict(zip(keys.tolist(), counts.tolist()))
+            for k, c in delta.items():
+                merged[k] = merged.get(k, 0) + c
+            keys = np.array(sorted(k for k, c in merged.items() if c), dtype=np.int64)
+            counts = np.array([merged[k] for k in keys.tolist()], dtype=np.int64)
+        return keys, counts
+
+    def _merged_sketch(self, m, blocks):
+        """Sum of the blocks' sketches: their CSR ranges gathered in one pass, plus any deltas."""
+        starts, ends = self.offsets[m][blocks], self.offsets[m][blocks + 1]
+        lengths = ends - starts
+        shift = starts - np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        idx = np.repeat(shift, lengths) + np.arange(lengths.sum(), dtype=np.int64)
+        keys, counts = [self.keys[m][idx]], [self.counts[m][idx]]
+        for pos in blocks.tolist():
+            delta = self.delta[m].get(pos)
+            if delta:
+                keys.append(np.fromiter(delta.keys(), dtype=np.int64, count=len(delta)))
+                counts.append(np.fromiter(delta.values(), dtype=np.int64, count=len(delta)))
+        keys, counts = np.concatenate(keys), np.concatenate(counts)
+        _, keys, counts = _aggregate(np.zeros(len(keys), dtype=np.int64), keys, counts)
+        return keys, counts
+
+    def _quantiles(self, m, blocks, q):
+        """q-quantile of each block: vectorized over the CSR arrays, per block only for deltas."""
+        gamma = _gamma(m)
+        out = np.full(len(blocks), np.nan)
+        starts, ends = self.offsets[m][blocks], self.offsets[m][blocks + 1]
+        totals = self.count[blocks]
+        fast = (ends > starts) & np.array([pos not in self.delta[m] for pos in blocks.tolist()], dtype=bool)
+        if fast.any():
+            cum = self.cum[m]
+            before = np.where(starts[fast] > 0, cum[np.maximum(starts[fast] - 1, 0)], 0)
+            idx = np.searchsorted(cum, before + _rank(q, totals[fast]), side="right")
+            out[fast] = _value(self.keys[m][idx], gamma)
+        for i in np.flatnonzero(~fast & (totals > 0)).tolist():
+            out[i] = _quantile(*self._sketch(m, int(blocks[i])), q, gamma)
+        # buckets are approximate; the exact extremes bound them
+        return np.clip(out, self.min[m][blocks], self.max[m][blocks])
+
+    def table(self, blocks):
+        """metric -> statistic -> array over `blocks` (count, mean, std, min, max, p50, p95)."""
+        blocks = np.asarray(blocks, dtype=np.int64)
+        with self._lock:
+            counts = self.count[blocks]
+            out = {}
+            for m in METRICS:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    std = np.sqrt(self.m2[m][blocks] / (counts - 1))
+                out[m] = {
+                    "count": counts,
+                    "mean": self.mean[m][blocks],
+                    "std": np.where(counts > 1, std, np.nan),
+                    "min": self.min[m][blocks],
+                    "max": self.max[m][blocks],
+                }
+                for name, q in QUANTILES.items():
+                    out[m][name] = self._quantiles(m, blocks, q)
+        return out
+
+    def group(self, blocks):
+        """All `blocks` together as a GroupStats (Chan merge of the running moments, summed sketches)."""
+        blocks = np.asarray(blocks, dtype=np.int64)
+        with self._lock:
+            out = GroupStats(self.version)
+            counts = self.count[blocks]
+            n = int(counts.sum())
+            filled = counts > 0
+            if n == 0:
+                return out
+            out.count = n
+            weights = counts[filled]
+            for m in METRICS:
+                means, m2s = self.mean[m][blocks][filled], self.m2[m][blocks][filled]
+                out.mean[m] = mean = float((means * weights).sum() / n)
+                out.m2[m] = float(m2s.sum() + (weights * (means - mean) ** 2).sum())
+                out.min[m] = float(np.min(self.min[m][blocks][filled]))
+                out.max[m] = float(np.max(self.max[m][blocks][filled]))
+                keys, summed = self._merged_sketch(m, blocks[filled])
+                out.sketch[m] = dict(zip(keys.tolist(), summed.tolist()))
+        return out
+
+    def merged(self, blocks):
+        """metric -> statistic for all `blocks` together."""
+        return self.group(blocks).result()
+
+
+# --------------------------
+# SUMMARY TABLES
+# --------------------------
+def stats_frame(store, pids, stat="mean", total_label="All selected"):
+    """
+    One statistic of every vital per patient, plus a group row merged across
+    them. Costs O(patients), whatever the number of readings.
+    """
+    import pandas as pd  # type: ignore
+    stats = store.statistics()
+    blocks = store.positions(pids)
+    table, total = stats.table(blocks), stats.merged(blocks)
+    df = pd.DataFrame({"patient": [store.name(pid) for pid in pids] + [total_label]}
+                      | {m: np.append(table[m][stat], total[m][stat]) for m in METRICS})
+    return df if stat == "count" else df.round(2)
+
+
+def stats_columns(store, pids):
+    """Every statistic of every vital per patient, as '<metric>_<stat>' columns (for exports)."""
+    stats = store.statistics()
+    table = stats.table(store.positions(pids))
+    return {f"{m}_{s}": table[m][s] for m in METRICS for s in STATISTICS}
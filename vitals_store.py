@@ -0,0 +1,441 @@
+# vitals_store.py
+import copy
+import uuid
+import threading
+from collections import namedtuple
+import numpy as np  # type: ignore
+
+
+# --- Column layout ---
+METRICS = ("hr", "bp_sys", "bp_dia", "temp")
+METRIC_DTYPES = {
+    "hr": np.int16,
+    "bp_sys": np.int16,
+    "bp_dia": np.int16,
+    "temp": np.float64,
+}
+TIME_DTYPE = "datetime64[s]"
+SLACK_MIN = 8                    # spare rows reserved after each patient block for appends
+SLACK_FRACTION = 4               # ... or 1/SLACK_FRACTION of the block's rows, if more
+
+
+def to_datetime64(values):
+    """Converts 'YYYY-MM-DD HH:MM' strings (or datetimes) into a datetime64 array."""
+    return np.asarray(values, dtype=TIME_DTYPE)
+
+
+def _capacity(lengths):
+    """Rows reserved for blocks of the given lengths (the rows plus slack for appends)."""
+    return lengths + np.maximum(SLACK_MIN, lengths // SLACK_FRACTION)
+
+
+# One published version of the store's rows; never modified after publication.
+# ids: patient ids in block order, names: aligned to ids, pos: id -> block position,
+# starts / ends / limits: block i holds rows starts[i]:ends[i] and may grow in place up to limits[i],
+# top: first row not reserved by any block
+_State = namedtuple("_State", "ids names pos starts ends limits time cols top version")
+
+
+# --------------------------
+# BLOCK WRITER
+# --------------------------
+class _Writer:
+    """One write's working copy of the block layout; `publish` turns it into the next state."""
+
+    def __init__(self, state):
+        self.state = state
+        self.starts, self.ends, self.limits = state.starts.copy(), state.ends.copy(), state.limits.copy()
+        self.time, self.cols, self.top = state.time, state.cols, state.top
+        self.rows = 0                # rows added or changed
+
+    def append(self, block, time, values, blocks, firsts, counts):
+        """
+        Writes, in one vectorized pass, every block's rows that all follow its
+        newest reading and fit its spare room (the live-feed case). Returns
+        whether each block was done and a mask of the rows written.
+        """
+        ends = self.ends[blocks]
+        done = np.zeros(len(blocks), dtype=bool)
+        if len(self.time):
+            newest = self.time[np.maximum(ends - 1, 0)]
+            done = ((ends == self.starts[blocks]) | (time[firsts] > newest)) & (ends + counts <= self.limits[blocks])
+        rows = np.repeat(done, counts)
+        if rows.any():
+            rank = np.arange(len(time), dtype=np.int64) - np.repeat(firsts, counts)
+            dest = np.repeat(ends, counts)[rows] + rank[rows]
+            self.time[dest] = time[rows]
+            for m in METRICS:
+                self.cols[m][dest] = values[m][rows]
+            self.ends[blocks[done]] += counts[done]
+            self.rows += int(rows.sum())
+        return done, rows
+
+    def upsert(self, b, time, values):
+        """
+        Writes one block's new rows (sorted by time, unique). Returns the indices
+        of the rows that were added, and the block's full values if stored rows
+        changed (None otherwise).
+        """
+        s, e = int(self.starts[b]), int(self.ends[b])
+        stored = self.time[s:e]
+        at = np.searchsorted(stored, time)
+        match = at < e - s
+        match[match] = stored[at[match]] == time[match]
+        changed = np.zeros(len(time), dtype=bool)
+        if match.any():
+            differs = np.zeros(int(match.sum()), dtype=bool)
+            for m in METRICS:
+                differs |= self.cols[m][s + at[match]] != values[m][match]
+            changed[match] = differs
+        new = np.flatnonzero(~match)
+        self.rows += len(new) + int(changed.sum())
+
+        if not changed.any():
+            if not len(new):
+                return new, None
+            if (e == s or time[new[0]] > stored[-1]) and e + len(new) <= self.limits[b]:
+                # newest readings go into the block's spare room, past every published end
+                self._write(e, time[new], {m: values[m][new] for m in METRICS})
+                self.ends[b] = e + len(new)
+                return new, None
+
+        # anything else copies the block, with its changes, to fresh room
+        merged = {}
+        for m in METRICS:
+            column = self.cols[m][s:e].copy()
+            column[at[changed]] = values[m][changed]
+            merged[m] = np.insert(column, at[new], values[m][new])
+        merged_time = np.insert(stored, at[new], time[new])
+        n = len(merged_time)
+        start = self._reserve(int(_capacity(np.int64(n))))
+        self._write(start, merged_time, merged)
+        self.starts[b], self.ends[b], self.limits[b] = start, start + n, start + _capacity(np.int64(n))
+        return new, merged if changed.any() else None
+
+    def _write(self, at, time, values):
+        self.time[at:at + len(time)] = time
+        for m in METRICS:
+            self.cols[m][at:at + len(time)] = values[m]
+
+    def _reserve(self, rows):
+        """First row of `rows` free rows at the top, repacking into larger arrays when full."""
+        if self.top + rows > len(self.time):
+            self._pack(rows)
+        start = self.top
+        self.top += rows
+        return start
+
+    def _pack(self, extra):
+        """Copies the live blocks, each followed by fresh spare room, into arrays twice the needed size."""
+        lengths = self.ends - self.starts
+        caps = _capacity(lengths)
+        limits = np.cumsum(caps)
+        starts = limits - caps
+        top = int(limits[-1]) if len(limits) else 0
+        size = 2 * (top + extra)
+        src = np.repeat(self.starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) \
+            + np.arange(int(lengths.sum()), dtype=np.int64)
+        dest = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) \
+            + np.arange(int(lengths.sum()), dtype=np.int64)
+        time = np.zeros(size, dtype=TIME_DTYPE)
+        time[dest] = self.time[src]
+        cols = {}
+        for m, dt in METRIC_DTYPES.items():
+            cols[m] = np.zeros(size, dtype=dt)
+            cols[m][dest] = self.cols[m][src]
+        self.time, self.cols, self.top = time, cols, top
+        self.starts, self.ends, self.limits = starts, starts + lengths, limits
+
+    def publish(self, version):
+        return self.state._replace(starts=self.starts, ends=self.ends, limits=self.limits, time=self.time,
+                                   cols=self.cols, top=self.top, version=version)
+
+
+# --------------------------
+# VITALS STORE
+# --------------------------
+class VitalsStore:
+    """
+    Columnar store for vital readings.
+
+    Rows are grouped per patient and kept sorted by time inside each group,
+    so a patient's readings are one contiguous block: rows starts[i]:ends[i]
+    belong to the i-th patient. Each block is followed by a little spare
+    room, so appending a patient's newest readings writes into that room
+    without copying anything else.
+
+    Per-patient slices are numpy views (zero-copy). `version` is bumped on
+    every write so callers can tell when derived results are stale; `token`
+    identifies the data set, so (token, version) names one exact state.
+
+    Rows visible in a published state are never overwritten. A write that
+    cannot append in place (a reading older than the block's newest, or one
+    replacing a stored value) copies only that block to free room at the top
+    of the arrays. When the arrays are full they are reallocated and the live
+    blocks packed again, which also drops the rooms left behind. Writers
+    publish the new state in one swap of `_state`, so a reader never sees half
+    a write. A reader that combines several reads (row indices, then columns)
+    takes a `snapshot()` first.
+    """
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex
+        self.stats = None              # VitalsStats, once built by statistics()
+        self._lock = threading.Lock()  # serializes writers; readers never take it
+        self._listeners = []           # called after every write; see subscribe()
+        empty = np.zeros(0, dtype=np.int64)
+        self._state = _State([], [], {}, empty, empty, empty, np.empty(0, dtype=TIME_DTYPE),
+                             {m: np.empty(0, dtype=dt) for m, dt in METRIC_DTYPES.items()}, 0, 0)
+
+    ids = property(lambda self: self._state.ids)
+    names = property(lambda self: self._state.names)
+    _pos = property(lambda self: self._state.pos)
+    starts = property(lambda self: self._state.starts)
+    ends = property(lambda self: self._state.ends)
+    time = property(lambda self: self._state.time)
+    cols = property(lambda self: self._state.cols)
+    version = property(lambda self: self._state.version)
+
+    def snapshot(self):
+        """A read-only view of the store as it is now; later writes do not change it."""
+        view = copy.copy(self)
+        view._lock = None
+        return view
+
+    def subscribe(self, listener):
+        """
+        Registers `listener(block, values, reset)`, run under the writer lock after
+        each write: the block and values (metric -> array) of the rows added, and
+        the blocks whose stored readings were replaced.
+        """
+        self._listeners.append(listener)
+
+    # --- Construction ---
+    @classmethod
+    def from_columns(cls, ids, names, block, time, cols):
+        """
+        Builds a store from flat column arrays.
+        `block` holds, for every row, the position of its patient in `ids`;
+        rows may come in any order.
+        """
+        store = cls()
+        ids = list(ids)
+        block = np.asarray(block, dtype=np.int64)
+        time = to_datetime64(time)
+        order = np.lexsort((time, block))          # rows sorted by (patient block, time)
+        lengths = np.bincount(block, minlength=len(ids)).astype(np.int64)
+        limits = np.cumsum(_capacity(lengths))
+        starts = limits - _capacity(lengths)
+        top = int(limits[-1]) if len(ids) else 0
+        # sorted row j of block b goes to starts[b] + (its rank inside the block)
+        dest = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) \
+            + np.arange(len(block), dtype=np.int64)
+        out_time = np.empty(top, dtype=TIME_DTYPE)
+        out_time[dest] = time[order]
+        out_cols = {}
+        for m, dt in METRIC_DTYPES.items():
+            out_cols[m] = np.zeros(top, dtype=dt)
+            out_cols[m][dest] = np.asarray(cols[m], dtype=dt)[order]
+        store._state = _State(ids, list(names), {pid: i for i, pid in enumerate(ids)},
+                              starts, starts + lengths, limits, out_time, out_cols, top, 1)
+        return store
+
+    # --- Writes ---
+    def _grow(self, state, pids, names=None):
+        """Blocks for unknown `pids` (copied lists, so published states stay intact)."""
+        new = [pid for pid in dict.fromkeys(pids) if pid not in state.pos]
+        if not new:
+            return state
+        names = names or {}
+        if self.stats is not None:
+            for _ in new:
+                self.stats.add_block()
+        empty = np.zeros(len(new), dtype=np.int64)      # no room yet: the first write allocates it
+        return state._replace(
+            ids=state.ids + new,
+            names=state.names + [names.get(pid, pid) for pid in new],
+            pos={**state.pos, **{pid: len(state.ids) + i for i, pid in enumerate(new)}},
+            starts=np.concatenate((state.starts, empty)),
+            ends=np.concatenate((state.ends, empty)),
+            limits=np.concatenate((state.limits, empty)),
+        )
+
+    def add_patient(self, pid, name):
+        """Registers a patient with no readings yet."""
+        with self._lock:
+            if pid in self._state.pos:
+                return
+            state = self._grow(self._state, [pid], {pid: name})
+            self._state = state._replace(version=state.version + 1)
+
+    def append(self, pid, reading):
+        """Upserts one reading dict for `pid`, keeping its block time-sorted."""
+        self.extend(pid, [reading])
+
+    def extend(self, pid, readings):
+        """Upserts a batch of reading dicts for one patient."""
+        if readings:
+            self.add_rows([pid] * len(readings), [r["time"] for r in readings],
+                          {m: [r[m] for r in readings] for m in METRICS})
+
+    def add_rows(self, pids, time, cols):
+        """
+        Upserts readings for any number of patients (unknown ids get a block named
+        after the id) and publishes them in one swap. As in Storage, a reading
+        whose (patient, time) is already stored replaces the stored values, and
+        that patient's statistics are rebuilt from its rows. Rows equal to the
+        stored ones change nothing. Returns the number of rows added or changed.
+        """
+        time = to_datetime64(time)
+        if not len(time):
+            return 0
+        with self._lock:
+            state = self._grow(self._state, pids)
+            block = np.fromiter((state.pos[pid] for pid in pids), dtype=np.int64, count=len(time))
+            values = {m: np.asarray(cols[m], dtype=dt) for m, dt in METRIC_DTYPES.items()}
+
+            # sort by (block, time); the last copy of a (block, time) in the batch wins
+            order = np.lexsort((time, block))
+            block, time = block[order], time[order]
+            last = np.append((block[1:] != block[:-1]) | (time[1:] != time[:-1]), True)
+            block, time = block[last], time[last]
+            values = {m: values[m][order[last]] for m in METRICS}
+
+            w = _Writer(state)
+            blocks, firsts, counts = np.unique(block, return_index=True, return_counts=True)
+            done, appended = w.append(block, time, values, blocks, firsts, counts)
+            fresh, reset = [np.flatnonzero(appended)], {}
+            for b, lo, n in zip(blocks[~done].tolist(), firsts[~done].tolist(), counts[~done].tolist()):
+                hi = lo + n
+                added, rebuilt = w.upsert(b, time[lo:hi], {m: values[m][lo:hi] for m in METRICS})
+                if rebuilt is not None:
+                    reset[b] = rebuilt
+                elif len(added):
+                    fresh.append(lo + added)
+            fresh = np.concatenate(fresh)
+            if not len(fresh) and not reset:
+                return 0
+
+            fresh_values = {m: values[m][fresh] for m in METRICS}
+            if self.stats is not None:
+                self.stats.update(block[fresh], fresh_values, reset)
+            self._state = w.publish(state.version + 1)
+            for listener in self._listeners:
+                listener(block[fresh], fresh_values, set(reset))
+            return w.rows
+
+    def statistics(self):
+        """Running per-patient statistics (built on first use, then updated by every write)."""
+        if self.stats is None:
+            with self._lock:
+                if self.stats is None:
+                    from vitals_stats import VitalsStats
+                    view = self.snapshot()
+                    rows, lengths = view.rows(view.ids)
+                    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+                    self.stats = VitalsStats.build(offsets, {m: view.cols[m][rows] for m in METRICS})
+        return self.stats
+
+    # --- Reads (each reads one published state) ---
+    def __len__(self):
+        state = self._state
+        return int((state.ends - state.starts).sum())
+
+    def __contains__(self, pid):
+        return pid in self._state.pos
+
+    def count(self, pid):
+        """Number of readings stored for a patient."""
+        state = self._state
+        i = state.pos.get(pid)
+        if i is None:
+            return 0
+        return int(state.ends[i] - state.starts[i])
+
+    def bounds(self, pid):
+        """Row range [start, end) for a patient's block."""
+        state = self._state
+        i = state.pos[pid]
+        return int(state.starts[i]), int(state.ends[i])
+
+    def slice(self, pid):
+        """Returns a patient's columns as numpy views, oldest reading first."""
+        return self.latest(pid, n=None)
+
+    def latest(self, pid, n=1):
+        """Returns views over a patient's `n` most recent readings (oldest first)."""
+        state = self._state
+        i = state.pos[pid]
+        start, end = int(state.starts[i]), int(state.ends[i])
+        if n is not None:
+            start = max(start, end - n)
+        out = {"time": state.time[start:end]}
+        for m in METRICS:
+            out[m] = state.cols[m][start:end]
+        return out
+
+    def time_bounds(self, pids):
+        """(earliest, latest) reading time over the given patients as datetimes, or None.
+        Blocks are time-sorted, so only each block's first and last row is read."""
+        state = self._state
+        blocks = np.array([state.pos[pid] for pid in pids], dtype=np.int64)
+        starts, ends = state.starts[blocks], state.ends[blocks]
+        nonempty = ends > starts
+        if not nonempty.any():
+            return None
+        first = state.time[starts[nonempty]].min()
+        last = state.time[ends[nonempty] - 1].max()
+        return first.item(), last.item()
+
+    def positions(self, pids):
+        """Block positions of the given patients, as an index array."""
+        pos = self._state.pos
+        return np.array([pos[pid] for pid in pids], dtype=np.int64)
+
+    def rows(self, pids, last=None):
+        """
+        Row indices for the given patients (in the order given) and the row count of each.
+        With `last`, only each patient's `last` most recent rows are selected.
+        The indices are only valid for the state they were taken from: read the
+        columns from the same `snapshot()`.
+        """
+        state = self._state
+        blocks = np.array([state.pos[pid] for pid in pids], dtype=np.int64)
+        starts, ends = state.starts[blocks], state.ends[blocks]
+        if last is not None:
+            starts = np.maximum(starts, ends - last)
+        lengths = ends - starts
+        # vectorized concatenation of the ranges start..end for every block
+        shift = starts - np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        idx = np.repeat(shift, lengths) + np.arange(lengths.sum(), dtype=np.int64)
+        return idx, lengths
+
+    def name(self, pid):
+        """Display name of a patient."""
+        state = self._state
+        return state.names[state.pos[pid]]
+
+    def frame(self, pids):
+        """
+        Returns a DataFrame (patient_id, patient, time, hr, bp_sys, bp_dia, temp) for the
+        given patients; `patient` is the display name, which need not be unique.
+        A single patient's frame wraps the block views; several patients are gathered in one pass.
+        """
+        import pandas as pd  # type: ignore  # storage imports this module on the login path
+        view = self.snapshot()
+        pids = list(pids)
+        if len(pids) == 1:
+            start, end = view.bounds(pids[0])
+            sel = slice(start, end)
+            ids = np.full(end - start, pids[0], dtype=object)
+            patient = np.full(end - start, view.name(pids[0]), dtype=object)
+        else:
+            sel, lengths = view.rows(pids)
+            ids = np.repeat(np.array(pids, dtype=object), lengths)
+            names = np.array([view.name(pid) for pid in pids], dtype=object)
+            patient = np.repeat(names, lengths)
+
+        data = {"patient_id": ids, "patient": patient, "time": view.time[sel]}
+        for m in METRICS:
+            data[m] = view.cols[m][sel]
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,129 @@
+# vitals_table.py
+import math
+import numpy as np  # type: ignore
+import pandas as pd  # type: ignore
+import streamlit as st  # type: ignore
+from vitals_store import METRICS
+
+
+# --- Table settings ---
+SORT_COLUMNS = ("time", "patient") + METRICS
+PAGE_SIZES = (25, 50, 100, 250)
+
+
+# --------------------------
+# SORTED ROW INDEX
+# --------------------------
+def sorted_rows(store, pids, sort_by="time", ascending=False, patients=None, start=None, end=None):
+    """
+    Returns (rows, owner): store row indices for the selected patients, filtered by
+    patient subset and time range, in display order; `owner` holds each row's
+    position in `pids`. Only integer index arrays are built, no row objects.
+    """
+    rows, lengths = store.rows(pids)
+    owner = np.repeat(np.arange(len(pids)), lengths)
+
+    mask = np.ones(len(rows), dtype=bool)
+    if patients is not None:
+        keep = np.isin(np.asarray(pids, dtype=object), list(patients))
+        mask &= keep[owner]
+    if start is not None:
+        mask &= store.time[rows] >= np.datetime64(start, "s")
+    if end is not None:
+        mask &= store.time[rows] <= np.datetime64(end, "s")
+    rows, owner = rows[mask], owner[mask]
+
+    if sort_by == "patient":
+        names = np.array([store.name(pid) for pid in pids], dtype=object)
+        key = names[owner]
+    elif sort_by == "time":
+        key = store.time[rows]
+    else:
+        key = store.cols[sort_by][rows]
+    order = np.argsort(key, kind="stable")
+    if not ascending:
+        order = order[::-1]
+    return rows[order], owner[order]
+
+
+def materialize(store, pids, rows, owner, offset, limit):
+    """Builds a DataFrame for just rows[offset:offset + limit]."""
+    page_rows, page_owner = rows[offset:offset + limit], owner[offset:offset + limit]
+    names = np.array([store.name(pid) for pid in pids], dtype=object)
+    data = {"patient": names[page_owner], "time": store.time[page_rows]}
+    for m in METRICS:
+        data[m] = store.cols[m][page_rows]
+    return pd.DataFrame(data, index=pd.RangeIndex(offset, offset + len(page_rows)))
+
+
+# --------------------------
+# PAGED TABLE COMPONENT
+# --------------------------
+def _set_page(page_key, page):
+    st.session_state[page_key] = page
+
+
+def vitals_table(store, pids, key, cache=None, data_key=()):
+    """
+    Server-side sorted, filtered and paginated vitals table.
+    The sorted row index is cached per (data, sort, filter); each rerun only
+    materializes the visible page, so payload depends on page size, not history length.
+    """
+    page_key = f"{key}_page"
+    if page_key not in st.session_state:
+        st.session_state[page_key] = 1
+    reset = {"on_change": _set_page, "args": (page_key, 1)}
+
+    c1, c2, c3, c4 = st.columns([2, 1, 3, 1])
+    with c1:
+        sort_by = st.selectbox("Sort by", SORT_COLUMNS, key=f"{key}_sort", **reset)
+    with c2:
+        ascending = st.toggle("Ascending", value=False, key=f"{key}_asc", **reset)
+    with c3:
+        patients = st.multiselect(
+            "Filter patients", pids, format_func=store.name, key=f"{key}_filter", **reset
+        )
+    with c4:
+        page_size = st.selectbox("Rows", PAGE_SIZES, key=f"{key}_size", **reset)
+
+    start = end = None
+    bounds = store.time_bounds(pids)
+    if bounds is not None and bounds[0] < bounds[1]:
+        start, end = st.slider(
+            "Time range", min_value=bounds[0], max_value=bounds[1],
+            value=bounds, format="YYYY-MM-DD HH:mm",
+            # bounds are part of the key, so new data never leaves the slider out of range
+            key=f"{key}_range_{bounds[0]:%Y%m%d%H%M}_{bounds[1]:%Y%m%d%H%M}", **reset
+        )
+
+    def build():
+        return sorted_rows(
+            store, pids, sort_by, ascending,
+            patients=patients or None, start=start, end=end
+        )
+
+    if cache is not None:
+        rows, owner = cache.get_or_compute(
+            ("vitals_table", sort_by, ascending, tuple(patients), start, end) + tuple(data_key),
+            build
+        )
+    else:
+        rows, owner = build()
+
+    total = len(rows)
+    pages = max(1, math.ceil(total / page_size))
+    page = min(st.session_state[page_key], pages)
+    offset = (page - 1) * page_size
+
+    st.dataframe(materialize(store, pids, rows, owner, offset, page_size), use_container_width=True)
+
+    n1, n2, n3 = st.columns([1, 4, 1])
+    with n1:
+        st.button("◀ Prev", key=f"{key}_prev", disabled=page <= 1,
+                  on_click=_set_page, args=(page_key, page - 1))
+    with n2:
+        shown = f"{offset + 1}–{min(offset + page_size, total)}" if total else "0"
+        st.caption(f"Rows {shown} of {total} · page {page} of {pages}")
+    with n3:
+        st.button("Next ▶", key=f"{key}_next", disabled=page >= pages,
+                  on_click=_set_page, args=(page_key, page + 1))